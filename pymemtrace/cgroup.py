@@ -0,0 +1,125 @@
+"""
+Reads cgroup v2 memory accounting for a process.
+
+In a container it is the cgroup memory limit that gets a process OOM killed, not its RSS.
+The cgroup charges anonymous memory, page cache, kernel memory and so on to all the processes in the group.
+This reads:
+
+- ``memory.current`` the total memory charged to the cgroup.
+- ``memory.max`` the limit, -1 if there is no limit.
+- Some of the values in ``memory.stat``, see :py:data:`MEMORY_STAT_KEYS`.
+- The counters in ``memory.events``, see :py:data:`MEMORY_EVENTS_KEYS`, these are prefixed with ``'events_'``.
+
+This is only available on Linux with a cgroup v2 hierarchy with the memory controller enabled.
+"""
+import os
+import typing
+
+#: Where the cgroup v2 hierarchy is usually mounted.
+CGROUP_ROOT = '/sys/fs/cgroup'
+#: Where the proc file system is usually mounted.
+PROC_ROOT = '/proc'
+#: Values sampled from ``memory.stat``.
+MEMORY_STAT_KEYS = ('anon', 'file', 'kernel', 'slab')
+#: Counters sampled from ``memory.events``.
+MEMORY_EVENTS_KEYS = ('low', 'high', 'max', 'oom', 'oom_kill')
+#: Maximum number of bytes to read from a cgroup file, ``memory.stat`` is typically around 1500 bytes.
+CGROUP_READ_SIZE = 8192
+
+
+def cgroup_path_of_pid(pid: typing.Union[int, str] = 'self',
+                       proc_root: str = PROC_ROOT, cgroup_root: str = CGROUP_ROOT) -> typing.Optional[str]:
+    """Returns the cgroup v2 directory of the process or None if it is not in a cgroup v2 hierarchy with the memory
+    controller enabled."""
+    try:
+        with open(os.path.join(proc_root, str(pid), 'cgroup')) as file:
+            for line in file:
+                # cgroup v2 is the line with hierarchy ID 0 and no controllers: "0::/path"
+                if line.startswith('0::'):
+                    path = os.path.join(cgroup_root, line[3:].strip().lstrip('/'))
+                    if os.path.exists(os.path.join(path, 'memory.current')):
+                        return os.path.normpath(path)
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        pass
+    return None
+
+
+def parse_flat_keyed(content: bytes) -> typing.Dict[str, int]:
+    """Parses a cgroup flat keyed file such as ``memory.stat`` or ``memory.events`` into ``{key : value, ...}``."""
+    ret = {}
+    for line in content.splitlines():
+        fields = line.split()
+        if len(fields) == 2:
+            ret[fields[0].decode('ascii')] = int(fields[1])
+    return ret
+
+
+def parse_single_value(content: bytes) -> int:
+    """Parses a cgroup single value file such as ``memory.current`` or ``memory.max``. 'max' is returned as -1."""
+    value = content.strip()
+    if value == b'max':
+        return -1
+    return int(value)
+
+
+class CGroupMemoryReader:
+    """Keeps the cgroup v2 memory files open and reads them with ``os.pread()``.
+    Use as a context manager or call :py:meth:`close`.
+    May raise a FileNotFoundError if path is not a cgroup v2 directory with the memory controller enabled."""
+    FILES = ('memory.current', 'memory.max', 'memory.stat', 'memory.events')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fds: typing.Dict[str, int] = {}
+        try:
+            for name in self.FILES:
+                file_path = os.path.join(path, name)
+                # The root cgroup has no memory.max
+                if name == 'memory.max' and not os.path.exists(file_path):
+                    continue
+                self._fds[name] = os.open(file_path, os.O_RDONLY)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """Close the open files."""
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        self.close()
+
+    def _pread(self, name: str) -> bytes:
+        return os.pread(self._fds[name], CGROUP_READ_SIZE, 0)
+
+    def read(self) -> typing.Dict[str, int]:
+        """Returns a dict of the current values in bytes or counts.
+        The keys are 'current', 'max', those in :py:data:`MEMORY_STAT_KEYS` that the kernel provides and those in
+        :py:data:`MEMORY_EVENTS_KEYS` prefixed with ``'events_'``."""
+        ret = {
+            'current': parse_single_value(self._pread('memory.current')),
+            'max': parse_single_value(self._pread('memory.max')) if 'memory.max' in self._fds else -1,
+        }
+        stat = parse_flat_keyed(self._pread('memory.stat'))
+        for key in MEMORY_STAT_KEYS:
+            if key in stat:
+                ret[key] = stat[key]
+        events = parse_flat_keyed(self._pread('memory.events'))
+        for key in MEMORY_EVENTS_KEYS:
+            ret[f'events_{key}'] = events.get(key, 0)
+        return ret
+
+
+def read_cgroup_memory(path: str) -> typing.Dict[str, int]:
+    """Returns :py:meth:`CGroupMemoryReader.read` for the cgroup v2 directory."""
+    with CGroupMemoryReader(path) as reader:
+        return reader.read()
@@ -37,18 +37,27 @@ This calls::
 
 Note that only dict, float, frame, list, tuple are reported.
 """
+import array
 import io
+import logging
 import re
 import sys
+import threading
+import time
 import typing
 
 from pymemtrace import redirect_stdout
+from pymemtrace.util import gnuplot
+
+logger = logging.getLogger(__file__)
 
 
 def get_debugmallocstats() -> bytes:
-    """Invokes sys._debugmallocstats and captures the output as bytes."""
+    """Invokes sys._debugmallocstats and captures the output as bytes.
+    This uses :py:func:`pymemtrace.redirect_stdout.stderr_capture` so no file is written to disk and sys.stderr is not
+    replaced."""
     stream = io.BytesIO()
-    with redirect_stdout.stderr_redirector(stream):
+    with redirect_stdout.stderr_capture(stream):
         sys._debugmallocstats()
     return stream.getvalue()
     # return stream.getvalue().decode('ascii', 'replace')
@@ -267,6 +276,17 @@ class DebugMallocArenas:
         if not all(hasattr(self, name) for name in expected_attrs):
             raise ValueError(f'Can not find required attributes {expected_attrs}')
 
+    @classmethod
+    def from_values(cls, ntimes_arena_allocated: int, narenas_highwater: int, narenas: int,
+                    arena_size: int) -> 'DebugMallocArenas':
+        """Create from values that have already been parsed, see :py:func:`parse_debugmallocstats`."""
+        ret = cls.__new__(cls)
+        ret.ntimes_arena_allocated = ntimes_arena_allocated
+        ret.narenas_highwater = narenas_highwater
+        ret.narenas = narenas
+        ret.arena_size = arena_size
+        return ret
+
     @property
     def arenas_reclaimed(self) -> int:
         return self.ntimes_arena_allocated - self.narenas
@@ -358,6 +378,20 @@ class DebugMallocPoolsBlocks:
         if not all(hasattr(self, name) for name in expected_attrs):
             raise ValueError(f'Can not find required attributes {expected_attrs}')
 
+    @classmethod
+    def from_values(cls, allocated_bytes: int, available_bytes: int, pool_header_bytes: int, quantization: int,
+                    arena_alignment: int, numfreepools: int, pool_size: int) -> 'DebugMallocPoolsBlocks':
+        """Create from values that have already been parsed, see :py:func:`parse_debugmallocstats`."""
+        ret = cls.__new__(cls)
+        ret.allocated_bytes = allocated_bytes
+        ret.available_bytes = available_bytes
+        ret.pool_header_bytes = pool_header_bytes
+        ret.quantization = quantization
+        ret.arena_alignment = arena_alignment
+        ret.numfreepools = numfreepools
+        ret.pool_size = pool_size
+        return ret
+
     @property
     def unused_pool_total(self) -> int:
         return self.numfreepools * self.pool_size
@@ -460,6 +494,163 @@ def diff_debug_type_stat(a: DebugTypeStat, b: DebugTypeStat) -> str:
 RE_DEBUG_MALLOC_HEADER_LINE = re.compile(rb'^Small block threshold = (\d+), in (\d+) size classes\.$')
 
 
+class ParsedDebugMallocStats(typing.NamedTuple):
+    """All the structures parsed from the output of ``sys._debugmallocstats``."""
+    small_block_threshold: int
+    size_classes: int
+    malloc_stats: typing.List[DebugMallocStat]
+    arenas: DebugMallocArenas
+    pools_blocks: DebugMallocPoolsBlocks
+    type_stats: typing.List[DebugTypeStat]
+
+
+# Sections of the output of sys._debugmallocstats, these are the states of parse_debugmallocstats().
+_SECTION_NONE = 0
+_SECTION_CLASSES = 1
+_SECTION_ARENAS = 2
+_SECTION_POOLS = 3
+_SECTION_ARENA_MAP = 4
+
+# Maps the name in a '# name = value' line to the attribute name.
+_ARENAS_NAMES = {
+    b'# arenas allocated total': 'ntimes_arena_allocated',
+    b'# arenas highwater mark': 'narenas_highwater',
+    b'# arenas allocated current': 'narenas',
+}
+_POOLS_NAMES = {
+    b'# bytes in allocated blocks': 'allocated_bytes',
+    b'# bytes in available blocks': 'available_bytes',
+    b'# bytes lost to pool headers': 'pool_header_bytes',
+    b'# bytes lost to quantization': 'quantization',
+    b'# bytes lost to arena alignment': 'arena_alignment',
+}
+
+
+def parse_debugmallocstats(debug_malloc: bytes) -> ParsedDebugMallocStats:
+    """Parses the output of ``sys._debugmallocstats`` in a single pass with a state machine keyed on the section
+    headings, no regular expressions are used. The sections are:
+
+    - ``Small block threshold = ...`` then the table of size classes after the ``-----`` line up to a blank line.
+    - ``# arenas allocated total`` to ``N arenas * S bytes/arena``.
+    - ``# bytes in allocated blocks`` to ``Total``.
+    - ``arena map counts`` to ``Total`` (Python 3.10+), this is ignored.
+    - The ``N free <type> * S bytes each = T`` lines.
+
+    May raise a ValueError if a section is missing."""
+    small_block_threshold = size_classes = -1
+    malloc_stats: typing.List[DebugMallocStat] = []
+    type_stats: typing.List[DebugTypeStat] = []
+    arenas: typing.Dict[str, int] = {}
+    pools: typing.Dict[str, int] = {}
+    section = _SECTION_NONE
+    for line in debug_malloc.splitlines():
+        if section == _SECTION_CLASSES:
+            fields = line.split()
+            if len(fields) == 5:
+                malloc_stats.append(DebugMallocStat(*[int(v) for v in fields]))
+            else:
+                section = _SECTION_NONE
+        elif section == _SECTION_ARENAS:
+            name, _sep, value = line.partition(b'=')
+            name = name.rstrip()
+            if name in _ARENAS_NAMES:
+                arenas[_ARENAS_NAMES[name]] = int(value.replace(b',', b''))
+            elif name.endswith(b'bytes/arena'):
+                # b'18 arenas * 262144 bytes/arena     =            4,718,592'
+                arenas['arena_size'] = int(name.split()[3])
+                section = _SECTION_NONE
+        elif section == _SECTION_POOLS:
+            name, _sep, value = line.partition(b'=')
+            name = name.rstrip()
+            if name in _POOLS_NAMES:
+                pools[_POOLS_NAMES[name]] = int(value.replace(b',', b''))
+            elif name.endswith(b' bytes') and b'unused pools' in name:
+                # b'63 unused pools * 4096 bytes       =              258,048'
+                fields = name.split()
+                pools['numfreepools'] = int(fields[0])
+                pools['pool_size'] = int(fields[4])
+            elif name == b'Total':
+                section = _SECTION_NONE
+        elif section == _SECTION_ARENA_MAP:
+            if line.startswith(b'Total'):
+                section = _SECTION_NONE
+        elif line.startswith(b'-----'):
+            section = _SECTION_CLASSES
+        elif line.startswith(b'# arenas'):
+            section = _SECTION_ARENAS
+            name, _sep, value = line.partition(b'=')
+            name = name.rstrip()
+            if name in _ARENAS_NAMES:
+                arenas[_ARENAS_NAMES[name]] = int(value.replace(b',', b''))
+        elif line.startswith(b'# bytes in allocated blocks'):
+            section = _SECTION_POOLS
+            pools['allocated_bytes'] = last_value_as_int(line)
+        elif line.startswith(b'arena map counts'):
+            section = _SECTION_ARENA_MAP
+        elif line.startswith(b'Small block threshold = '):
+            # b'Small block threshold = 512, in 32 size classes.'
+            fields = line.split()
+            small_block_threshold = int(fields[4].rstrip(b','))
+            size_classes = int(fields[6])
+        else:
+            # b'   34 free 2-sized PyTupleObjects * 40 bytes each =                1,360'
+            # Other lines, for example from something else writing to stderr during the capture, are ignored.
+            count, sep, rest = line.partition(b' free ')
+            if sep:
+                object_type, sep_type, rest = rest.partition(b' * ')
+                bytes_each, sep_each, total = rest.partition(b' bytes each =')
+                if sep_type and sep_each:
+                    try:
+                        type_stat = DebugTypeStat(
+                            int(count), object_type.decode('ascii'), int(bytes_each), int(total.replace(b',', b''))
+                        )
+                    except ValueError:
+                        pass
+                    else:
+                        type_stats.append(type_stat)
+    if small_block_threshold == -1:
+        raise ValueError('Can not find the small block threshold line')
+    try:
+        return ParsedDebugMallocStats(
+            small_block_threshold, size_classes, malloc_stats,
+            DebugMallocArenas.from_values(**arenas), DebugMallocPoolsBlocks.from_values(**pools), type_stats,
+        )
+    except TypeError as err:
+        raise ValueError(f'Can not find required attributes: {err}') from err
+
+
+def parse_debugmallocstats_regex(debug_malloc: bytes) -> ParsedDebugMallocStats:
+    """The original parser, kept as a reference for :py:func:`parse_debugmallocstats`.
+    This tries :py:data:`RE_DEBUG_MALLOC_STATS_LINE`, :py:data:`RE_DEBUG_MALLOC_TYPE_LINE` then
+    :py:data:`RE_DEBUG_MALLOC_HEADER_LINE` on each line then :py:class:`DebugMallocArenas` and
+    :py:class:`DebugMallocPoolsBlocks` each scan the bytes again."""
+    malloc_stats: typing.List[DebugMallocStat] = []
+    type_stats: typing.List[DebugTypeStat] = []
+    small_block_threshold = size_classes = -1
+    for line in debug_malloc.splitlines(keepends=False):
+        m = RE_DEBUG_MALLOC_STATS_LINE.match(line)
+        if m:
+            malloc_stats.append(DebugMallocStat(*[int(v) for v in m.groups()]))
+        else:
+            m = RE_DEBUG_MALLOC_TYPE_LINE.match(line)
+            if m:
+                type_stats.append(DebugTypeStat(
+                        int(m.group(1)), m.group(2).decode('ascii'), int(m.group(3)),
+                        int(m.group(4).replace(b',', b''))
+                    ))
+            else:
+                m = RE_DEBUG_MALLOC_HEADER_LINE.match(line)
+                if m:
+                    small_block_threshold = int(m.group(1))
+                    size_classes = int(m.group(2))
+    if small_block_threshold == -1:
+        raise ValueError('Can not find the small block threshold line')
+    return ParsedDebugMallocStats(
+        small_block_threshold, size_classes, malloc_stats,
+        DebugMallocArenas(debug_malloc), DebugMallocPoolsBlocks(debug_malloc), type_stats,
+    )
+
+
 class SysDebugMallocStats:
     """This decomposes the output of ``sys._debugmallocstats`` into these areas:
 
@@ -475,34 +666,19 @@ class SysDebugMallocStats:
         """Constructor, this optionally takes a bytes object for testing.
         If nothing supplied this gets the bytes object from sys._debugmallocstats.
         """
-        self.malloc_stats: typing.List[DebugMallocStat] = []
-        self.type_stats: typing.List[DebugTypeStat] = []
-        # Used for lookup by type
-        self.type_map: typing.Dict[bytes, int] = {}
         if not debug_malloc:
             debug_malloc: bytes = get_debugmallocstats()
-        for line in debug_malloc.splitlines(keepends=False):
-            m = RE_DEBUG_MALLOC_STATS_LINE.match(line)
-            if m:
-                self.malloc_stats.append(DebugMallocStat(*[int(v) for v in m.groups()]))
-            else:
-                m = RE_DEBUG_MALLOC_TYPE_LINE.match(line)
-                if m:
-                    self.type_map[m.group(2)] = len(self.type_stats)
-                    self.type_stats.append(DebugTypeStat(
-                            int(m.group(1)), m.group(2).decode('ascii'), int(m.group(3)),
-                            int(m.group(4).replace(b',', b''))
-                        ))
-                else:
-                    m = RE_DEBUG_MALLOC_HEADER_LINE.match(line)
-                    if m:
-                        self.small_block_threshold = int(m.group(1))
-                        self.size_classes = int(m.group(2))
-        self.arenas = DebugMallocArenas(debug_malloc)
-        self.pools_blocks = DebugMallocPoolsBlocks(debug_malloc)
-        expected_attrs = ('small_block_threshold', 'size_classes')
-        if not all(hasattr(self, name) for name in expected_attrs):
-            raise ValueError(f'Can not find required attributes {expected_attrs}')
+        parsed = parse_debugmallocstats(debug_malloc)
+        self.small_block_threshold = parsed.small_block_threshold
+        self.size_classes = parsed.size_classes
+        self.malloc_stats: typing.List[DebugMallocStat] = parsed.malloc_stats
+        self.type_stats: typing.List[DebugTypeStat] = parsed.type_stats
+        self.arenas = parsed.arenas
+        self.pools_blocks = parsed.pools_blocks
+        # Used for lookup by type
+        self.type_map: typing.Dict[bytes, int] = {
+            stat.object_type.encode('ascii'): i for i, stat in enumerate(self.type_stats)
+        }
         # Set the global POOL_OVERHEAD by combining malloc_stats and pools_blocks
         num_pools = sum(v.num_pools for v in self.malloc_stats)
         pool_overhead = self.pools_blocks.pool_overhead(num_pools)
@@ -671,6 +847,160 @@ def diff_debugmallocstats(a_stats: SysDebugMallocStats, b_stats: SysDebugMallocS
     return ret
 
 
+class SizeClassWaste(typing.NamedTuple):
+    """The memory in the pools of one size class that is not in allocated blocks, see :py:class:`DebugMallocStat`."""
+    block_class: int
+    size: int
+    allocated_bytes: int
+    available_bytes: int
+    pool_header_bytes: int
+    quantization: int
+
+    @property
+    def waste_bytes(self) -> int:
+        """Free blocks, pool headers and quantization."""
+        return self.available_bytes + self.pool_header_bytes + self.quantization
+
+    @property
+    def waste_ratio(self) -> float:
+        """The fraction of the pools of this size class that is not in allocated blocks."""
+        total = self.allocated_bytes + self.waste_bytes
+        return self.waste_bytes / total if total else 0.0
+
+    def __repr__(self):
+        """Representation of self of the form:
+
+        .. code-block:: text
+
+                3     64        1,220,160           1,536          14,544       4,848   1.7%
+
+        """
+        return (
+            f'{self.block_class:5d}  {self.size:5d}'
+            f'  {self.allocated_bytes:15,d}  {self.available_bytes:14,d}'
+            f'  {self.pool_header_bytes:14,d}  {self.quantization:10,d}  {self.waste_ratio:5.1%}'
+        )
+
+
+class FragmentationReport:
+    """Rolls up a :py:class:`SysDebugMallocStats` into fragmentation metrics:
+
+    - :py:attr:`utilisation` the fraction of arena memory that is in allocated blocks.
+    - :py:attr:`class_waste` the free block, pool header and quantization waste of each size class, see
+      :py:class:`SizeClassWaste`.
+    - :py:attr:`pinned_arenas` the number of arenas in excess of the minimum that the used pools could be packed into.
+      These are kept alive by a few live blocks scattered across them as pymalloc only frees an arena when all of its
+      pools are empty.
+    - :py:attr:`returnable_bytes` an estimate of the memory that could be returned to the OS if the used pools were
+      packed into the minimum number of arenas, that is :py:attr:`pinned_arenas` times the arena size.
+
+    ``sys._debugmallocstats`` does not report individual arenas so the last two are estimates.
+    """
+    def __init__(self, stats: SysDebugMallocStats):
+        arenas = stats.arenas
+        pools_blocks = stats.pools_blocks
+        self.narenas = arenas.narenas
+        self.arena_size = arenas.arena_size
+        self.arenas_total = arenas.arenas_total
+        self.allocated_bytes = pools_blocks.allocated_bytes
+        self.available_bytes = pools_blocks.available_bytes
+        self.unused_pool_total = pools_blocks.unused_pool_total
+        self.pool_header_bytes = pools_blocks.pool_header_bytes
+        self.quantization = pools_blocks.quantization
+        self.class_waste: typing.List[SizeClassWaste] = [
+            SizeClassWaste(
+                stat.block_class, stat.size, stat.allocated_bytes, stat.available_bytes, stat.pool_header_bytes,
+                stat.quantization,
+            ) for stat in stats.malloc_stats
+        ]
+        self.num_pools = sum(stat.num_pools for stat in stats.malloc_stats)
+        pools_per_arena = max(self.arena_size // pools_blocks.pool_size, 1)
+        self.min_arenas = -(-self.num_pools // pools_per_arena)
+        self.pinned_arenas = max(self.narenas - self.min_arenas, 0)
+
+    @property
+    def utilisation(self) -> float:
+        """The fraction of arena memory that is in allocated blocks."""
+        return self.allocated_bytes / self.arenas_total if self.arenas_total else 0.0
+
+    @property
+    def returnable_bytes(self) -> int:
+        """Estimate of the bytes that could be returned to the OS if the used pools were packed together."""
+        return self.pinned_arenas * self.arena_size
+
+    def worst_classes(self, n: int = 5) -> typing.List[SizeClassWaste]:
+        """The n size classes with the most wasted bytes, largest first."""
+        return sorted(self.class_waste, key=lambda w: w.waste_bytes, reverse=True)[:n]
+
+    def __repr__(self):
+        """Returns a string of the form:
+
+        .. code-block:: text
+
+            Utilisation                        =                91.4%
+            # bytes in arenas                  =            4,718,592
+            # bytes in allocated blocks        =            4,310,720
+            # arenas allocated current         =                   18
+            # arenas minimum for used pools    =                   18
+            # arenas pinned                    =                    0
+            # bytes returnable                 =                    0
+            class   size  allocated bytes     avail bytes    header bytes  quantized  waste
+            -----  -----  ---------------  --------------  --------------  ----------  -----
+                4     80          853,760           2,240          10,272      10,272   2.6%
+
+        The size classes are those with the most wasted bytes, see :py:meth:`worst_classes`.
+        """
+        ret = [
+            f'Utilisation                        = {self.utilisation:>20.1%}',
+            f'# bytes in arenas                  = {self.arenas_total:>20,d}',
+            f'# bytes in allocated blocks        = {self.allocated_bytes:>20,d}',
+            f'# arenas allocated current         = {self.narenas:>20,d}',
+            f'# arenas minimum for used pools    = {self.min_arenas:>20,d}',
+            f'# arenas pinned                    = {self.pinned_arenas:>20,d}',
+            f'# bytes returnable                 = {self.returnable_bytes:>20,d}',
+            'class   size  allocated bytes     avail bytes    header bytes  quantized  waste',
+            '-----  -----  ---------------  --------------  --------------  ----------  -----',
+        ]
+        for waste in self.worst_classes():
+            ret.append(repr(waste))
+        return '\n'.join(ret)
+
+
+def diff_fragmentation(a: FragmentationReport, b: FragmentationReport) -> typing.List[str]:
+    """Takes two FragmentationReport objects and returns the differences as a list of lines similar to
+    :py:meth:`FragmentationReport.__repr__`. Values that are the same are omitted."""
+    ret = []
+    if b.utilisation != a.utilisation:
+        ret.append(f'Utilisation                        = {b.utilisation - a.utilisation:>+20.1%}')
+    for name, attr in (
+            ('# bytes in arenas', 'arenas_total'),
+            ('# bytes in allocated blocks', 'allocated_bytes'),
+            ('# bytes in available blocks', 'available_bytes'),
+            ('# arenas allocated current', 'narenas'),
+            ('# arenas minimum for used pools', 'min_arenas'),
+            ('# arenas pinned', 'pinned_arenas'),
+            ('# bytes returnable', 'returnable_bytes'),
+    ):
+        value = getattr(b, attr) - getattr(a, attr)
+        if value:
+            ret.append(f'{name:<34s} = {value:>+20,d}')
+    a_waste = {w.block_class: w for w in a.class_waste}
+    b_waste = {w.block_class: w for w in b.class_waste}
+    # Size classes may have pools in only one of a or b.
+    for block_class in sorted(set(a_waste) | set(b_waste)):
+        previous = a_waste.get(block_class)
+        waste = b_waste.get(block_class)
+        previous_bytes = previous.waste_bytes if previous is not None else 0
+        waste_bytes = waste.waste_bytes if waste is not None else 0
+        if waste_bytes != previous_bytes:
+            size = waste.size if waste is not None else previous.size
+            ret.append(
+                f'Size class {block_class:5d} ({size:5d} bytes) waste ='
+                f' {waste_bytes - previous_bytes:>+20,d}'
+            )
+    return ret
+
+
 class DiffSysDebugMallocStats:
     """Context manager that compares two snapshots of ``sys._getdebugmallocstats()`` and can provide a diff between
     them."""
@@ -690,13 +1020,243 @@ class DiffSysDebugMallocStats:
         self.after = SysDebugMallocStats()
         return False
 
-    def diff(self) -> str:
-        """Returns the difference between two snapshots."""
+    def _check_snapshots(self) -> None:
         if self.before is None:
             raise RuntimeError('Context manager not entered.')
         if self.after is None:
             raise RuntimeError('Context manager not exited.')
-        return '\n'.join(diff_debugmallocstats(self.before, self.after))
+
+    def diff(self, fragmentation: bool = False) -> str:
+        """Returns the difference between two snapshots.
+        If fragmentation is True this is followed by :py:meth:`fragmentation_diff`."""
+        self._check_snapshots()
+        ret = diff_debugmallocstats(self.before, self.after)
+        if fragmentation:
+            ret.append('')
+            ret.append(self.fragmentation_diff())
+        return '\n'.join(ret)
+
+    def fragmentation_diff(self) -> str:
+        """Returns how fragmentation changed between the two snapshots, see :py:class:`FragmentationReport`."""
+        self._check_snapshots()
+        return '\n'.join(diff_fragmentation(FragmentationReport(self.before), FragmentationReport(self.after)))
+
+
+#: Default maximum number of samples kept by a :py:class:`DebugMallocStatsSeries`, an hour at one second intervals.
+SERIES_CAPACITY = 3600
+#: Per size class columns of a :py:class:`DebugMallocStatsSeries`, these are :py:class:`DebugMallocStat` attributes.
+SERIES_CLASS_COLUMNS = ('num_pools', 'blocks_in_use', 'avail_blocks')
+#: Totals columns of a :py:class:`DebugMallocStatsSeries`, these are :py:class:`DebugMallocArenas` or
+#: :py:class:`DebugMallocPoolsBlocks` attributes.
+SERIES_TOTAL_COLUMNS = (
+    'narenas', 'ntimes_arena_allocated', 'arenas_reclaimed', 'narenas_highwater', 'arenas_total',
+    'allocated_bytes', 'available_bytes', 'unused_pool_total',
+)
+#: Usage: GNUPLOT_PLT_SERIES.format(name=dat_file_name, extension='png')
+GNUPLOT_PLT_SERIES = """
+set grid
+set title "pymalloc Arenas and Fragmentation." font ",14"
+set xlabel "Time (s)"
+set ylabel "Memory (Mb)"
+set y2label "Arenas, Fragmentation (%)"
+set y2tics
+
+set pointsize 1
+set datafile separator whitespace#"	"
+set datafile missing "NaN"
+
+set terminal {extension} size 1000,700 # choose the file format
+set output "{name}.{extension}" # choose the output device
+
+plot "{name}.dat" using 1:($6 / 1024**2) axes x1y1 title "Arenas (Mb), left axis" with lines lt 1 lw 2, \\
+    "{name}.dat" using 1:($7 / 1024**2) axes x1y1 title "Allocated blocks (Mb), left axis" with lines lt 2 lw 2, \\
+    "{name}.dat" using 1:2 axes x1y2 title "Arenas, right axis" with steps lt 3 lw 1, \\
+    "{name}.dat" using 1:4 axes x1y2 title "Arenas reclaimed, right axis" with steps lt 4 lw 1, \\
+    "{name}.dat" using 1:($10 * 100) axes x1y2 title "Fragmentation (%), right axis" with lines lt 7 lw 1
+
+reset
+"""
+
+
+class DebugMallocStatsSeries:
+    """A fixed size ring buffer of :py:class:`SysDebugMallocStats` samples.
+    Each value is stored in a preallocated ``array.array`` column so memory usage is fixed regardless of how long the
+    process runs. The per size class columns, :py:data:`SERIES_CLASS_COLUMNS`, have ``size_classes`` values for each
+    sample, size classes that ``sys._debugmallocstats`` omits as they have no pools are zero.
+    """
+
+    def __init__(self, size_classes: int, capacity: int = SERIES_CAPACITY):
+        if capacity < 1:
+            raise ValueError(f'Capacity must be >= 1 not {capacity}')
+        self.size_classes = size_classes
+        self.capacity = capacity
+        self._time = array.array('d', bytes(8 * capacity))
+        self._class_columns: typing.Dict[str, array.array] = {
+            name: array.array('q', bytes(8 * capacity * size_classes)) for name in SERIES_CLASS_COLUMNS
+        }
+        self._total_columns: typing.Dict[str, array.array] = {
+            name: array.array('q', bytes(8 * capacity)) for name in SERIES_TOTAL_COLUMNS
+        }
+        # Block size of each size class, from the samples.
+        self.block_sizes: typing.List[int] = [0] * size_classes
+        self._zeros = array.array('q', bytes(8 * size_classes))
+        # Next slot to write
+        self._index = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, t: float, stats: SysDebugMallocStats) -> None:
+        """Add a sample at time t, overwriting the oldest one if full."""
+        with self._lock:
+            i = self._index
+            self._time[i] = t
+            offset = i * self.size_classes
+            for name, column in self._class_columns.items():
+                column[offset:offset + self.size_classes] = self._zeros
+            for stat in stats.malloc_stats:
+                if stat.block_class < self.size_classes:
+                    self.block_sizes[stat.block_class] = stat.size
+                    for name, column in self._class_columns.items():
+                        column[offset + stat.block_class] = getattr(stat, name)
+            for name, column in self._total_columns.items():
+                if hasattr(stats.arenas, name):
+                    column[i] = getattr(stats.arenas, name)
+                else:
+                    column[i] = getattr(stats.pools_blocks, name)
+            self._index = (i + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def _slots(self) -> typing.List[int]:
+        """The slots, oldest first. Call with the lock held."""
+        start = (self._index - self._count) % self.capacity
+        return [(start + n) % self.capacity for n in range(self._count)]
+
+    def times(self) -> typing.List[float]:
+        """The sample times, oldest first."""
+        with self._lock:
+            return [self._time[i] for i in self._slots()]
+
+    def total_values(self, name: str) -> typing.List[int]:
+        """The values of the :py:data:`SERIES_TOTAL_COLUMNS` column, oldest first."""
+        with self._lock:
+            column = self._total_columns[name]
+            return [column[i] for i in self._slots()]
+
+    def class_values(self, name: str, block_class: int) -> typing.List[int]:
+        """The values of the :py:data:`SERIES_CLASS_COLUMNS` column for the size class, oldest first."""
+        with self._lock:
+            column = self._class_columns[name]
+            return [column[i * self.size_classes + block_class] for i in self._slots()]
+
+    def fragmentation(self) -> typing.List[float]:
+        """For each sample, oldest first, the fraction of arena memory that is not in allocated blocks.
+        If this rises while the allocated bytes do not then the RSS is growing because of fragmentation rather than
+        a leak."""
+        return [
+            1.0 - allocated / arenas if arenas else 0.0
+            for allocated, arenas in zip(self.total_values('allocated_bytes'), self.total_values('arenas_total'))
+        ]
+
+    def totals_table(self) -> typing.List[typing.List[typing.Any]]:
+        """A table, with a header row, of the time, the :py:data:`SERIES_TOTAL_COLUMNS` and the fragmentation."""
+        columns = [self.times()] + [self.total_values(name) for name in SERIES_TOTAL_COLUMNS] + [self.fragmentation()]
+        ret = [['#time'] + list(SERIES_TOTAL_COLUMNS) + ['fragmentation']]
+        ret.extend([list(row) for row in zip(*columns)])
+        return ret
+
+    def class_table(self, name: str) -> typing.List[typing.List[typing.Any]]:
+        """A table, with a header row, of the time and the :py:data:`SERIES_CLASS_COLUMNS` column for each size
+        class."""
+        with self._lock:
+            column = self._class_columns[name]
+            ret = [['#time'] + [f'{size}' for size in self.block_sizes]]
+            for i in self._slots():
+                offset = i * self.size_classes
+                ret.append([self._time[i]] + column[offset:offset + self.size_classes].tolist())
+        return ret
+
+    def write_gnuplot(self, path: str, name: str, plot: bool = True) -> int:
+        """Write ``{path}/{name}.dat`` from :py:meth:`totals_table` and ``{path}/{name}_{column}.dat`` from
+        :py:meth:`class_table` for each of :py:data:`SERIES_CLASS_COLUMNS`.
+        If plot is True gnuplot is invoked to plot the arenas and fragmentation.
+        Returns the gnuplot error code, zero if not plotted."""
+        for column in SERIES_CLASS_COLUMNS:
+            gnuplot.write_gnuplot_dat(path, f'{name}_{column}', self.class_table(column))
+        gnuplot.write_gnuplot_dat(path, name, self.totals_table())
+        if plot:
+            return gnuplot.invoke_gnuplot_plt(path, name, GNUPLOT_PLT_SERIES.format(name=name, extension='png'))
+        return 0
+
+
+class DebugMallocStatsSampler(threading.Thread):
+    """Thread that takes a :py:class:`SysDebugMallocStats` every interval seconds and adds it to
+    :py:attr:`series`, a :py:class:`DebugMallocStatsSeries`. Use as a context manager or call :py:meth:`stop`.
+
+    The times are ``time.monotonic()`` relative to the start of the thread.
+    :py:meth:`sample` can be called from other threads while this one is running.
+    """
+
+    def __init__(self, interval: float = 1.0, capacity: int = SERIES_CAPACITY, name: str = 'DebugMallocStats',
+                 daemon: bool = True):
+        super().__init__(name=name, daemon=daemon)
+        self.interval = interval
+        self.capacity = capacity
+        # Created by the first sample as size_classes depends on the Python version.
+        self.series: typing.Optional[DebugMallocStatsSeries] = None
+        self._stop_event = threading.Event()
+        self._time_start = time.monotonic()
+        # Serialises sample() between this thread and callers so that the capture of stdout, the creation of series
+        # and its ring buffer index are not interleaved.
+        self._lock = threading.Lock()
+
+    def sample(self) -> None:
+        """Take a sample now."""
+        with self._lock:
+            stats = SysDebugMallocStats()
+            if self.series is None:
+                self.series = DebugMallocStatsSeries(stats.size_classes, self.capacity)
+            self.series.add(time.monotonic() - self._time_start, stats)
+
+    def _sample_logging_failure(self) -> None:
+        """Take a sample, a failed capture or parse loses this sample only."""
+        try:
+            self.sample()
+        except Exception:
+            logger.exception('DebugMallocStatsSampler failed to take a sample.')
+
+    def run(self) -> None:
+        """thread.run(). Sample then wait until the next deadline so the time taken to sample does not accumulate
+        as drift."""
+        self._time_start = time.monotonic()
+        next_time = self._time_start
+        while not self._stop_event.is_set():
+            self._sample_logging_failure()
+            next_time += self.interval
+            delay = next_time - time.monotonic()
+            if delay < 0:
+                # Running behind, do not try to catch up.
+                next_time = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def stop(self) -> None:
+        """Take a final sample, stop the thread and wait for it."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self._sample_logging_failure()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
 
 
 def main():
@@ -0,0 +1,233 @@
+"""
+Direct, low overhead, reads of a process's data from the Linux ``/proc`` file system.
+
+psutil opens, reads and closes ``/proc/<pid>/...`` files on every call and builds named tuples from them.
+That is fine at 1 Hz but is too heavy for sampling at 100 Hz or more.
+:py:class:`ProcReader` keeps ``/proc/<pid>/statm`` and ``/proc/<pid>/stat`` open and re-reads them with
+``os.pread()`` so each sample is two system calls and a little string splitting.
+
+The results use the same keys as psutil so they can be used interchangeably with
+``psutil.Process().memory_info()._asdict()`` and ``psutil.Process().cpu_times()._asdict()``.
+In addition ``memory_info`` includes the cumulative page faults as ``'pfaults'`` and ``'pageins'`` as psutil does on
+macOS.
+
+This is only available on Linux, see :py:func:`is_available`.
+"""
+import os
+import sys
+import typing
+
+#: Maximum number of bytes to read from a ``/proc/<pid>/...`` file.
+#: ``/proc/<pid>/stat`` is typically around 300 bytes, the process name is at most 16 characters.
+PROC_READ_SIZE = 1024
+#: Maximum number of bytes to read from ``/proc/<pid>/smaps_rollup``, this is typically around 700 bytes.
+SMAPS_ROLLUP_READ_SIZE = 4096
+#: Number of bytes in a page.
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+#: Value given by :py:func:`smaps_rollup_summary` when the values are not available.
+SMAPS_ROLLUP_UNAVAILABLE = -1
+#: Clock ticks per second.
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+# Field indexes in ``/proc/<pid>/stat`` *after* the ``(comm)`` field.
+# These are the field numbers in ``man 5 proc`` minus 3.
+STAT_INDEX_STATE = 0
+STAT_INDEX_PPID = 1
+STAT_INDEX_MINFLT = 7
+STAT_INDEX_MAJFLT = 9
+STAT_INDEX_UTIME = 11
+STAT_INDEX_STIME = 12
+STAT_INDEX_CUTIME = 13
+STAT_INDEX_CSTIME = 14
+STAT_INDEX_NUM_THREADS = 17
+STAT_INDEX_STARTTIME = 19
+STAT_INDEX_DELAYACCT_BLKIO_TICKS = 39
+
+
+def is_available() -> bool:
+    """Returns True if the ``/proc`` file system can be used."""
+    return sys.platform.startswith('linux') and os.path.exists('/proc/self/stat')
+
+
+def parse_stat(stat: bytes) -> typing.List[bytes]:
+    """Split the contents of ``/proc/<pid>/stat`` into the fields after the ``(comm)`` field.
+    The process name may contain spaces and parentheses so this splits on the last ``')'``."""
+    return stat[stat.rindex(b')') + 2:].split()
+
+
+def parse_smaps_rollup(smaps_rollup: bytes) -> typing.Dict[str, int]:
+    """Parse the contents of ``/proc/<pid>/smaps_rollup`` into a dict of ``{name : bytes, ...}`` using the names in the
+    file such as ``'Pss'``, ``'Private_Dirty'``, ``'Swap'`` etc."""
+    ret = {}
+    for line in smaps_rollup.splitlines():
+        fields = line.split()
+        if len(fields) == 3 and fields[2] == b'kB':
+            ret[fields[0][:-1].decode('ascii')] = int(fields[1]) * 1024
+    return ret
+
+
+def smaps_rollup_summary(smaps_rollup: typing.Dict[str, int]) -> typing.Dict[str, int]:
+    """Reduce the result of :py:func:`parse_smaps_rollup` to ``'pss'``, ``'uss'``, ``'swap'`` and ``'anonymous'``
+    in bytes. USS is the private clean and dirty memory as psutil's ``memory_full_info()`` does.
+    A zombie process has an empty ``smaps_rollup``, then the values are :py:data:`SMAPS_ROLLUP_UNAVAILABLE`."""
+    if not smaps_rollup:
+        return {
+            'pss': SMAPS_ROLLUP_UNAVAILABLE,
+            'uss': SMAPS_ROLLUP_UNAVAILABLE,
+            'swap': SMAPS_ROLLUP_UNAVAILABLE,
+            'anonymous': SMAPS_ROLLUP_UNAVAILABLE,
+        }
+    return {
+        'pss': smaps_rollup.get('Pss', 0),
+        'uss': smaps_rollup.get('Private_Clean', 0) + smaps_rollup.get('Private_Dirty', 0),
+        'swap': smaps_rollup.get('Swap', 0),
+        'anonymous': smaps_rollup.get('Anonymous', 0),
+    }
+
+
+def read_smaps_rollup(pid: int) -> typing.Dict[str, int]:
+    """Reads ``/proc/<pid>/smaps_rollup`` and returns :py:func:`smaps_rollup_summary`.
+    This is a single read that is far cheaper than psutil's ``memory_full_info()`` which parses all of
+    ``/proc/<pid>/smaps``.
+    May raise a FileNotFoundError (no process or kernel < 4.14) or PermissionError."""
+    with open(f'/proc/{pid}/smaps_rollup', 'rb') as file:
+        return smaps_rollup_summary(parse_smaps_rollup(file.read()))
+
+
+def scan_ppids(proc_root: str = '/proc') -> typing.Dict[int, int]:
+    """Reads every ``/proc/<pid>/stat`` once and returns ``{pid : ppid, ...}``.
+    Processes that exit during the scan are ignored."""
+    ret = {}
+    with os.scandir(proc_root) as it:
+        for entry in it:
+            if entry.name.isdigit():
+                try:
+                    fd = os.open(os.path.join(proc_root, entry.name, 'stat'), os.O_RDONLY)
+                    try:
+                        stat = os.read(fd, PROC_READ_SIZE)
+                    finally:
+                        os.close(fd)
+                    ret[int(entry.name)] = int(parse_stat(stat)[STAT_INDEX_PPID])
+                except (OSError, ValueError, IndexError):
+                    # Gone or unreadable.
+                    pass
+    return ret
+
+
+def children_map(ppids: typing.Dict[int, int]) -> typing.Dict[int, typing.List[int]]:
+    """Inverts the result of :py:func:`scan_ppids` to ``{ppid : [pid, ...], ...}`` with the PIDs sorted."""
+    ret: typing.Dict[int, typing.List[int]] = {}
+    for pid, ppid in sorted(ppids.items()):
+        ret.setdefault(ppid, []).append(pid)
+    return ret
+
+
+class ProcReader:
+    """Keeps the ``/proc/<pid>/statm`` and ``/proc/<pid>/stat`` files open and reads them with ``os.pread()``.
+    Use as a context manager or call :py:meth:`close`.
+    May raise a FileNotFoundError or ProcessLookupError if the process does not exist."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        # Set before opening anything so that close() and __del__ work if an open fails.
+        # smaps_rollup is opened on first use.
+        self._fd_statm = self._fd_stat = self._fd_smaps_rollup = -1
+        self._fd_statm = os.open(f'/proc/{pid}/statm', os.O_RDONLY)
+        try:
+            self._fd_stat = os.open(f'/proc/{pid}/stat', os.O_RDONLY)
+        except OSError:
+            os.close(self._fd_statm)
+            self._fd_statm = -1
+            raise
+
+    def close(self) -> None:
+        """Close the open files."""
+        if self._fd_statm != -1:
+            os.close(self._fd_statm)
+            self._fd_statm = -1
+        if self._fd_stat != -1:
+            os.close(self._fd_stat)
+            self._fd_stat = -1
+        if self._fd_smaps_rollup != -1:
+            os.close(self._fd_smaps_rollup)
+            self._fd_smaps_rollup = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        self.close()
+
+    def _pread(self, fd: int, size: int = PROC_READ_SIZE) -> bytes:
+        """Read the file from the start. If the process has gone this raises a ProcessLookupError."""
+        try:
+            return os.pread(fd, size, 0)
+        except ProcessLookupError:
+            raise
+        except OSError as err:
+            # Reading /proc/<pid>/... of a process that has exited gives ESRCH
+            raise ProcessLookupError(f'Process {self.pid} has gone: {err}') from err
+
+    def read_statm(self) -> typing.List[int]:
+        """Returns the values in ``/proc/<pid>/statm`` in pages:
+        size, resident, shared, text, lib, data, dt."""
+        return [int(v) for v in self._pread(self._fd_statm).split()]
+
+    def read_stat(self) -> typing.List[bytes]:
+        """Returns the fields in ``/proc/<pid>/stat`` after the ``(comm)`` field, see :py:func:`parse_stat`."""
+        return parse_stat(self._pread(self._fd_stat))
+
+    def memory_smaps_rollup(self) -> typing.Dict[str, int]:
+        """Returns :py:func:`smaps_rollup_summary` from ``/proc/<pid>/smaps_rollup``, the file is opened on first use.
+        May raise a FileNotFoundError (kernel < 4.14) or PermissionError."""
+        if self._fd_smaps_rollup == -1:
+            self._fd_smaps_rollup = os.open(f'/proc/{self.pid}/smaps_rollup', os.O_RDONLY)
+        return smaps_rollup_summary(parse_smaps_rollup(self._pread(self._fd_smaps_rollup, SMAPS_ROLLUP_READ_SIZE)))
+
+    def memory_info(self) -> typing.Dict[str, int]:
+        """Returns the same as psutil's ``memory_info()._asdict()`` on Linux plus the cumulative page faults as
+        ``'pfaults'`` and major page faults as ``'pageins'``."""
+        return self.memory_info_from_statm_stat(self.read_statm(), self.read_stat())
+
+    def cpu_times(self) -> typing.Dict[str, float]:
+        """Returns the same as psutil's ``cpu_times()._asdict()`` on Linux."""
+        return self.cpu_times_from_stat(self.read_stat())
+
+    def memory_info_and_cpu_times(self) -> typing.Tuple[typing.Dict[str, int], typing.Dict[str, float]]:
+        """Returns the memory info and the CPU times reading ``/proc/<pid>/stat`` only once."""
+        stat = self.read_stat()
+        return self.memory_info_from_statm_stat(self.read_statm(), stat), self.cpu_times_from_stat(stat)
+
+    @staticmethod
+    def memory_info_from_statm_stat(statm: typing.List[int], stat: typing.List[bytes]) -> typing.Dict[str, int]:
+        """Returns the memory info from the results of :py:meth:`read_statm` and :py:meth:`read_stat`."""
+        size, resident, shared, text, lib, data, dirty = statm[:7]
+        majflt = int(stat[STAT_INDEX_MAJFLT])
+        return {
+            'rss': resident * PAGE_SIZE,
+            'vms': size * PAGE_SIZE,
+            'shared': shared * PAGE_SIZE,
+            'text': text * PAGE_SIZE,
+            'lib': lib * PAGE_SIZE,
+            'data': data * PAGE_SIZE,
+            'dirty': dirty * PAGE_SIZE,
+            'pfaults': int(stat[STAT_INDEX_MINFLT]) + majflt,
+            'pageins': majflt,
+        }
+
+    @staticmethod
+    def cpu_times_from_stat(stat: typing.List[bytes]) -> typing.Dict[str, float]:
+        """Returns the CPU times from the result of :py:meth:`read_stat`."""
+        ret = {
+            'user': int(stat[STAT_INDEX_UTIME]) / CLOCK_TICKS,
+            'system': int(stat[STAT_INDEX_STIME]) / CLOCK_TICKS,
+            'children_user': int(stat[STAT_INDEX_CUTIME]) / CLOCK_TICKS,
+            'children_system': int(stat[STAT_INDEX_CSTIME]) / CLOCK_TICKS,
+        }
+        if len(stat) > STAT_INDEX_DELAYACCT_BLKIO_TICKS:
+            ret['iowait'] = int(stat[STAT_INDEX_DELAYACCT_BLKIO_TICKS]) / CLOCK_TICKS
+        return ret
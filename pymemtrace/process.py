@@ -11,7 +11,11 @@ There are several DoF here:
 
 """
 import argparse
+import array
+import asyncio
+import collections
 import contextlib
+import dataclasses
 import datetime
 import functools
 import json
@@ -19,13 +23,19 @@ import logging
 import os
 import queue
 import re
+import signal
+import struct
 import sys
+import tempfile
 import threading
 import time
 import typing
 
 import psutil
 
+from pymemtrace import cgroup
+from pymemtrace import proc_fs
+from pymemtrace import prometheus_exporter
 from pymemtrace.util import gnuplot
 
 logger = logging.getLogger(__file__)
@@ -47,13 +57,41 @@ KEY_ELAPSED_TIME = 'elapsed_time'
 KEY_LABEL = 'label'
 #: The JSON key that is the process ID
 KEY_PROCESS_ID = 'pid'
+#: The JSON key that is the cgroup v2 memory data, see :py:meth:`pymemtrace.cgroup.CGroupMemoryReader.read`
+KEY_CGROUP = 'cgroup'
+#: Sampling backends for :py:class:`ProcessLoggingThread`.
+#: 'proc' reads ``/proc/<pid>/...`` directly, see :py:mod:`pymemtrace.proc_fs`, 'psutil' uses psutil.
+#: 'auto' uses 'proc' if available otherwise 'psutil'.
+BACKENDS = ('auto', 'proc', 'psutil')
+#: Default number of samples kept by a :py:class:`FlightRecorder`.
+FLIGHT_RECORDER_SIZE = 64 * 1024
+#: Prefix of the file name that a :py:class:`FlightRecorder` is dumped to.
+FLIGHT_RECORDER_FILE_PREFIX = 'pymemtrace_flight_recorder'
+#: Magic bytes at the start of a binary sample file, the last byte is the version.
+BINARY_MAGIC = b'PYMTPRC\x01'
+#: Names of the fields of a binary sample record, see :py:data:`BINARY_RECORD`.
+#: 'label_id' is the index into the labels or -1 for no label. 'pfaults' is -1 if not available.
+BINARY_COLUMNS = ('timestamp_ns', 'pid', 'rss', 'vms', 'pfaults', 'label_id', 'elapsed_time', 'user', 'system')
+#: A binary sample record, little endian, six int64 then three float64.
+BINARY_RECORD = struct.Struct('<6q3d')
+#: Suffix of the file alongside the binary sample file that contains the labels as JSON strings, one per line.
+BINARY_LABELS_SUFFIX = '.labels'
+#: How often, in seconds, :py:class:`BinarySampleWriter` flushes the files.
+BINARY_FLUSH_INTERVAL = 1.0
+#: :py:class:`RSSAlert` kind, the threshold is the RSS in bytes.
+ALERT_RSS_LIMIT = 'rss_limit'
+#: :py:class:`RSSAlert` kind, the threshold is the RSS growth rate in bytes per second over the window.
+ALERT_RSS_SLOPE = 'rss_slope'
+#: :py:class:`RSSAlert` kind, the threshold is the RSS growth in percent since the first sample.
+ALERT_RSS_GROWTH = 'rss_growth'
+ALERT_KINDS = (ALERT_RSS_LIMIT, ALERT_RSS_SLOPE, ALERT_RSS_GROWTH)
 #: psutil.Process().as_dict() has the following keys:
 PSUTIL_PROCESS_AS_DICT_KEYS = [
     'cmdline', 'connections', 'cpu_percent', 'cpu_times', 'create_time', 'cwd', 'environ', 'exe', 'gids',
     'memory_full_info', 'memory_info', 'memory_percent', 'name', 'nice', 'num_ctx_switches', 'num_fds', 'num_threads',
     'open_files', 'pid', 'ppid', 'status', 'terminal', 'threads', 'uids', 'username'
 ]
-#: Usage: GNUPLOT_PLT.format(name=dat_file_name, extension='png', labels=[])
+#: Usage: GNUPLOT_PLT.format(name=dat_file_name, extension='png', labels=[], cgroup_plot='')
 GNUPLOT_PLT = """
 set grid
 set title "Memory and CPU Usage." font ",14"
@@ -92,37 +130,143 @@ set output "{name}.{extension}" # choose the output device
 plot "{name}.dat" using 1:($2 / 1024**2) axes x1y1 title "RSS (Mb), left axis" with lines lt 1 lw 2, \\
     "{name}.dat" using 1:($3 / 10000) axes x1y2 title "Page Faults (10,000/s), right axis" with lines lt 3 lw 1, \\
     "{name}.dat" using 1:5 axes x1y2 title "Mean CPU (%), right axis" with lines lt 2 lw 1, \\
-    "{name}.dat" using 1:6 axes x1y2 title "Instantaneous CPU (%), right axis" with lines lt 7 lw 1
+    "{name}.dat" using 1:6 axes x1y2 title "Instantaneous CPU (%), right axis" with lines lt 7 lw 1{cgroup_plot}
 
 reset
 """
+#: Additional plots for GNUPLOT_PLT if there is cgroup data, see :py:data:`CGROUP_TABLE_HEADER`.
+#: Usage: GNUPLOT_PLT_CGROUP.format(name=dat_file_name)
+GNUPLOT_PLT_CGROUP = """, \\
+    "{name}_cgroup.dat" using 1:($2 / 1024**2) axes x1y1 title "cgroup memory.current (Mb), left axis" with lines lt 4 lw 2, \\
+    "{name}_cgroup.dat" using 1:($3 / 1024**2) axes x1y1 title "cgroup anon (Mb), left axis" with lines lt 5 lw 1, \\
+    "{name}_cgroup.dat" using 1:7 axes x1y2 title "cgroup high events, right axis" with steps lt 6 lw 1, \\
+    "{name}_cgroup.dat" using 1:8 axes x1y2 title "cgroup oom_kill events, right axis" with steps lt 8 lw 2"""
 
 
 def parse_timestamp(s: str) -> datetime.datetime:
-    """Read a string such as '2019-06-07 11:57:58.390921' and return a datetime."""
+    """Read a string such as '2019-06-07 11:57:58.390921' and return a datetime.
+    The fixed format is parsed with ``datetime.fromisoformat()`` which is far faster than ``strptime()``."""
+    if len(s) == 26 and s[10] == ' ':
+        try:
+            return datetime.datetime.fromisoformat(s)
+        except ValueError:
+            pass
     return datetime.datetime.strptime(s, DATETIME_NOW_FORMAT)
 
 
+def iter_json(istream: typing.TextIO) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Reads a log file and yields the JSON as dicts one at a time. Non-matching lines are ignored."""
+    for line in istream:
+        if LOGGER_PREFIX in line:
+            m = RE_LOG_LINE.match(line)
+            if m:
+                log_dict = json.loads(m.group(2))
+                if KEY_TIMESTAMP in log_dict:
+                    log_dict[KEY_TIMESTAMP] = parse_timestamp(log_dict[KEY_TIMESTAMP])
+                yield log_dict
+
+
 def extract_json(istream: typing.TextIO) -> typing.List[typing.Dict[str, typing.Any]]:
     """Reads a log file and returns the JSON as a list of dicts. Non-matching lines are ignored."""
-    ret = []
-    for line in istream.readlines():
-        m = RE_LOG_LINE.match(line)
-        if m:
-            log_dict = json.loads(m.group(2))
-            if KEY_TIMESTAMP in log_dict:
-                log_dict[KEY_TIMESTAMP] = parse_timestamp(log_dict[KEY_TIMESTAMP])
-            ret.append(log_dict)
-    return ret
+    return list(iter_json(istream))
 
 
-def extract_labels_from_json(json_data: typing.List[typing.Dict[str, typing.Any]]) \
+def extract_labels_from_json(json_data: typing.Iterable[typing.Dict[str, typing.Any]]) \
         -> typing.List[typing.Dict[str, typing.Any]]:
     """Returns a list of dicts of JSON data where 'label' is a key'."""
     return [v for v in json_data if KEY_LABEL in v]
 
 
-def extract_json_as_table(json_data: typing.List[typing.Dict[str, typing.Any]]) \
+#: The header row of the table from :py:func:`iter_json_as_table`.
+TABLE_HEADER = [
+    f'{"#t(s)":12}',
+    f'{"RSS":>12}',
+    f'{"PageFaults/s":>12}',
+    f'{"User":>12}',
+    f'{"Mean_CPU%":>12}',
+    f'{"Inst_CPU%":>12}',
+    f'{"Timestamp":<26}',
+    f'{"PID":>6}',
+    f'{"Label"}',
+]
+
+
+#: The header row of the cgroup table from :py:func:`cgroup_row`.
+CGROUP_TABLE_HEADER = [
+    f'{"#t(s)":12}',
+    f'{"Current":>12}',
+    f'{"Anon":>12}',
+    f'{"File":>12}',
+    f'{"Kernel":>12}',
+    f'{"Slab":>12}',
+    f'{"High":>8}',
+    f'{"OOM_Kill":>8}',
+]
+
+
+def cgroup_row(record: typing.Dict[str, typing.Any]) -> typing.List[str]:
+    """Returns a row of the cgroup table for a record that has :py:data:`KEY_CGROUP`.
+    Values that the kernel does not provide are 'NaN'."""
+    values = record[KEY_CGROUP]
+    ret = [f'{record[KEY_ELAPSED_TIME]:<12.1f}']
+    for key in ('current', 'anon', 'file', 'kernel', 'slab'):
+        ret.append(f'{values[key]:12d}' if key in values else f'{"NaN":>12}')
+    for key in ('events_high', 'events_oom_kill'):
+        ret.append(f'{values.get(key, 0):8d}')
+    return ret
+
+
+def iter_json_as_table(json_data: typing.Iterable[typing.Dict[str, typing.Any]]) \
+        -> typing.Iterator[typing.Tuple[int, typing.Optional[typing.Dict[str, typing.Any]], typing.List[str]]]:
+    """Yields rows of a table from JSON suitable for a Gnuplot ``.dat`` file one at a time.
+    This only keeps the previous values for each process so the memory usage is independent of the length of the log.
+
+    Yields ``(process_id, record, row)``. The first row for each process ID is the header and the record is None.
+
+    A row of data is:
+
+        time, RSS, PageFaults, User, Mean CPU, Insantanous CPU, Timestamp, PID, Label
+
+    """
+    prev_cpu = {}
+    prev_elapsed_time = {}
+    prev_page_faults = {}
+    for record in json_data:
+        pid = record[KEY_PROCESS_ID]
+        if pid not in prev_cpu:
+            yield pid, None, TABLE_HEADER[:]
+            prev_cpu[pid] = 0.0
+            prev_elapsed_time[pid] = 0.0
+            prev_page_faults[pid] = 0
+        mean_cpu_user = record["cpu_times"]["user"] / record[KEY_ELAPSED_TIME]
+        delta_time = record[KEY_ELAPSED_TIME] - prev_elapsed_time[pid]
+        # record["memory_info"]["pfaults"] is the cumulative total.
+        # It is missing from binary samples taken with the psutil backend on Linux.
+        page_faults = record["memory_info"].get("pfaults", 0)
+        if delta_time > 0:
+            inst_cpu_user = (record["cpu_times"]["user"] - prev_cpu[pid]) / delta_time
+            inst_page_faults = (page_faults - prev_page_faults[pid]) / delta_time
+        else:
+            # Several labels in one sample from a binary file or flight recorder share the elapsed time.
+            inst_cpu_user = inst_page_faults = 0.0
+        label = record[KEY_LABEL] if KEY_LABEL in record else ''
+        yield pid, record, [
+            f'{record[KEY_ELAPSED_TIME]:<12.1f}',
+            f'{record["memory_info"]["rss"]:12d}',
+            f'{inst_page_faults:12.1f}',
+            f'{record["cpu_times"]["user"]:12.1f}',
+            f'{mean_cpu_user:12.1%}',
+            f'{inst_cpu_user:12.1%}',
+            f'{record["timestamp"].strftime("%Y-%m-%dT%H:%M:%S.%f"):26}',
+            f'{pid:6d}',
+            f'# {label}'
+        ]
+        prev_cpu[pid] = record["cpu_times"]["user"]
+        prev_elapsed_time[pid] = record[KEY_ELAPSED_TIME]
+        prev_page_faults[pid] = page_faults
+
+
+def extract_json_as_table(json_data: typing.Iterable[typing.Dict[str, typing.Any]]) \
         -> typing.Tuple[
             typing.Dict[int, typing.List[typing.List[str]]],
             typing.Dict[int, float],
@@ -145,90 +289,83 @@ def extract_json_as_table(json_data: typing.List[typing.Dict[str, typing.Any]])
         time, RSS, PageFaults, User, Mean CPU, Insantanous CPU, Timestamp, PID, Label
 
     """
-    header = [
-        f'{"#t(s)":12}',
-        f'{"RSS":>12}',
-        f'{"PageFaults/s":>12}',
-        f'{"User":>12}',
-        f'{"Mean_CPU%":>12}',
-        f'{"Inst_CPU%":>12}',
-        f'{"Timestamp":<26}',
-        f'{"PID":>6}',
-        f'{"Label"}',
-    ]
     ret = {}
-    prev_cpu = {}
-    prev_elapsed_time = {}
-    prev_page_faults = {}
     t_min = {}
     t_max = {}
     rss_min = {}
     rss_max = {}
-    for record in json_data:
-        if record[KEY_PROCESS_ID] not in ret:
-            ret[record[KEY_PROCESS_ID]] = [header[:]]
-            prev_cpu[record[KEY_PROCESS_ID]] = 0.0
-            prev_elapsed_time[record[KEY_PROCESS_ID]] = 0.0
-            prev_page_faults[record[KEY_PROCESS_ID]] = 0
-            t_min[record[KEY_PROCESS_ID]] = sys.float_info.max
-            t_max[record[KEY_PROCESS_ID]] = sys.float_info.min
-            rss_min[record[KEY_PROCESS_ID]] = sys.float_info.max
-            rss_max[record[KEY_PROCESS_ID]] = sys.float_info.min
-        mean_cpu_user = record["cpu_times"]["user"] / record[KEY_ELAPSED_TIME]
-        inst_cpu_user = (record["cpu_times"]["user"] - prev_cpu[record[KEY_PROCESS_ID]]) \
-                        / (record[KEY_ELAPSED_TIME] - prev_elapsed_time[record[KEY_PROCESS_ID]])
-        # record["memory_info"]["pfaults"] is the cumulative total.
-        inst_page_faults = (record["memory_info"]["pfaults"] - prev_page_faults[record[KEY_PROCESS_ID]]) \
-                           / (record[KEY_ELAPSED_TIME] - prev_elapsed_time[record[KEY_PROCESS_ID]])
-        label = record[KEY_LABEL] if KEY_LABEL in record else ''
-        ret[record[KEY_PROCESS_ID]].append(
-            [
-                f'{record[KEY_ELAPSED_TIME]:<12.1f}',
-                f'{record["memory_info"]["rss"]:12d}',
-                f'{inst_page_faults:12.1f}',
-                f'{record["cpu_times"]["user"]:12.1f}',
-                f'{mean_cpu_user:12.1%}',
-                f'{inst_cpu_user:12.1%}',
-                f'{record["timestamp"].strftime("%Y-%m-%dT%H:%M:%S.%f"):26}',
-                f'{record[KEY_PROCESS_ID]:6d}',
-                f'# {label}'
-            ]
-        )
-        prev_cpu[record[KEY_PROCESS_ID]] = record["cpu_times"]["user"]
-        prev_elapsed_time[record[KEY_PROCESS_ID]] = record[KEY_ELAPSED_TIME]
-        prev_page_faults[record[KEY_PROCESS_ID]] = record["memory_info"]["pfaults"]
-        t_min[record[KEY_PROCESS_ID]] = min(record[KEY_ELAPSED_TIME], t_min[record[KEY_PROCESS_ID]])
-        t_max[record[KEY_PROCESS_ID]] = max(record[KEY_ELAPSED_TIME], t_max[record[KEY_PROCESS_ID]])
-        rss_min[record[KEY_PROCESS_ID]] = min(record["memory_info"]["rss"], rss_min[record[KEY_PROCESS_ID]])
-        rss_max[record[KEY_PROCESS_ID]] = max(record["memory_info"]["rss"], rss_max[record[KEY_PROCESS_ID]])
+    for pid, record, row in iter_json_as_table(json_data):
+        if record is None:
+            ret[pid] = [row]
+            t_min[pid] = sys.float_info.max
+            t_max[pid] = sys.float_info.min
+            rss_min[pid] = sys.float_info.max
+            rss_max[pid] = sys.float_info.min
+        else:
+            ret[pid].append(row)
+            t_min[pid] = min(record[KEY_ELAPSED_TIME], t_min[pid])
+            t_max[pid] = max(record[KEY_ELAPSED_TIME], t_max[pid])
+            rss_min[pid] = min(record["memory_info"]["rss"], rss_min[pid])
+            rss_max[pid] = max(record["memory_info"]["rss"], rss_max[pid])
     return ret, t_min, t_max, rss_min, rss_max
 
 
 def invoke_gnuplot(log_path: str, gnuplot_dir: str) -> int:
-    """Reads a log file, extracts the data, writes it out to gnuplot_dir and invokes gnuplot on it."""
+    """Reads a log file or binary sample file, extracts the data, writes it out to gnuplot_dir and invokes gnuplot on it.
+    The log file is streamed to the ``.dat`` files so the memory usage is independent of the length of the log."""
     os.makedirs(gnuplot_dir, exist_ok=True)
     ret = gnuplot.write_test_file(gnuplot_dir, 'svg')
     if ret:
         logger.error(f'Can not write gnuplot test file with error code {ret}')
         return ret
-    with open(log_path) as instream:
-        json_data = extract_json(instream)
-    table, _t_min, _t_max, rss_min, rss_max = extract_json_as_table(json_data)
-    for pid in table:
+    dat_files: typing.Dict[int, typing.TextIO] = {}
+    cgroup_dat_files: typing.Dict[int, typing.TextIO] = {}
+    rss_min = {}
+    rss_max = {}
+    # List of (elapsed time, label)
+    labels: typing.List[typing.Tuple[float, str]] = []
+    try:
+        for pid, record, row in iter_json_as_table(iter_log_records(log_path)):
+            if record is None:
+                log_name = f'{os.path.basename(log_path)}_{pid}'
+                dat_files[pid] = open(os.path.join(gnuplot_dir, f'{log_name}.dat'), 'w')
+                rss_min[pid] = sys.float_info.max
+                rss_max[pid] = sys.float_info.min
+            else:
+                rss_min[pid] = min(record["memory_info"]["rss"], rss_min[pid])
+                rss_max[pid] = max(record["memory_info"]["rss"], rss_max[pid])
+                if KEY_LABEL in record:
+                    labels.append((record[KEY_ELAPSED_TIME], record[KEY_LABEL]))
+                if KEY_CGROUP in record:
+                    if pid not in cgroup_dat_files:
+                        cgroup_dat_files[pid] = open(
+                            os.path.join(gnuplot_dir, f'{os.path.basename(log_path)}_{pid}_cgroup.dat'), 'w'
+                        )
+                        cgroup_dat_files[pid].write(' '.join(CGROUP_TABLE_HEADER) + '\n')
+                    cgroup_dat_files[pid].write(' '.join(cgroup_row(record)) + '\n')
+            dat_files[pid].write(' '.join(row))
+            dat_files[pid].write('\n')
+    finally:
+        for dat_file in dat_files.values():
+            dat_file.close()
+        for dat_file in cgroup_dat_files.values():
+            dat_file.close()
+    for pid in dat_files:
         log_name = f'{os.path.basename(log_path)}_{pid}'
-        labels = extract_labels_from_json(json_data)
         label_lines = []
         y_value = (0.5 * (rss_max[pid] - rss_min[pid])) / 1024 ** 2
-        for label_dict in labels:
-            t_value = label_dict[KEY_ELAPSED_TIME]
+        for t_value, label in labels:
             label_lines.append(f'set arrow from {t_value},{y_value} to {t_value},0 lt -1 lw 1')
             label_lines.append(
-                f'set label "{label_dict[KEY_LABEL]}" at {t_value},{y_value * 1.025}'
+                f'set label "{label}" at {t_value},{y_value * 1.025}'
                 f' left font ",10" rotate by 90 noenhanced front'
             )
-        ret = gnuplot.invoke_gnuplot(
-            gnuplot_dir, log_name, table[pid],
-            GNUPLOT_PLT.format(name=log_name, extension='png', labels='\n'.join(label_lines))
+        ret = gnuplot.invoke_gnuplot_plt(
+            gnuplot_dir, log_name,
+            GNUPLOT_PLT.format(
+                name=log_name, extension='png', labels='\n'.join(label_lines),
+                cgroup_plot=GNUPLOT_PLT_CGROUP.format(name=log_name) if pid in cgroup_dat_files else '',
+            )
         )
         if ret:
             break
@@ -236,30 +373,398 @@ def invoke_gnuplot(log_path: str, gnuplot_dir: str) -> int:
 
 
 def write_log_to_stdout(log_path: str) -> None:
-    """Reads a log file, extracts the data, writes it out to gnuplot_dir and invokes gnuplot on it."""
-    with open(log_path) as instream:
-        json_data = extract_json(instream)
-    table, _t_min, _t_max, rss_min, rss_max = extract_json_as_table(json_data)
-    for pid in table:
-        print(f' PID: {pid} '.center(75, '-'))
-        for line in table[pid]:
-            print(' '.join(line))
-        print(f' PID: {pid} DONE '.center(75, '-'))
-
-
-class ProcessLoggingThread(threading.Thread):
-    """Thread that regularly logs out process parameters."""
+    """Reads a log file or binary sample file, extracts the data and writes it out to stdout grouped by process ID.
+    Rows are spooled to a temporary file per process so the memory usage is independent of the length of the log."""
+    spool_files: typing.Dict[int, typing.TextIO] = {}
+    try:
+        for pid, _record, row in iter_json_as_table(iter_log_records(log_path)):
+            if pid not in spool_files:
+                spool_files[pid] = tempfile.TemporaryFile(mode='w+')
+            spool_files[pid].write(' '.join(row))
+            spool_files[pid].write('\n')
+        for pid, spool_file in spool_files.items():
+            print(f' PID: {pid} '.center(75, '-'))
+            spool_file.seek(0)
+            for line in spool_file:
+                print(line, end='')
+            print(f' PID: {pid} DONE '.center(75, '-'))
+    finally:
+        for spool_file in spool_files.values():
+            spool_file.close()
+
+
+class FlightRecorder:
+    """A fixed size ring buffer of the most recent samples taken by a :py:class:`ProcessLoggingThread`.
+    Each value is stored in a preallocated ``array.array`` column so memory usage is fixed regardless of how long the
+    process runs.
+
+    :py:meth:`dump` writes the samples in the same format as the log so it can be read by :py:func:`iter_json`,
+    :py:func:`write_log_to_stdout` and :py:func:`invoke_gnuplot`.
+    """
 
-    def __init__(self, group=None, target=None, name=None, daemon=None,
-                 interval=1.0, log_level=logging.INFO, pid=-1,
+    def __init__(self, pid: int, size: int = FLIGHT_RECORDER_SIZE):
+        if size < 1:
+            raise ValueError(f'Flight recorder size must be >= 1 not {size}')
+        self.pid = pid
+        self.size = size
+        self._timestamp = array.array('d', bytes(8 * size))
+        self._elapsed = array.array('d', bytes(8 * size))
+        # Columns are created on the first sample as the keys depend on the platform and backend.
+        self._memory_info: typing.Dict[str, array.array] = {}
+        self._cpu_times: typing.Dict[str, array.array] = {}
+        # Labels are rare so {slot: label, ...}
+        self._labels: typing.Dict[int, str] = {}
+        # Next slot to write
+        self._index = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, timestamp: float, elapsed: float,
+            memory_info: typing.Dict[str, int], cpu_times: typing.Dict[str, float],
+            label: typing.Optional[str] = None) -> None:
+        """Add a sample, overwriting the oldest one if full.
+        timestamp is from ``time.time()``, elapsed is the elapsed time of the process in seconds."""
+        with self._lock:
+            i = self._index
+            self._timestamp[i] = timestamp
+            self._elapsed[i] = elapsed
+            for k, v in memory_info.items():
+                if k not in self._memory_info:
+                    self._memory_info[k] = array.array('q', bytes(8 * self.size))
+                self._memory_info[k][i] = v
+            for k, v in cpu_times.items():
+                if k not in self._cpu_times:
+                    self._cpu_times[k] = array.array('d', bytes(8 * self.size))
+                self._cpu_times[k][i] = v
+            if label is not None:
+                self._labels[i] = label
+            elif self._labels:
+                self._labels.pop(i, None)
+            self._index = (i + 1) % self.size
+            if self._count < self.size:
+                self._count += 1
+
+    def records(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Returns the samples, oldest first, as dicts in the same form as the JSON written to the log."""
+        with self._lock:
+            start = (self._index - self._count) % self.size
+            ret = []
+            for n in range(self._count):
+                i = (start + n) % self.size
+                record = {
+                    KEY_TIMESTAMP: datetime.datetime.fromtimestamp(self._timestamp[i]).strftime(DATETIME_NOW_FORMAT),
+                    'memory_info': {k: v[i] for k, v in self._memory_info.items()},
+                    'cpu_times': {k: v[i] for k, v in self._cpu_times.items()},
+                    KEY_ELAPSED_TIME: self._elapsed[i],
+                    KEY_PROCESS_ID: self.pid,
+                }
+                if i in self._labels:
+                    record[KEY_LABEL] = self._labels[i]
+                ret.append(record)
+        return ret
+
+    def dump(self, ostream: typing.TextIO) -> int:
+        """Writes the samples, oldest first, as log lines and returns the number written."""
+        records = self.records()
+        for record in records:
+            ostream.write(f'{record[KEY_TIMESTAMP]} {LOGGER_PREFIX} {json.dumps(record)}\n')
+        return len(records)
+
+
+class BinarySampleWriter:
+    """Appends fixed size binary records of process samples to a file, see :py:data:`BINARY_RECORD`.
+    This avoids the cost of formatting, logging and later parsing JSON. Use :py:func:`load_binary_samples` to read it.
+    Labels are written to a file alongside with the suffix :py:data:`BINARY_LABELS_SUFFIX`.
+    The files are flushed at most every flush_interval seconds and on close so that a crash loses little."""
+
+    def __init__(self, path: str, flush_interval: float = BINARY_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        self._file = open(path, 'wb')
+        self._file.write(BINARY_MAGIC)
+        self._labels_file = open(path + BINARY_LABELS_SUFFIX, 'w')
+        self._label_count = 0
+        self._lock = threading.Lock()
+
+    def write(self, timestamp_ns: int, pid: int, elapsed_time: float,
+              memory_info: typing.Dict[str, int], cpu_times: typing.Dict[str, float],
+              label: typing.Optional[str] = None) -> None:
+        """Write a sample."""
+        with self._lock:
+            if label is None:
+                label_id = -1
+            else:
+                label_id = self._label_count
+                self._label_count += 1
+                self._labels_file.write(json.dumps(label) + '\n')
+            self._file.write(
+                BINARY_RECORD.pack(
+                    timestamp_ns, pid, memory_info['rss'], memory_info['vms'], memory_info.get('pfaults', -1),
+                    label_id, elapsed_time, cpu_times['user'], cpu_times['system'],
+                )
+            )
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._labels_file.flush()
+                self._last_flush = now
+
+    def flush(self) -> None:
+        """Flush the files."""
+        with self._lock:
+            self._file.flush()
+            self._labels_file.flush()
+
+    def close(self) -> None:
+        """Close the files."""
+        with self._lock:
+            self._file.close()
+            self._labels_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+class BinarySamples:
+    """The contents of a binary sample file as columns.
+    ``columns`` is ``{name : array.array, ...}`` with the names from :py:data:`BINARY_COLUMNS`.
+    ``labels`` is the list of labels indexed by the 'label_id' column."""
+
+    def __init__(self, columns: typing.Dict[str, array.array], labels: typing.List[str]):
+        self.columns = columns
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return len(self.columns['timestamp_ns'])
+
+    def records(self) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+        """Yields the samples as dicts in the same form as :py:func:`iter_json`."""
+        columns = [self.columns[name] for name in BINARY_COLUMNS]
+        for timestamp_ns, pid, rss, vms, pfaults, label_id, elapsed_time, user, system in zip(*columns):
+            memory_info = {'rss': rss, 'vms': vms}
+            if pfaults >= 0:
+                memory_info['pfaults'] = pfaults
+            record = {
+                KEY_TIMESTAMP: datetime.datetime.fromtimestamp(timestamp_ns / 1e9),
+                'memory_info': memory_info,
+                'cpu_times': {'user': user, 'system': system},
+                KEY_ELAPSED_TIME: elapsed_time,
+                KEY_PROCESS_ID: pid,
+            }
+            if label_id >= 0:
+                record[KEY_LABEL] = self.labels[label_id]
+            yield record
+
+
+def is_binary_sample_file(path: str) -> bool:
+    """Returns True if the file is a binary sample file written by :py:class:`BinarySampleWriter`."""
+    with open(path, 'rb') as file:
+        return file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def load_binary_samples(path: str) -> BinarySamples:
+    """Loads a binary sample file written by :py:class:`BinarySampleWriter`.
+    The columns are extracted with strided memoryview slices so there is no per record Python code.
+    A partial record at the end, for example if the writer was killed, is ignored."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise ValueError(f'{path} is not a binary sample file.')
+    body = memoryview(data)[len(BINARY_MAGIC):]
+    count = len(body) // BINARY_RECORD.size
+    body = body[:count * BINARY_RECORD.size]
+    num_fields = len(BINARY_COLUMNS)
+    columns = {}
+    if sys.byteorder == 'little':
+        int64s = body.cast('q')
+        float64s = body.cast('d')
+        for i, name in enumerate(BINARY_COLUMNS):
+            if i < 6:
+                columns[name] = array.array('q', int64s[i::num_fields].tolist())
+            else:
+                columns[name] = array.array('d', float64s[i::num_fields].tolist())
+    else:
+        for i, name in enumerate(BINARY_COLUMNS):
+            columns[name] = array.array('q' if i < 6 else 'd')
+        for values in BINARY_RECORD.iter_unpack(body):
+            for name, value in zip(BINARY_COLUMNS, values):
+                columns[name].append(value)
+    labels = []
+    labels_path = path + BINARY_LABELS_SUFFIX
+    if os.path.exists(labels_path):
+        with open(labels_path) as file:
+            labels = [json.loads(line) for line in file]
+    return BinarySamples(columns, labels)
+
+
+def iter_log_records(log_path: str) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Yields the records from either a log file or a binary sample file."""
+    if is_binary_sample_file(log_path):
+        yield from load_binary_samples(log_path).records()
+    else:
+        with open(log_path) as instream:
+            yield from iter_json(instream)
+
+
+class RSSAlertEvent(typing.NamedTuple):
+    """Passed to the callback of a :py:class:`RSSAlert` when it fires."""
+    kind: str
+    threshold: float
+    #: The value compared to the threshold, bytes, bytes per second or percent depending on the kind.
+    value: float
+    rss: int
+    elapsed_time: float
+    pid: int
+
+
+@dataclasses.dataclass
+class RSSAlert:
+    """An alert on the RSS of a process that calls ``callback(RSSAlertEvent)`` when the threshold is reached.
+    kind is one of :py:data:`ALERT_KINDS`. The alert does not fire again until cooldown seconds have elapsed.
+    window is the sliding window in seconds for :py:data:`ALERT_RSS_SLOPE`."""
+    kind: str
+    threshold: float
+    callback: typing.Callable[[RSSAlertEvent], typing.Any]
+    cooldown: float = 60.0
+    window: float = 10.0
+
+    def __post_init__(self):
+        if self.kind not in ALERT_KINDS:
+            raise ValueError(f'Alert kind must be one of {ALERT_KINDS} not {self.kind!r}')
+        if self.kind == ALERT_RSS_SLOPE and self.window <= 0:
+            raise ValueError(f'Alert window must be > 0 not {self.window}')
+
+
+class RSSAlertMonitor:
+    """Evaluates a sequence of :py:class:`RSSAlert` incrementally, one sample at a time."""
+
+    def __init__(self, alerts: typing.Iterable[RSSAlert]):
+        self.alerts = list(alerts)
+        self._rss_start: typing.Optional[int] = None
+        # Elapsed time that each alert last fired.
+        self._fired: typing.List[float] = [-sys.float_info.max] * len(self.alerts)
+        # For slope alerts deque of (elapsed_time, rss) where the first is the latest sample at or before the window.
+        self._windows: typing.List[typing.Deque[typing.Tuple[float, int]]] = [
+            collections.deque() for _alert in self.alerts
+        ]
+
+    def _value(self, index: int, elapsed_time: float, rss: int) -> typing.Optional[float]:
+        """Returns the value to compare with the threshold or None if not yet known."""
+        alert = self.alerts[index]
+        if alert.kind == ALERT_RSS_LIMIT:
+            return rss
+        if alert.kind == ALERT_RSS_GROWTH:
+            if self._rss_start:
+                return 100.0 * (rss - self._rss_start) / self._rss_start
+            return None
+        window = self._windows[index]
+        window.append((elapsed_time, rss))
+        while len(window) > 1 and window[1][0] <= elapsed_time - alert.window:
+            window.popleft()
+        t_start, rss_start = window[0]
+        if elapsed_time - t_start < alert.window:
+            return None
+        return (rss - rss_start) / (elapsed_time - t_start)
+
+    def update(self, elapsed_time: float, rss: int, pid: int) -> typing.List[RSSAlertEvent]:
+        """Add a sample and call the callbacks of any alerts that fire. Returns the events that were fired.
+        Exceptions raised by a callback are logged and otherwise ignored."""
+        if self._rss_start is None:
+            self._rss_start = rss
+        ret = []
+        for i, alert in enumerate(self.alerts):
+            value = self._value(i, elapsed_time, rss)
+            if value is not None and value >= alert.threshold and elapsed_time - self._fired[i] >= alert.cooldown:
+                self._fired[i] = elapsed_time
+                event = RSSAlertEvent(alert.kind, alert.threshold, value, rss, elapsed_time, pid)
+                logger.warning(f'RSS alert: {event}')
+                try:
+                    alert.callback(event)
+                except Exception:
+                    logger.exception(f'RSS alert callback failed for {event}')
+                ret.append(event)
+        return ret
+
+
+#: Prefix of the Prometheus metric names, see :py:func:`process_data_as_prometheus`.
+PROMETHEUS_METRIC_PREFIX = prometheus_exporter.metric_name(prometheus_exporter.METRIC_PREFIX, 'process')
+
+
+def process_data_as_prometheus(records: typing.Iterable[typing.Dict[str, typing.Any]]) -> str:
+    """Returns the process data, as logged, as Prometheus text with a gauge for each value labelled by pid.
+    The metric names are, for example, ``pymemtrace_process_memory_info_rss`` or ``pymemtrace_process_cpu_times_user``.
+    If there is more than one record for a PID the last one is used.
+    Negative values, such as the -1 for an unavailable USS or an unlimited cgroup ``max``, are omitted."""
+    latest = {record[KEY_PROCESS_ID]: record for record in records}
+    gauges = {}
+
+    def add(name: str, help_text: str, pid: int, value: typing.Any) -> None:
+        if prometheus_exporter.is_sample_value(value) and value < 0:
+            return
+        if name not in gauges:
+            gauges[name] = (help_text, [])
+        gauges[name][1].append(({'pid': pid}, value))
+
+    for pid, record in latest.items():
+        add(prometheus_exporter.metric_name(PROMETHEUS_METRIC_PREFIX, KEY_ELAPSED_TIME),
+            'Time since the process was created.', pid, record[KEY_ELAPSED_TIME])
+        for key in ('memory_info', 'cpu_times', KEY_CGROUP):
+            for name, value in record.get(key, {}).items():
+                add(prometheus_exporter.metric_name(PROMETHEUS_METRIC_PREFIX, key, name), f'{key} {name}.', pid, value)
+    return prometheus_exporter.format_gauges(gauges)
+
+
+class ProcessSampler:
+    """Samples process parameters and writes them to the log, a flight recorder or a binary file.
+    This does not schedule the sampling itself, see :py:class:`ProcessLoggingThread` and :py:func:`alog_process`."""
+
+    def __init__(self, interval=1.0, log_level=logging.INFO, pid=-1, backend='auto',
+                 flight_recorder=False, flight_recorder_size=FLIGHT_RECORDER_SIZE, flight_recorder_dir=None,
+                 flight_recorder_rss_threshold=0, alerts=None, include_children=False, binary_path=None,
+                 smaps_rollup=False, cgroup_memory=False, http_port=None,
                  ):
         """Constructor.
         args[0], or interval=... must be the reporting interval in seconds, default 1.0.
         args[1], or log_level=... must be the log level to report with, default logging.INFO.
+        backend=... is one of :py:data:`BACKENDS`, default 'auto'.
+
+        If flight_recorder is True then samples are not logged but the last flight_recorder_size are kept in a
+        :py:class:`FlightRecorder`. This is dumped to a file in flight_recorder_dir (default the current directory) by
+        :py:meth:`dump_flight_recorder`, when the RSS first exceeds flight_recorder_rss_threshold bytes (if non-zero)
+        or, if constructed in the main thread, on receipt of SIGUSR2.
+
+        alerts=... is an iterable of :py:class:`RSSAlert` that are evaluated on every sample.
+
+        If include_children is True then every child process, recursively, is also sampled and logged with its own
+        :py:data:`KEY_PROCESS_ID`. Children are discovered on every sample so they can come and go.
+        Labels and alerts only apply to the process itself and children are not sampled in flight recorder mode.
+
+        If binary_path is given then samples are written to that file by a :py:class:`BinarySampleWriter` rather than
+        logged. This can not be combined with flight_recorder.
+
+        If smaps_rollup is True then ``'pss'``, ``'uss'``, ``'swap'`` and ``'anonymous'`` are added to the memory info
+        from ``/proc/<pid>/smaps_rollup``, see :py:func:`pymemtrace.proc_fs.read_smaps_rollup`, or psutil's
+        ``memory_full_info()`` if that is not available. These are not written to the binary file.
+
+        If cgroup_memory is True then the cgroup v2 memory accounting of the process is added to the logged JSON with
+        the key :py:data:`KEY_CGROUP`, see :py:mod:`pymemtrace.cgroup`. cgroup_memory can also be the path to the
+        cgroup directory. This is ignored, with a warning, if the process is not in a cgroup v2 hierarchy with the
+        memory controller. It is not written to the flight recorder or binary file.
+
+        If http_port is not None then the latest logged sample of the process, and any children, is served as
+        Prometheus text on that port, see :py:func:`process_data_as_prometheus`. This is not available in flight
+        recorder or binary mode.
         """
-        if name is None:
-            name = 'ProcMon'
-        super().__init__(group=group, target=target, name=name, daemon=daemon)
+        if flight_recorder and binary_path is not None:
+            raise ValueError('Can not use both flight_recorder and binary_path')
         self._interval = interval
         self._log_level = log_level
         self._pid = pid
@@ -268,53 +773,315 @@ class ProcessLoggingThread(threading.Thread):
         else:
             self._process = psutil.Process()
             self._pid = self._process.pid
+        # This does not change so avoid a system call on every sample.
+        self._create_time = self._process.create_time()
+        if backend not in BACKENDS:
+            raise ValueError(f'Backend must be one of {BACKENDS} not {backend!r}')
+        if backend == 'auto':
+            backend = 'proc' if proc_fs.is_available() else 'psutil'
+        self.backend = backend
+        self._proc_reader: typing.Optional[proc_fs.ProcReader] = None
+        if self.backend == 'proc':
+            self._proc_reader = proc_fs.ProcReader(self._pid)
+        self._include_children = include_children
+        self._smaps_rollup = smaps_rollup
+        self._cgroup_reader: typing.Optional[cgroup.CGroupMemoryReader] = None
+        if cgroup_memory:
+            if isinstance(cgroup_memory, str):
+                cgroup_path = cgroup_memory
+            else:
+                cgroup_path = cgroup.cgroup_path_of_pid(self._pid)
+            if cgroup_path is None:
+                logger.warning(f'Process {self._pid} is not in a cgroup v2 hierarchy with the memory controller.')
+            else:
+                self._cgroup_reader = cgroup.CGroupMemoryReader(cgroup_path)
+        # {pid : (psutil.Process, ProcReader or None, create_time), ...}
+        self._children: typing.Dict[
+            int, typing.Tuple[psutil.Process, typing.Optional[proc_fs.ProcReader], float]
+        ] = {}
+        # ProcessLoggingThread.join() samples from a different thread.
+        self._children_lock = threading.Lock()
         # Message passing
         self.process_queue = queue.Queue()
         self._run = True
+        self._alert_monitor: typing.Optional[RSSAlertMonitor] = None
+        if alerts:
+            self._alert_monitor = RSSAlertMonitor(alerts)
+        self._binary_writer: typing.Optional[BinarySampleWriter] = None
+        if binary_path is not None:
+            self._binary_writer = BinarySampleWriter(binary_path)
+        self.prometheus_exporter: typing.Optional[prometheus_exporter.PrometheusExporter] = None
+        if http_port is not None:
+            self.prometheus_exporter = prometheus_exporter.PrometheusExporter(http_port)
+        # Flight recorder
+        self.flight_recorder: typing.Optional[FlightRecorder] = None
+        self._flight_recorder_dir = flight_recorder_dir if flight_recorder_dir is not None else os.getcwd()
+        self._flight_recorder_rss_threshold = flight_recorder_rss_threshold
+        self._flight_recorder_rss_exceeded = False
+        self._flight_recorder_dump_requested = threading.Event()
+        self._previous_sigusr2_handler = None
+        if flight_recorder:
+            self.flight_recorder = FlightRecorder(self._pid, flight_recorder_size)
+            if hasattr(signal, 'SIGUSR2') and threading.current_thread() is threading.main_thread():
+                self._previous_sigusr2_handler = signal.signal(signal.SIGUSR2, self._sigusr2_handler)
 
     def add_message_to_queue(self, msg: str) -> None:
         """Adds a message onto the queue."""
         self.process_queue.put(msg)
 
+    def _sample(self, process: psutil.Process, proc_reader: typing.Optional[proc_fs.ProcReader]) \
+            -> typing.Tuple[typing.Dict[str, int], typing.Dict[str, float]]:
+        """Returns the memory info and CPU times from the backend."""
+        if proc_reader is not None:
+            memory_info, cpu_times = proc_reader.memory_info_and_cpu_times()
+        else:
+            memory_info, cpu_times = process.memory_info()._asdict(), process.cpu_times()._asdict()
+        if self._smaps_rollup:
+            memory_info.update(self._sample_smaps_rollup(process, proc_reader))
+        return memory_info, cpu_times
+
+    @staticmethod
+    def _sample_smaps_rollup(process: psutil.Process, proc_reader: typing.Optional[proc_fs.ProcReader]) \
+            -> typing.Dict[str, int]:
+        """Returns the PSS, USS, swap and anonymous memory that are available, this may be empty."""
+        try:
+            if proc_reader is not None:
+                return proc_reader.memory_smaps_rollup()
+            mem_info = process.memory_full_info()
+            return {k: getattr(mem_info, k) for k in ('pss', 'uss', 'swap') if hasattr(mem_info, k)}
+        except (PermissionError, FileNotFoundError, psutil.AccessDenied):
+            return {}
+
+    def _update_children(self) -> None:
+        """Updates the child processes to sample adding new ones and removing those that have gone."""
+        try:
+            children = self._process.children(recursive=True)
+        except psutil.Error:
+            children = []
+        current = {}
+        for child in children:
+            # psutil.Process equality includes the create time so this detects PID reuse.
+            if child.pid in self._children and self._children[child.pid][0] == child:
+                current[child.pid] = self._children.pop(child.pid)
+            else:
+                try:
+                    proc_reader = proc_fs.ProcReader(child.pid) if self.backend == 'proc' else None
+                    current[child.pid] = (child, proc_reader, child.create_time())
+                except (psutil.Error, OSError):
+                    # Gone already.
+                    pass
+        self._close_children()
+        self._children = current
+
+    def _close_children(self) -> None:
+        """Close any open files for the child processes and forget them."""
+        for _child, proc_reader, _create_time in self._children.values():
+            if proc_reader is not None:
+                proc_reader.close()
+        self._children = {}
+
+    def _sample_children(self) -> typing.List[
+        typing.Tuple[int, float, typing.Dict[str, int], typing.Dict[str, float]]
+    ]:
+        """Returns ``[(pid, elapsed_time, memory_info, cpu_times), ...]`` for each child process."""
+        ret = []
+        with self._children_lock:
+            self._update_children()
+            for pid, (child, proc_reader, create_time) in self._children.items():
+                try:
+                    memory_info, cpu_times = self._sample(child, proc_reader)
+                except (psutil.Error, OSError):
+                    # Gone since _update_children(), will be removed next time.
+                    continue
+                ret.append((pid, time.time() - create_time, memory_info, cpu_times))
+        return ret
+
+    def _get_children_data(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Returns the process data for each child process."""
+        timestamp = datetime.datetime.now().strftime(DATETIME_NOW_FORMAT)
+        return [
+            {
+                KEY_TIMESTAMP: timestamp,
+                'memory_info': memory_info,
+                'cpu_times': cpu_times,
+                KEY_ELAPSED_TIME: elapsed_time,
+                KEY_PROCESS_ID: pid,
+            } for pid, elapsed_time, memory_info, cpu_times in self._sample_children()
+        ]
+
     def _get_process_data(self, **kwargs):
         ret = {
             KEY_TIMESTAMP: datetime.datetime.now().strftime(DATETIME_NOW_FORMAT),
         }
-        ret.update(
-            {
-                k: getattr(self._process, k)()._asdict() for k in ('memory_info', 'cpu_times')
-            }
-        )
-        ret[KEY_ELAPSED_TIME] = time.time() - self._process.create_time()
-        ret[KEY_PROCESS_ID] = self._process.pid
+        ret['memory_info'], ret['cpu_times'] = self._sample(self._process, self._proc_reader)
+        ret[KEY_ELAPSED_TIME] = time.time() - self._create_time
+        ret[KEY_PROCESS_ID] = self._pid
+        if self._cgroup_reader is not None:
+            ret[KEY_CGROUP] = self._cgroup_reader.read()
         # WARNING: This is super verbose and leaks information such as user, environment etc. into the log file.
         # ret.update(self._process.as_dict())
         # kwargs trump everything
         ret.update(kwargs)
         return ret
 
+    def _sigusr2_handler(self, signum, frame) -> None:
+        """Signal handler, the dump is done by the sampling thread."""
+        self._flight_recorder_dump_requested.set()
+
+    def dump_flight_recorder(self, path: typing.Optional[str] = None) -> str:
+        """Writes the flight recorder to a file and returns the path.
+        If path is None the file is in flight_recorder_dir with a name that includes the PID and the current time."""
+        if self.flight_recorder is None:
+            raise ValueError('This ProcessLoggingThread was not created with flight_recorder=True')
+        if path is None:
+            path = os.path.join(
+                self._flight_recorder_dir,
+                f'{FLIGHT_RECORDER_FILE_PREFIX}_{self._pid}_{datetime.datetime.now():%Y%m%d_%H%M%S_%f}.log'
+            )
+        with open(path, 'w') as ostream:
+            count = self.flight_recorder.dump(ostream)
+        logger.log(self._log_level, f'Dumped {count} flight recorder samples to {path}')
+        return path
+
+    def _get_labels(self) -> typing.List[typing.Optional[str]]:
+        """Empties the message queue and returns the messages or ``[None]`` if there are none."""
+        ret = []
+        while not self.process_queue.empty():
+            ret.append(self.process_queue.get())
+        return ret or [None]
+
+    def _write_to_binary(self) -> None:
+        """Write process data, and that of any children, to the binary file."""
+        memory_info, cpu_times = self._sample(self._process, self._proc_reader)
+        timestamp_ns = time.time_ns()
+        elapsed = timestamp_ns / 1e9 - self._create_time
+        if self._alert_monitor is not None:
+            self._alert_monitor.update(elapsed, memory_info['rss'], self._pid)
+        for label in self._get_labels():
+            self._binary_writer.write(timestamp_ns, self._pid, elapsed, memory_info, cpu_times, label)
+        if self._include_children:
+            for pid, elapsed, memory_info, cpu_times in self._sample_children():
+                self._binary_writer.write(timestamp_ns, pid, elapsed, memory_info, cpu_times)
+
+    def _write_to_flight_recorder(self) -> None:
+        """Add process data to the flight recorder and dump it if triggered."""
+        memory_info, cpu_times = self._sample(self._process, self._proc_reader)
+        timestamp = time.time()
+        elapsed = timestamp - self._create_time
+        if self._alert_monitor is not None:
+            self._alert_monitor.update(elapsed, memory_info['rss'], self._pid)
+        for label in self._get_labels():
+            self.flight_recorder.add(timestamp, elapsed, memory_info, cpu_times, label)
+        if self._flight_recorder_rss_threshold:
+            if memory_info['rss'] >= self._flight_recorder_rss_threshold:
+                if not self._flight_recorder_rss_exceeded:
+                    self._flight_recorder_rss_exceeded = True
+                    self.dump_flight_recorder()
+            else:
+                self._flight_recorder_rss_exceeded = False
+        if self._flight_recorder_dump_requested.is_set():
+            self._flight_recorder_dump_requested.clear()
+            self.dump_flight_recorder()
+
     def _write_to_log(self, prefix: str) -> None:
         """Write process data to log flushing message queue if necessary."""
         if self._run:
+            if self.flight_recorder is not None:
+                self._write_to_flight_recorder()
+                return
+            if self._binary_writer is not None:
+                self._write_to_binary()
+                return
+            records = []
             if self.process_queue.empty():
-                logger.log(self._log_level, f'{prefix} {json.dumps(self._get_process_data())}')
+                records.append(self._get_process_data())
+                self._log_process_data(prefix, records[-1])
             else:
                 while not self.process_queue.empty():
                     msg = self.process_queue.get()
-                    logger.log(self._log_level, f'{prefix} {json.dumps(self._get_process_data(label=msg))}')
+                    records.append(self._get_process_data(label=msg))
+                    self._log_process_data(prefix, records[-1])
+            # Evaluate the alerts once per sample, not once per label, with the latest data.
+            if self._alert_monitor is not None:
+                self._alert_monitor.update(records[-1][KEY_ELAPSED_TIME], records[-1]['memory_info']['rss'], self._pid)
+            if self._include_children:
+                for data in self._get_children_data():
+                    logger.log(self._log_level, f'{prefix} {json.dumps(data)}')
+                    records.append(data)
+            if self.prometheus_exporter is not None:
+                self.prometheus_exporter.update(process_data_as_prometheus(records))
+
+    def _log_process_data(self, prefix: str, data: typing.Dict[str, typing.Any]) -> None:
+        """Write the process data to the log."""
+        logger.log(self._log_level, f'{prefix} {json.dumps(data)}')
+
+    @property
+    def interval(self) -> float:
+        """The sampling interval in seconds."""
+        return self._interval
+
+    @property
+    def samples_without_blocking(self) -> bool:
+        """True if a sample is only ``os.pread()`` of the open ``/proc`` files of the process, that is the 'proc'
+        backend without children, smaps_rollup, a flight recorder or a binary file.
+        Only then is it reasonable to sample on an event loop, see :py:func:`alog_process`."""
+        return (
+                self.backend == 'proc' and not self._include_children and not self._smaps_rollup
+                and self.flight_recorder is None and self._binary_writer is None
+        )
+
+    def close(self) -> None:
+        """Stop sampling and close any open files."""
+        self._run = False
+        if self._proc_reader is not None:
+            self._proc_reader.close()
+        with self._children_lock:
+            self._close_children()
+        if self._binary_writer is not None:
+            self._binary_writer.close()
+        if self._cgroup_reader is not None:
+            self._cgroup_reader.close()
+        if self.prometheus_exporter is not None:
+            self.prometheus_exporter.close()
+        if self._previous_sigusr2_handler is not None and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR2, self._previous_sigusr2_handler)
+            self._previous_sigusr2_handler = None
+
+
+class ProcessLoggingThread(ProcessSampler, threading.Thread):
+    """Thread that regularly logs out process parameters."""
+
+    def __init__(self, group=None, target=None, name=None, daemon=None, *args, **kwargs):
+        """Constructor. Other arguments are passed to :py:class:`ProcessSampler`.
+        args[0], or interval=... must be the reporting interval in seconds, default 1.0.
+        args[1], or log_level=... must be the log level to report with, default logging.INFO.
+        """
+        if name is None:
+            name = 'ProcMon'
+        ProcessSampler.__init__(self, *args, **kwargs)
+        threading.Thread.__init__(self, group=group, target=target, name=name, daemon=daemon)
 
     def run(self) -> None:
-        """thread.run(). Write to log then sleep."""
+        """thread.run(). Write to log then sleep.
+        The sleep is until the next deadline so that the time taken to sample does not accumulate as drift."""
         self._write_to_log(LOGGER_PREFIX_START)
+        next_time = time.monotonic()
         while self._run:
-            time.sleep(self._interval)
+            next_time += self._interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Running behind, do not try to catch up.
+                next_time = time.monotonic()
             self._write_to_log(LOGGER_PREFIX)
 
     def join(self, *args, **kwargs):
         """thread.join(). Write to log last time."""
         self._write_to_log(LOGGER_PREFIX_STOP)
         self._run = False
-        super().join(*args, **kwargs)
+        threading.Thread.join(self, *args, **kwargs)
+        self.close()
 
 
 @contextlib.contextmanager
@@ -328,6 +1095,67 @@ def log_process(*args, **kwargs):
         process_thread.join()
 
 
+async def _async_sample(sampler: ProcessSampler, stop: asyncio.Event, use_executor: bool) -> None:
+    """Samples until stop is set. The wait is until the next deadline so sampling time does not cause drift."""
+    loop = asyncio.get_running_loop()
+
+    async def write(prefix: str) -> None:
+        if use_executor:
+            await loop.run_in_executor(None, sampler._write_to_log, prefix)
+        else:
+            sampler._write_to_log(prefix)
+
+    await write(LOGGER_PREFIX_START)
+    next_time = loop.time()
+    while True:
+        next_time += sampler.interval
+        delay = next_time - loop.time()
+        if delay <= 0:
+            # Running behind, do not try to catch up.
+            next_time = loop.time()
+            delay = 0
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+            return
+        except asyncio.TimeoutError:
+            pass
+        await write(LOGGER_PREFIX)
+
+
+@contextlib.asynccontextmanager
+async def alog_process(*args, use_executor=False, **kwargs):
+    """Asynchronous context manager to log process data at regular intervals from a task on the running event loop
+    rather than a thread. Arguments are passed to :py:class:`ProcessSampler` which is yielded so that
+    ``add_message_to_queue()`` can be used to add labels.
+
+    With the 'proc' backend a sample is a couple of reads of ``/proc`` that never block on I/O so by default sampling
+    is done on the event loop. If use_executor is True, or the sampler does other work such as sampling children or
+    writing to a file (see :py:attr:`ProcessSampler.samples_without_blocking`), each sample is done in the default
+    executor instead.
+
+    Usage:
+
+    .. code-block:: python
+
+        async with process.alog_process(interval=0.1) as sampler:
+            sampler.add_message_to_queue('Label')
+            await do_work()
+    """
+    sampler = ProcessSampler(*args, **kwargs)
+    use_executor = use_executor or not sampler.samples_without_blocking
+    stop = asyncio.Event()
+    task = asyncio.get_running_loop().create_task(_async_sample(sampler, stop, use_executor))
+    try:
+        yield sampler
+    finally:
+        stop.set()
+        try:
+            await task
+        finally:
+            sampler._write_to_log(LOGGER_PREFIX_STOP)
+            sampler.close()
+
+
 def log_process_dec(*dec_args, **dec_kwargs):
     """A decorator that calls the function within a ProcessLoggingThread context manager."""
 
@@ -366,6 +1194,28 @@ def main() -> int:
                         help="Log Level (debug=10, info=20, warning=30, error=40, critical=50)"
                              " [default: %(default)s]"
                         )
+    parser.add_argument('-b', '--backend', type=str, choices=BACKENDS, default='auto',
+                        help='Sampling backend, \'proc\' reads /proc directly (Linux only), \'psutil\' uses psutil.'
+                             ' [default: %(default)s]')
+    parser.add_argument('-c', '--include-children', action='store_true',
+                        help='Also log all child processes. [default: %(default)s]')
+    parser.add_argument('-m', '--smaps', action='store_true',
+                        help='Add PSS, USS, swap and anonymous memory from /proc/<pid>/smaps_rollup.'
+                             ' [default: %(default)s]')
+    parser.add_argument('--cgroup', action='store_true',
+                        help='Add the cgroup v2 memory accounting of the process. [default: %(default)s]')
+    parser.add_argument('--http-port', type=int, default=None,
+                        help='Serve the latest sample as Prometheus text on this port, 0 lets the OS choose.'
+                             ' [default: %(default)s]')
+    parser.add_argument('--binary', type=str, default='',
+                        help='Write samples to this binary file rather than the log. [default: %(default)s]')
+    parser.add_argument('--flight-recorder', type=int, default=0,
+                        help='If non-zero keep this many samples in memory rather than logging them.'
+                             ' They are written to a file on SIGUSR2 or if --flight-recorder-rss is exceeded.'
+                             ' [default: %(default)s]')
+    parser.add_argument('--flight-recorder-rss', type=int, default=0,
+                        help='Dump the flight recorder when the RSS first exceeds this many bytes, 0 never.'
+                             ' [default: %(default)s]')
     parser.add_argument('path_in', type=str, help='Input path of the log file.', nargs='?')
     parser.add_argument('path_out', type=str, help='Output directory for gnuplot data.', nargs='?')
     args = parser.parse_args()
@@ -385,7 +1235,14 @@ def main() -> int:
     else:
         # Log another process or self
         logger.info('Demonstration of logging a process')
-        with log_process(interval=args.interval, log_level=args.log_level, pid=args.pid) as process_thread:
+        with log_process(interval=args.interval, log_level=args.log_level, pid=args.pid,
+                         backend=args.backend, flight_recorder=args.flight_recorder > 0,
+                         flight_recorder_size=max(args.flight_recorder, 1),
+                         flight_recorder_rss_threshold=args.flight_recorder_rss,
+                         include_children=args.include_children,
+                         binary_path=args.binary if args.binary else None,
+                         smaps_rollup=args.smaps, cgroup_memory=args.cgroup,
+                         http_port=args.http_port) as process_thread:
             try:
                 while True:
                     time.sleep(1000)
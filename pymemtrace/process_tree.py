@@ -2,6 +2,7 @@
 This monitors a process **and** all its child processes.
 """
 import argparse
+import concurrent.futures
 import dataclasses
 import json
 import logging
@@ -13,6 +14,10 @@ import typing
 import colorama
 import psutil
 
+from pymemtrace import cgroup
+from pymemtrace import proc_fs
+from pymemtrace import prometheus_exporter
+
 logger = logging.getLogger(__file__)
 
 colorama.init(autoreset=True)
@@ -26,6 +31,16 @@ class ColumnWidthFormat:
     format: str
 
 
+#: :py:attr:`WriteSummaryColumn.aggregate` for additive values, the subtree aggregate is the sum.
+AGGREGATE_SUM = 'sum'
+#: :py:attr:`WriteSummaryColumn.aggregate` for other values, the subtree aggregate is the maximum.
+AGGREGATE_MAX = 'max'
+#: Prefix of the subtree aggregate column names.
+AGGREGATE_PREFIX = '\u03a3'
+#: Value returned by getters such as :py:meth:`ProcessTree.get_memory_uss` when the value is not available.
+UNAVAILABLE = proc_fs.SMAPS_ROLLUP_UNAVAILABLE
+
+
 @dataclasses.dataclass
 class WriteSummaryColumn:
     """Specifies the column to write out in the summary."""
@@ -36,6 +51,8 @@ class WriteSummaryColumn:
     units: str
     width_and_format: ColumnWidthFormat
     width_and_format_diff: typing.Optional[ColumnWidthFormat]
+    # How to aggregate this column over a subtree, AGGREGATE_SUM, AGGREGATE_MAX or None for no aggregate.
+    aggregate: typing.Optional[str] = None
 
     def name_and_units(self) -> str:
         if self.units:
@@ -48,11 +65,139 @@ class WriteSummaryConfig:
     """What to write out in the summary."""
     columns: typing.List[WriteSummaryColumn]
     json_file_path: str
+    # If True write the subtree aggregate, see WriteSummaryColumn.aggregate, after each column that has one.
+    subtree_aggregates: bool = False
+
+
+#: Default maximum number of threads used to sample the processes concurrently.
+DEFAULT_MAX_WORKERS = 4
+
+
+@dataclasses.dataclass
+class ProcessSnapshot:
+    """The sampled values of a process, and its children, at a moment in time.
+    This separates sampling, which may be done concurrently, from writing the text or JSON."""
+    pid: int
+    name: str = ''
+    exec_time: float = 0.0
+    # {column name : value, ...} in column order. If sampling failed part way through this is incomplete.
+    values: typing.Dict[str, typing.Any] = dataclasses.field(default_factory=dict)
+    access_denied: bool = False
+    no_such_process: bool = False
+    children: typing.List['ProcessSnapshot'] = dataclasses.field(default_factory=list)
+    # {column name : value, ...} aggregated over this process and all its descendants, see aggregate().
+    aggregates: typing.Dict[str, typing.Any] = dataclasses.field(default_factory=dict)
+
+    def aggregate(self, columns: typing.List[WriteSummaryColumn]) -> None:
+        """Compute the subtree aggregates for this snapshot and all the descendants in one post-order pass.
+        Processes that have gone and values that are not available (negative) are ignored.
+        If none of the values in the subtree are available the aggregate is :py:data:`UNAVAILABLE`."""
+        # Reversed pre-order visits every child before its parent.
+        nodes = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node.children)
+        aggregated_columns = [c for c in columns if c.aggregate is not None]
+        for node in reversed(nodes):
+            node.aggregates = {}
+            for col_spec in aggregated_columns:
+                values = [
+                    child.aggregates[col_spec.name] for child in node.children
+                    if not child.no_such_process and col_spec.name in child.aggregates
+                ]
+                if col_spec.name in node.values:
+                    values.append(node.values[col_spec.name])
+                if values:
+                    values = [v for v in values if v >= 0]
+                    if not values:
+                        node.aggregates[col_spec.name] = UNAVAILABLE
+                    elif col_spec.aggregate == AGGREGATE_SUM:
+                        node.aggregates[col_spec.name] = sum(values)
+                    else:
+                        node.aggregates[col_spec.name] = max(values)
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        """Returns the snapshot, recursively, as a dict suitable for writing to JSON.
+        Subtree aggregates have the name prefixed by :py:data:`AGGREGATE_PREFIX`.
+        Children that could not be sampled are omitted."""
+        ret = {
+            'process_time': self.exec_time,
+            'pid': self.pid,
+            'name': self.name,
+        }
+        ret.update(self.values)
+        for name, value in self.aggregates.items():
+            ret[f'{AGGREGATE_PREFIX}{name}'] = value
+        ret['children'] = [
+            child.as_dict() for child in self.children if not (child.access_denied or child.no_such_process)
+        ]
+        return ret
+
+
+#: How often, in seconds, :py:class:`SnapshotNDJSONWriter` flushes the file.
+NDJSON_FLUSH_INTERVAL = 5.0
+
+
+class SnapshotNDJSONWriter:
+    """Writes each :py:class:`ProcessSnapshot` as a single line of compact JSON (NDJSON) to a file that is kept open.
+    The file is flushed at most every flush_interval seconds and on close.
+    Use :py:func:`iter_ndjson` to read it back."""
+
+    def __init__(self, path: str, flush_interval: float = NDJSON_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = open(path, 'w')
+        self._last_flush = time.monotonic()
+
+    def write(self, snapshot: ProcessSnapshot) -> None:
+        """Write the snapshot as one line."""
+        self._file.write(json.dumps(snapshot.as_dict(), separators=(',', ':')))
+        self._file.write('\n')
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._file.flush()
+            self._last_flush = now
+
+    def close(self) -> None:
+        """Flush and close the file."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def iter_ndjson(path: str) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Yields each snapshot, as a dict, from a file written by :py:class:`SnapshotNDJSONWriter` one at a time.
+    For backwards compatibility a file that is a JSON list is also accepted, that is read in one go."""
+    with open(path) as file:
+        first = file.read(1)
+        while first.isspace():
+            first = file.read(1)
+        file.seek(0)
+        if first == '[':
+            yield from json.load(file)
+            return
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
 
 
 class ProcessTree:
     """Creates a tree of psutil.Process objects"""
     DEPTH_INDENT_PREFIX = '  '
+    #: How long a :py:meth:`get_smaps_rollup` or :py:meth:`get_cgroup_memory` value is reused so that several
+    #: columns in one sample need one read.
+    GETTER_CACHE_SECONDS = 0.1
+    # {(name, pid) : (time.monotonic(), {...}), ...}
+    _getter_cache: typing.Dict[typing.Tuple[str, int], typing.Tuple[float, typing.Dict[str, int]]] = {}
+    # {cgroup path : (time.monotonic(), {...}), ...} most processes in a tree share a cgroup.
+    _cgroup_cache: typing.Dict[str, typing.Tuple[float, typing.Dict[str, int]]] = {}
 
     def __init__(self, proc: typing.Union[int, psutil.Process]):
         """Takes a PID and creates the tree of all child processes."""
@@ -64,10 +209,19 @@ class ProcessTree:
         # So that value differences can be computes between write_summary calls.
         self.previous_values = {}
 
-    def update_children(self) -> None:
+    def update_children(self, children_of: typing.Optional[typing.Dict[int, typing.List[int]]] = None) -> None:
         """Update the children process list.
         This preserves existing processes based on their ppid being the same as self.
-        It adds new ones and discards old ones."""
+        It adds new ones and discards old ones.
+
+        Where available ``/proc`` is scanned once for the whole tree, see :py:func:`pymemtrace.proc_fs.scan_ppids`,
+        and the map of ``{ppid : [pid, ...], ...}`` is passed down as children_of.
+        Otherwise psutil is used at each node which scans all processes each time."""
+        if children_of is None and proc_fs.is_available():
+            children_of = proc_fs.children_map(proc_fs.scan_ppids())
+        if children_of is not None:
+            self._update_children_from_map(children_of)
+            return
         # self.clear_children()
         # Remove orphans.
         children = []
@@ -90,6 +244,65 @@ class ProcessTree:
         for child in self.children:
             child.update_children()
 
+    def _update_children_from_map(self, children_of: typing.Dict[int, typing.List[int]]) -> None:
+        """Update the children, recursively, from a map of ``{ppid : [pid, ...], ...}``."""
+        child_pids = children_of.get(self.proc.pid, [])
+        existing = {c.proc.pid: c for c in self.children}
+        children = []
+        for pid in child_pids:
+            if pid in existing:
+                children.append(existing[pid])
+            else:
+                try:
+                    children.append(ProcessTree(pid))
+                except psutil.NoSuchProcess:
+                    pass
+        # child_pids is sorted so this is sorted by PID.
+        self.children = children
+        for child in self.children:
+            child._update_children_from_map(children_of)
+
+    def _iter_tree(self) -> typing.Iterator['ProcessTree']:
+        """Yields self and then all the children, depth first."""
+        yield self
+        for child in self.children:
+            yield from child._iter_tree()
+
+    def _sample_node(self, write_summary_config: WriteSummaryConfig) -> ProcessSnapshot:
+        """Sample this process only."""
+        snapshot = ProcessSnapshot(self.proc.pid)
+        try:
+            snapshot.exec_time = self.get_exec_time(self.proc)
+            snapshot.name = self.proc.name()
+            with self.proc.oneshot():
+                for col_spec in write_summary_config.columns:
+                    snapshot.values[col_spec.name] = col_spec.getter(self.proc)
+        except psutil.AccessDenied:
+            snapshot.access_denied = True
+        except psutil.NoSuchProcess:
+            snapshot.no_such_process = True
+        return snapshot
+
+    def sample(
+            self,
+            write_summary_config: WriteSummaryConfig,
+            executor: typing.Optional[concurrent.futures.Executor] = None,
+    ) -> ProcessSnapshot:
+        """Sample this process and all the children returning a tree of snapshots that mirrors this tree.
+        If an executor is given the processes are sampled concurrently, otherwise serially.
+        If write_summary_config.subtree_aggregates is True the aggregates are computed."""
+        nodes = list(self._iter_tree())
+        if executor is None:
+            snapshots = [node._sample_node(write_summary_config) for node in nodes]
+        else:
+            snapshots = list(executor.map(lambda node: node._sample_node(write_summary_config), nodes))
+        snapshot_of_node = {id(node): snapshot for node, snapshot in zip(nodes, snapshots)}
+        for node, snapshot in zip(nodes, snapshots):
+            snapshot.children = [snapshot_of_node[id(child)] for child in node.children]
+        if write_summary_config.subtree_aggregates:
+            snapshots[0].aggregate(write_summary_config.columns)
+        return snapshots[0]
+
     @staticmethod
     def write_header(
             write_summary_config: WriteSummaryConfig,
@@ -136,6 +349,15 @@ class ProcessTree:
                     ostream.write(f'{sep}{name_and_units:s}')
                 else:
                     ostream.write(f' {name_and_units:>{col_spec.width_and_format_diff.width}s}')
+            if write_summary_config.subtree_aggregates and col_spec.aggregate is not None:
+                if col_spec.units:
+                    name_and_units = f'{AGGREGATE_PREFIX}{col_spec.name}({col_spec.units})'
+                else:
+                    name_and_units = f'{AGGREGATE_PREFIX}{col_spec.name}'
+                if sep:
+                    ostream.write(f'{sep}{name_and_units:s}')
+                else:
+                    ostream.write(f' {name_and_units:>{col_spec.width_and_format.width}s}')
         ostream.write('\n')
 
     def load_previous(self, write_summary_config: WriteSummaryConfig) -> None:
@@ -153,35 +375,30 @@ class ProcessTree:
 
     def _write_summary_time_pid_name(
             self,
+            snapshot: ProcessSnapshot,
             depth: int,
             sep: str,
             ostream: typing.TextIO = sys.stdout,
-    ) -> int:
-        """Write the prefix for this moment in time.
-        Returns zero on success, non-zero on failure."""
-        try:
-            # Optional time and mandatory PID and name.
-            if depth == 0:
-                exec_time = self.get_exec_time(self.proc)
-                if sep:
-                    ostream.write(f'{exec_time:.1f}')
-                else:
-                    ostream.write(f'{exec_time:8.1f}')
-            else:
-                if not sep:
-                    ostream.write(f'{"":8s}')
-            if sep:
-                ostream.write(f'{sep}{self.proc.pid:d}')
-            else:
-                ostream.write(f' {self.DEPTH_INDENT_PREFIX * depth:s} {self.proc.pid:5d}')
-            proc_name = '"' + self.proc.name() + '"'
+    ) -> None:
+        """Write the prefix for this moment in time."""
+        # Optional time and mandatory PID and name.
+        if depth == 0:
             if sep:
-                ostream.write(f'{sep}{proc_name:s}')
+                ostream.write(f'{snapshot.exec_time:.1f}')
             else:
-                ostream.write(f' {proc_name:24}')
-        except psutil.NoSuchProcess:
-            return 1
-        return 0
+                ostream.write(f'{snapshot.exec_time:8.1f}')
+        else:
+            if not sep:
+                ostream.write(f'{"":8s}')
+        if sep:
+            ostream.write(f'{sep}{snapshot.pid:d}')
+        else:
+            ostream.write(f' {self.DEPTH_INDENT_PREFIX * depth:s} {snapshot.pid:5d}')
+        proc_name = '"' + snapshot.name + '"'
+        if sep:
+            ostream.write(f'{sep}{proc_name:s}')
+        else:
+            ostream.write(f' {proc_name:24}')
 
     def _write_diff(
             self,
@@ -233,71 +450,80 @@ class ProcessTree:
             write_summary_config: WriteSummaryConfig,
             sep: str,
             ostream: typing.TextIO = sys.stdout,
+            snapshot: typing.Optional[ProcessSnapshot] = None,
+            executor: typing.Optional[concurrent.futures.Executor] = None,
+            json_writer: typing.Optional[SnapshotNDJSONWriter] = None,
     ) -> None:
-        """Write the summary lines for this moment in time."""
-        if self._write_summary_time_pid_name(depth, sep, ostream):
+        """Write the summary lines for this moment in time.
+        If snapshot is None the whole tree is sampled first by :py:meth:`sample` using the executor if given.
+        If write_summary_config has a JSON file path the snapshot is also written to json_writer or, if that is
+        None, appended to the file."""
+        if snapshot is None:
+            snapshot = self.sample(write_summary_config, executor)
+        if snapshot.no_such_process:
             return
+        self._write_summary_time_pid_name(snapshot, depth, sep, ostream)
         # Iterate through the required columns.
-        try:
-            with self.proc.oneshot():
-                for col_spec in write_summary_config.columns:
-                    value = col_spec.getter(self.proc)
-                    if sep:
-                        ostream.write(sep)
-                        ostream.write(
-                            format(value * col_spec.mult_factor, col_spec.width_and_format.format).strip(),
-                        )
-                    else:
-                        ostream.write(' ')
-                        ostream.write(
-                            format(value * col_spec.mult_factor, col_spec.width_and_format.format),
-                        )
-                    if col_spec.width_and_format_diff is not None:
-                        self._write_diff(value, col_spec, sep, ostream)
-        except psutil.AccessDenied:
+        for col_spec in write_summary_config.columns:
+            if col_spec.name not in snapshot.values:
+                # Sampling failed at this column.
+                break
+            value = snapshot.values[col_spec.name]
+            if sep:
+                ostream.write(sep)
+                ostream.write(
+                    format(value * col_spec.mult_factor, col_spec.width_and_format.format).strip(),
+                )
+            else:
+                ostream.write(' ')
+                ostream.write(
+                    format(value * col_spec.mult_factor, col_spec.width_and_format.format),
+                )
+            if col_spec.width_and_format_diff is not None:
+                self._write_diff(value, col_spec, sep, ostream)
+            if write_summary_config.subtree_aggregates and col_spec.aggregate is not None:
+                aggregate = format(
+                    snapshot.aggregates.get(col_spec.name, 0) * col_spec.mult_factor, col_spec.width_and_format.format
+                )
+                if sep:
+                    ostream.write(f'{sep}{aggregate.strip()}')
+                else:
+                    ostream.write(f' {aggregate}')
+        if snapshot.access_denied:
             ostream.write(colorama.Back.YELLOW + colorama.Fore.BLACK + 'ACCESS DENIED')
-        except psutil.NoSuchProcess:
-            return
         # Done with self.
         ostream.write('\n')
         if write_summary_config.json_file_path and depth == 0:
-            self._write_summary_json(record_number, write_summary_config)
+            if json_writer is not None:
+                json_writer.write(snapshot)
+            else:
+                self._write_summary_json(write_summary_config, snapshot)
         # Recurse through the children.
-        for child in self.children:
-            child.write_summary(depth + 1, record_number, write_summary_config, sep, ostream)
+        for child, child_snapshot in zip(self.children, snapshot.children):
+            child.write_summary(depth + 1, record_number, write_summary_config, sep, ostream, child_snapshot)
 
-    def _write_summary_json(self, record_number: int, write_summary_config: WriteSummaryConfig):
-        """Writes the summary as a JSON file controlled by write_summary_config."""
+    def _write_summary_json(
+            self,
+            write_summary_config: WriteSummaryConfig,
+            snapshot: typing.Optional[ProcessSnapshot] = None,
+    ):
+        """Appends the summary as a line of NDJSON to the file controlled by write_summary_config.
+        This opens and closes the file each time, :py:func:`log_process` uses a :py:class:`SnapshotNDJSONWriter`."""
         assert write_summary_config.json_file_path
-        json_output = self._get_data_as_dict_for_json(write_summary_config)
+        json_output = self._get_data_as_dict_for_json(write_summary_config, snapshot)
         with open(write_summary_config.json_file_path, 'a') as file:
-            # JSON does not like trailing commas so we write the comma lazily.
-            if record_number:
-                file.write(',\n')
-            file.write(json.dumps(json_output, indent=2))
-            # file.write(',\n')
-
-    def _get_data_as_dict_for_json(self, write_summary_config: WriteSummaryConfig) -> typing.Dict[str, typing.Any]:
-        """Recursive call to get all the tree as a dict suitable for writing to JSON."""
-        json_output = {
-            'process_time': self.get_exec_time(self.proc),
-            'pid': self.proc.pid,
-            'name': self.proc.name(),
-        }
-        for col_spec in write_summary_config.columns:
-            value = col_spec.getter(self.proc)
-            # json_output[col_spec.name_and_units()] = value
-            json_output[col_spec.name] = value
-        child_json = []
-        for child in self.children:
-            try:
-                child_json.append(child._get_data_as_dict_for_json(write_summary_config))
-            except psutil.AccessDenied:
-                pass
-            except psutil.NoSuchProcess:
-                pass
-        json_output['children'] = child_json
-        return json_output
+            file.write(json.dumps(json_output, separators=(',', ':')))
+            file.write('\n')
+
+    def _get_data_as_dict_for_json(
+            self,
+            write_summary_config: WriteSummaryConfig,
+            snapshot: typing.Optional[ProcessSnapshot] = None,
+    ) -> typing.Dict[str, typing.Any]:
+        """Get all the tree as a dict suitable for writing to JSON. If snapshot is None the tree is sampled."""
+        if snapshot is None:
+            snapshot = self.sample(write_summary_config)
+        return snapshot.as_dict()
 
     # Static functions that return data from a process.
     # See: https://psutil.readthedocs.io/en/latest/#processes for the available data
@@ -328,14 +554,124 @@ class ProcessTree:
         return proc.memory_info().rss
 
     @staticmethod
-    def get_memory_uss(proc: psutil.Process) -> int:
-        """Returns the reported USS for this process only."""
+    def _get_cached(
+            name: str,
+            proc: psutil.Process,
+            function: typing.Callable[[psutil.Process], typing.Dict[str, int]],
+    ) -> typing.Dict[str, int]:
+        """Returns function(proc) reusing the result for :py:attr:`GETTER_CACHE_SECONDS`."""
+        now = time.monotonic()
+        cache = ProcessTree._getter_cache
+        cached = cache.get((name, proc.pid))
+        if cached is not None and now - cached[0] < ProcessTree.GETTER_CACHE_SECONDS:
+            return cached[1]
+        ret = function(proc)
+        if len(cache) > 1024:
+            # Forget processes that are no longer being sampled.
+            # This may be called concurrently by ProcessTree.sample() so take a copy and tolerate missing keys.
+            for key in [k for k, v in list(cache.items()) if now - v[0] >= ProcessTree.GETTER_CACHE_SECONDS]:
+                cache.pop(key, None)
+        cache[(name, proc.pid)] = (now, ret)
+        return ret
+
+    @staticmethod
+    def _read_smaps_rollup(proc: psutil.Process) -> typing.Dict[str, int]:
+        ret = {'pss': UNAVAILABLE, 'uss': UNAVAILABLE, 'swap': UNAVAILABLE, 'anonymous': UNAVAILABLE}
         try:
-            mem_info = proc.memory_full_info()
-            return mem_info.uss
-        except psutil.AccessDenied:
-            # TODO: Why does this happen? Even with sudo.
-            return -1  # * 1024**2
+            if not proc_fs.is_available():
+                raise FileNotFoundError('No /proc file system.')
+            # A zombie has an empty smaps_rollup, read_smaps_rollup() then gives UNAVAILABLE.
+            ret = proc_fs.read_smaps_rollup(proc.pid)
+        except (PermissionError, ProcessLookupError):
+            # ProcessLookupError is a zombie or a process that has exited.
+            pass
+        except FileNotFoundError:
+            # No process or no smaps_rollup (Linux < 4.14) so let psutil decide.
+            try:
+                mem_info = proc.memory_full_info()
+                for key in ret:
+                    ret[key] = getattr(mem_info, key, UNAVAILABLE)
+            except (psutil.AccessDenied, psutil.NoSuchProcess, ProcessLookupError):
+                pass
+        return ret
+
+    @staticmethod
+    def get_smaps_rollup(proc: psutil.Process) -> typing.Dict[str, int]:
+        """Returns the PSS, USS, swap and anonymous memory in bytes for this process only as a dict with the keys
+        ``'pss'``, ``'uss'``, ``'swap'`` and ``'anonymous'``.
+        Where available this is a single read of ``/proc/<pid>/smaps_rollup`` otherwise psutil's much slower
+        ``memory_full_info()`` is used. Unavailable values are -1.
+        The result is cached for :py:attr:`GETTER_CACHE_SECONDS`."""
+        return ProcessTree._get_cached('smaps_rollup', proc, ProcessTree._read_smaps_rollup)
+
+    @staticmethod
+    def _read_cgroup_memory(proc: psutil.Process) -> typing.Dict[str, int]:
+        path = cgroup.cgroup_path_of_pid(proc.pid)
+        if path is None:
+            return {}
+        # Read each cgroup once per GETTER_CACHE_SECONDS however many processes are in it.
+        now = time.monotonic()
+        cached = ProcessTree._cgroup_cache.get(path)
+        if cached is not None and now - cached[0] < ProcessTree.GETTER_CACHE_SECONDS:
+            return cached[1]
+        try:
+            ret = cgroup.read_cgroup_memory(path)
+        except OSError:
+            ret = {}
+        ProcessTree._cgroup_cache[path] = (now, ret)
+        return ret
+
+    @staticmethod
+    def get_cgroup_memory(proc: psutil.Process) -> typing.Dict[str, int]:
+        """Returns the cgroup v2 memory accounting of the cgroup that this process is in, see
+        :py:meth:`pymemtrace.cgroup.CGroupMemoryReader.read`. This is empty if there is no cgroup v2 memory controller.
+        The result is cached for :py:attr:`GETTER_CACHE_SECONDS` for the process and for the cgroup so that the
+        processes in a tree that share a cgroup need only one read of it."""
+        return ProcessTree._get_cached('cgroup', proc, ProcessTree._read_cgroup_memory)
+
+    @staticmethod
+    def get_cgroup_memory_current(proc: psutil.Process) -> int:
+        """Returns the memory charged to the cgroup of this process, -1 if not available."""
+        return ProcessTree.get_cgroup_memory(proc).get('current', -1)
+
+    @staticmethod
+    def get_cgroup_memory_anon(proc: psutil.Process) -> int:
+        """Returns the anonymous memory charged to the cgroup of this process, -1 if not available."""
+        return ProcessTree.get_cgroup_memory(proc).get('anon', -1)
+
+    @staticmethod
+    def get_cgroup_events_high(proc: psutil.Process) -> int:
+        """Returns the number of times the cgroup of this process was throttled for exceeding memory.high,
+        -1 if not available."""
+        return ProcessTree.get_cgroup_memory(proc).get('events_high', -1)
+
+    @staticmethod
+    def get_cgroup_events_oom_kill(proc: psutil.Process) -> int:
+        """Returns the number of processes in the cgroup of this process that were OOM killed, -1 if not available."""
+        return ProcessTree.get_cgroup_memory(proc).get('events_oom_kill', -1)
+
+    @staticmethod
+    def get_memory_uss(proc: psutil.Process) -> int:
+        """Returns the reported USS for this process only, -1 if not available. See :py:meth:`get_smaps_rollup`."""
+        return ProcessTree.get_smaps_rollup(proc)['uss']
+
+    @staticmethod
+    def get_memory_pss(proc: psutil.Process) -> int:
+        """Returns the Proportional Set Size (PSS) for this process only, -1 if not available.
+        See :py:meth:`get_smaps_rollup`."""
+        return ProcessTree.get_smaps_rollup(proc)['pss']
+
+    @staticmethod
+    def get_memory_swap(proc: psutil.Process) -> int:
+        """Returns the swapped out memory for this process only, -1 if not available.
+        See :py:meth:`get_smaps_rollup`."""
+        return ProcessTree.get_smaps_rollup(proc)['swap']
+
+    @staticmethod
+    def get_memory_anonymous(proc: psutil.Process) -> int:
+        """Returns the anonymous memory, for example the heap, for this process only, -1 if not available.
+        See :py:meth:`get_smaps_rollup`."""
+        return ProcessTree.get_smaps_rollup(proc)['anonymous']
 
     @staticmethod
     def get_memory_page_faults(proc: psutil.Process) -> int:
@@ -379,6 +715,56 @@ class ProcessTree:
         return ' '.join(proc.cmdline())
 
 
+#: Prefix of the Prometheus metric names, see :py:func:`snapshot_as_prometheus`.
+PROMETHEUS_METRIC_PREFIX = prometheus_exporter.metric_name(prometheus_exporter.METRIC_PREFIX, 'process_tree')
+
+
+def _is_available(value: typing.Any) -> bool:
+    """Returns False if the value is missing or is a negative number such as :py:data:`UNAVAILABLE`."""
+    if value is None:
+        return False
+    return not (prometheus_exporter.is_sample_value(value) and value < 0)
+
+
+def snapshot_as_prometheus(snapshot: ProcessSnapshot, write_summary_config: WriteSummaryConfig) -> str:
+    """Returns the snapshot as Prometheus text with a gauge for each numeric column labelled by pid, name and depth.
+    Values are as sampled, for example RSS is in bytes, the column mult_factor is not applied.
+    Subtree aggregates, if any, are gauges with the suffix ``'_subtree'``.
+    Values that are not available, see :py:data:`UNAVAILABLE`, are omitted."""
+    # [(snapshot, depth), ...] in pre-order.
+    nodes = []
+    stack = [(snapshot, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if not node.no_such_process:
+            nodes.append((node, depth))
+            stack.extend((child, depth + 1) for child in reversed(node.children))
+    gauges = {}
+    name = prometheus_exporter.metric_name(PROMETHEUS_METRIC_PREFIX, 'process_time_seconds')
+    gauges[name] = (
+        'Time since the process was created.',
+        [({'pid': node.pid, 'name': node.name, 'depth': depth}, node.exec_time) for node, depth in nodes],
+    )
+    for col_spec in write_summary_config.columns:
+        name = prometheus_exporter.metric_name(PROMETHEUS_METRIC_PREFIX, col_spec.name)
+        gauges[name] = (
+            f'{col_spec.name} of the process.',
+            [
+                ({'pid': node.pid, 'name': node.name, 'depth': depth}, node.values[col_spec.name])
+                for node, depth in nodes if _is_available(node.values.get(col_spec.name))
+            ],
+        )
+        if write_summary_config.subtree_aggregates and col_spec.aggregate is not None:
+            gauges[f'{name}_subtree'] = (
+                f'{col_spec.aggregate} of {col_spec.name} over the process and all its descendants.',
+                [
+                    ({'pid': node.pid, 'name': node.name, 'depth': depth}, node.aggregates[col_spec.name])
+                    for node, depth in nodes if _is_available(node.aggregates.get(col_spec.name))
+                ],
+            )
+    return prometheus_exporter.format_gauges(gauges)
+
+
 def log_process(
         pid: int,
         interval: float,
@@ -386,8 +772,13 @@ def log_process(
         write_summary_config: WriteSummaryConfig,
         sep: str,
         ostream: typing.TextIO = sys.stdout,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        http_port: typing.Optional[int] = None,
 ) -> int:
-    """Log the process and all its child processes to the output stream."""
+    """Log the process and all its child processes to the output stream.
+    If max_workers > 1 the processes are sampled concurrently by a thread pool of that size.
+    If http_port is not None the latest sample is served as Prometheus text on that port, see
+    :py:func:`snapshot_as_prometheus`."""
     try:
         proc_tree = ProcessTree(pid)
     except psutil.NoSuchProcess as err:
@@ -402,9 +793,15 @@ def log_process(
     print(f'CMD: {" ".join(cmd_args)}')
     proc_tree.write_header(write_summary_config, sep, ostream)
     record_number = 0
+    executor = None
+    if max_workers > 1:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ProcessTree')
+    json_writer = None
     if write_summary_config.json_file_path:
-        with open(write_summary_config.json_file_path, 'w') as json_file:
-            json_file.write('[\n')
+        json_writer = SnapshotNDJSONWriter(write_summary_config.json_file_path)
+    exporter = None
+    if http_port is not None:
+        exporter = prometheus_exporter.PrometheusExporter(http_port)
     try:
         while True:
             if not proc_tree.proc.is_running():
@@ -415,19 +812,25 @@ def log_process(
             if omit_first and record_number == 0:
                 proc_tree.load_previous(write_summary_config)
             else:
-                proc_tree.write_summary(0, record_number, write_summary_config, sep, ostream)
+                snapshot = proc_tree.sample(write_summary_config, executor)
+                proc_tree.write_summary(
+                    0, record_number, write_summary_config, sep, ostream, snapshot=snapshot, json_writer=json_writer,
+                )
+                if exporter is not None:
+                    exporter.update(snapshot_as_prometheus(snapshot, write_summary_config))
             record_number += 1
             t_exec = time.time() - t_start
             if interval > t_exec:
                 time.sleep(interval - t_exec)
-        # if write_summary_config.json_file_path:
-        #     with open(write_summary_config.json_file_path, 'a') as json_file:
-        #         json_file.write('\n]\n')
     except KeyboardInterrupt:
         print('KeyboardInterrupt!')
-    if write_summary_config.json_file_path and record_number > 0:
-        with open(write_summary_config.json_file_path, 'a') as json_file:
-            json_file.write('\n]\n')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if json_writer is not None:
+            json_writer.close()
+        if exporter is not None:
+            exporter.close()
     return 0
 
 
@@ -436,7 +839,7 @@ def main() -> int:
 
     .. code-block:: text
 
-        usage: process_tree.py [-h] [-i INTERVAL] [-p PID] [-l LOG_LEVEL] [--sep SEP] [-1] [-u] [-g] [-c] [-x] [-t] [-s] [-f] [-n] [--cmdline] [-a] [--json JSON]
+        usage: process_tree.py [-h] [-i INTERVAL] [-p PID] [-l LOG_LEVEL] [--sep SEP] [-1] [-u] [-m] [--cgroup] [-g] [-c] [-x] [-t] [-s] [-f] [-n] [--cmdline] [-a] [-S] [-w WORKERS] [--http-port HTTP_PORT] [--json JSON]
 
         Tracks the resource usage of a process and all of it's child processes.
 
@@ -450,6 +853,8 @@ def main() -> int:
           --sep SEP             String to use as seperator such as "|". Default is to format as a table [default: ""]
           -1, --omit-first      Omit the first sample. This makes the diffs a bit cleaner. [default: False]
           -u, --uss             The USS, this is the amount of memory that would be freed if the process was terminated right now. [default: False]
+          -m, --smaps           PSS, swap and anonymous memory from /proc/<pid>/smaps_rollup (Linux). [default: False]
+          --cgroup              Memory charged to the cgroup v2 of the process, its anonymous memory and the number of high and oom_kill events. [default: False]
           -g, --page-faults     Number of page faults. [default: False]
           -c, --cpu-times       user and system time. [default: False]
           -x, --context-switches
@@ -461,7 +866,12 @@ def main() -> int:
                                 Show the number of network connections. [default: False]
           --cmdline             Show the command line for each process (verbose). [default: False]
           -a, --all             Show typical data, equivalent to -cfgstn. [default: False]
-          --json JSON           Path to a JSON file to also write the data to. [default: "]"]
+          -S, --subtree         Also write the total, or maximum, of each column over the process and all its descendants as a Σ column. [default: False]
+          -w WORKERS, --workers WORKERS
+                                Number of threads used to sample the processes concurrently, 1 samples serially. [default: 4]
+          --http-port HTTP_PORT
+                                Serve the latest sample as Prometheus text on this port, 0 lets the OS choose. [default: None]
+          --json JSON           Path to a file to also write the data to as NDJSON, one line of JSON per sample. [default: "]"]
     """
     parser = argparse.ArgumentParser(
         prog='process_tree.py',
@@ -492,6 +902,18 @@ def main() -> int:
                             " [default: %(default)s]"
                         )
                         )
+    parser.add_argument("-m", "--smaps", action="store_true",
+                        help=(
+                            "PSS, swap and anonymous memory from /proc/<pid>/smaps_rollup (Linux)."
+                            " [default: %(default)s]"
+                        )
+                        )
+    parser.add_argument("--cgroup", action="store_true",
+                        help=(
+                            "Memory charged to the cgroup v2 of the process, its anonymous memory and the number of"
+                            " high and oom_kill events. [default: %(default)s]"
+                        )
+                        )
     parser.add_argument("-g", "--page-faults", action="store_true",
                         help="Number of page faults. [default: %(default)s]")
     parser.add_argument("-c", "--cpu-times", action="store_true",
@@ -512,9 +934,18 @@ def main() -> int:
     parser.add_argument("-a", "--all", action="store_true",
                         help="Show typical data, equivalent to -cfgstn. [default: %(default)s]")
 
+    parser.add_argument('-S', '--subtree', action='store_true',
+                        help='Also write the total, or maximum, of each column over the process and all its'
+                             ' descendants as a Σ column. [default: %(default)s]')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help='Number of threads used to sample the processes concurrently, 1 samples serially.'
+                             ' [default: %(default)s]')
+    parser.add_argument('--http-port', type=int, default=None,
+                        help='Serve the latest sample as Prometheus text on this port, 0 lets the OS choose.'
+                             ' [default: %(default)s]')
     parser.add_argument('--json', type=str,
                         help=(
-                            'Path to a JSON file to also write the data to.'
+                            'Path to a file to also write the data to as NDJSON, one line of JSON per sample.'
                             ' [default: "%(default)s]"]'
                         ),
                         default='')
@@ -537,56 +968,90 @@ def main() -> int:
         [
             WriteSummaryColumn(
                 'RSS', ProcessTree.get_memory_rss, 1 / 1024 ** 2, 'MB',
-                ColumnWidthFormat(8, '8,.1f'), ColumnWidthFormat(8, '+8,.1f'),
+                ColumnWidthFormat(8, '8,.1f'), ColumnWidthFormat(8, '+8,.1f'), AGGREGATE_SUM,
             ),
         ],
         args.json,
+        args.subtree,
     )
     if args.uss:  # or args.all:
         write_summary_config.columns.append(
             WriteSummaryColumn(
                 'USS', ProcessTree.get_memory_uss, 1 / 1024 ** 2, 'MB',
-                ColumnWidthFormat(8, '8,.1f'), ColumnWidthFormat(8, '+8,.1f'),
+                ColumnWidthFormat(8, '8,.1f'), ColumnWidthFormat(8, '+8,.1f'), AGGREGATE_SUM,
             ),
         )
+    if args.smaps:
+        for name, getter in (
+                ('PSS', ProcessTree.get_memory_pss),
+                ('Swap', ProcessTree.get_memory_swap),
+                ('Anon', ProcessTree.get_memory_anonymous),
+        ):
+            write_summary_config.columns.append(
+                WriteSummaryColumn(
+                    name, getter, 1 / 1024 ** 2, 'MB',
+                    ColumnWidthFormat(8, '8,.1f'), ColumnWidthFormat(8, '+8,.1f'), AGGREGATE_SUM,
+                ),
+            )
+    if args.cgroup:
+        for name, getter in (
+                ('CG', ProcessTree.get_cgroup_memory_current),
+                ('CGAnon', ProcessTree.get_cgroup_memory_anon),
+        ):
+            write_summary_config.columns.append(
+                WriteSummaryColumn(
+                    name, getter, 1 / 1024 ** 2, 'MB',
+                    ColumnWidthFormat(8, '8,.1f'), ColumnWidthFormat(8, '+8,.1f'), AGGREGATE_MAX,
+                ),
+            )
+        for name, getter in (
+                ('CGHigh', ProcessTree.get_cgroup_events_high),
+                ('CGOOM', ProcessTree.get_cgroup_events_oom_kill),
+        ):
+            write_summary_config.columns.append(
+                WriteSummaryColumn(
+                    name, getter, 1, '',
+                    ColumnWidthFormat(8, '8,d'), ColumnWidthFormat(8, '+8,d'), AGGREGATE_MAX,
+                ),
+            )
     if args.page_faults or args.all:
         write_summary_config.columns.append(
             WriteSummaryColumn(
                 'PFaults', ProcessTree.get_memory_page_faults, 1, '',
-                ColumnWidthFormat(12, '12,d'), ColumnWidthFormat(12, '+12,d'),
+                ColumnWidthFormat(12, '12,d'), ColumnWidthFormat(12, '+12,d'), AGGREGATE_SUM,
             ),
         )
     write_summary_config.columns.append(
         WriteSummaryColumn(
             'CPU', ProcessTree.get_cpu_percent, 1, '%',
-            ColumnWidthFormat(8, '8.1f'), ColumnWidthFormat(8, '+8.1f'),
+            ColumnWidthFormat(8, '8.1f'), ColumnWidthFormat(8, '+8.1f'), AGGREGATE_SUM,
         ),
     )
     if args.cpu_times or args.all:
         write_summary_config.columns.append(
             WriteSummaryColumn(
                 'User', ProcessTree.get_cpu_time_user, 1, 's',
-                ColumnWidthFormat(8, '8,.3f'), None,  # ColumnWidthFormat(8, '+8,.1f'),
+                ColumnWidthFormat(8, '8,.3f'), None, AGGREGATE_SUM,
             )
         )
         write_summary_config.columns.append(
             WriteSummaryColumn(
                 'Sys', ProcessTree.get_cpu_time_system, 1, 's',
-                ColumnWidthFormat(8, '8,.3f'), None,  # ColumnWidthFormat(8, '+8,.1f'),
+                ColumnWidthFormat(8, '8,.3f'), None, AGGREGATE_SUM,
             ),
         )
     if args.context_switches:
         write_summary_config.columns.append(
             WriteSummaryColumn(
                 'Ctx', ProcessTree.get_num_context_switches, 1e-6, 'm',
-                ColumnWidthFormat(8, '8,.1f'), ColumnWidthFormat(8, '8,.1f'),
+                ColumnWidthFormat(8, '8,.1f'), ColumnWidthFormat(8, '8,.1f'), AGGREGATE_SUM,
             ),
         )
     if args.threads or args.all:
         write_summary_config.columns.append(
             WriteSummaryColumn(
                 'Thrds', ProcessTree.get_num_threads, 1, '',
-                ColumnWidthFormat(6, '6,d'), ColumnWidthFormat(6, '+6,d'),
+                ColumnWidthFormat(6, '6,d'), ColumnWidthFormat(6, '+6,d'), AGGREGATE_SUM,
             ),
         )
     if args.status or args.all:
@@ -600,14 +1065,14 @@ def main() -> int:
         write_summary_config.columns.append(
             WriteSummaryColumn(
                 'Files', ProcessTree.get_num_open_files, 1, '',
-                ColumnWidthFormat(6, '>6d'), ColumnWidthFormat(6, '>6d'),
+                ColumnWidthFormat(6, '>6d'), ColumnWidthFormat(6, '>6d'), AGGREGATE_SUM,
             ),
         )
     if args.net_connections or args.all:
         write_summary_config.columns.append(
             WriteSummaryColumn(
                 'Net', ProcessTree.get_num_net_connections, 1, '',
-                ColumnWidthFormat(6, '>6d'), ColumnWidthFormat(6, '>6d'),
+                ColumnWidthFormat(6, '>6d'), ColumnWidthFormat(6, '>6d'), AGGREGATE_SUM,
             ),
         )
     # Not or args.all
@@ -618,7 +1083,10 @@ def main() -> int:
                 ColumnWidthFormat(0, 's'), None,
             ),
         )
-    result_code = log_process(pid, args.interval, args.omit_first, write_summary_config, args.sep)
+    result_code = log_process(
+        pid, args.interval, args.omit_first, write_summary_config, args.sep, max_workers=args.workers,
+        http_port=args.http_port,
+    )
     if result_code:
         print(f'Logging failed with results code {result_code}')
     print('Bye, bye!')
@@ -0,0 +1,143 @@
+"""
+Serves the latest samples as Prometheus text exposition format from a lightweight background HTTP server.
+
+The sampler, for example :py:func:`pymemtrace.process_tree.log_process`, formats each sample as text and calls
+:py:meth:`PrometheusExporter.update`. A scrape just returns that text so scraping never causes any extra reads of
+``/proc`` and the scrape rate is independent of the sampling rate.
+
+Only the standard library is used, there is no dependency on ``prometheus_client``.
+"""
+import http.server
+import logging
+import re
+import threading
+import typing
+
+logger = logging.getLogger(__file__)
+
+#: Prefix for all metric names.
+METRIC_PREFIX = 'pymemtrace'
+#: Content type of the Prometheus text exposition format.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+#: Paths that are served, anything else is a 404.
+METRICS_PATHS = ('/metrics', '/')
+#: Default host to bind to, all interfaces.
+DEFAULT_HOST = ''
+
+RE_METRIC_NAME_INVALID = re.compile(r'[^a-zA-Z0-9_:]')
+
+
+def metric_name(*parts: str) -> str:
+    """Joins the parts with ``'_'``, lower cases them and replaces any invalid characters with ``'_'``.
+    For example ``metric_name('pymemtrace', 'process_tree', 'RSS')`` is ``'pymemtrace_process_tree_rss'``."""
+    name = RE_METRIC_NAME_INVALID.sub('_', '_'.join(p for p in parts if p)).lower()
+    if name[:1].isdigit():
+        name = '_' + name
+    return name
+
+
+def escape_label_value(value: typing.Any) -> str:
+    """Escapes the label value as required by the text exposition format."""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels: typing.Dict[str, typing.Any]) -> str:
+    """Returns the labels as ``{name="value",...}`` or ``''`` if there are none."""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{escape_label_value(v)}"' for k, v in labels.items()) + '}'
+
+
+def is_sample_value(value: typing.Any) -> bool:
+    """Returns True if the value can be exported, bools and strings can not."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def format_gauge(name: str, help_text: str,
+                 samples: typing.Iterable[typing.Tuple[typing.Dict[str, typing.Any], typing.Any]]) -> typing.List[str]:
+    """Returns the lines, without line endings, for a gauge with the HELP and TYPE comments and one line for each
+    ``(labels, value)`` sample. Samples that are not numbers are ignored."""
+    ret = [
+        f'# HELP {name} {help_text}',
+        f'# TYPE {name} gauge',
+    ]
+    for labels, value in samples:
+        if is_sample_value(value):
+            ret.append(f'{name}{format_labels(labels)} {value}')
+    return ret
+
+
+def format_gauges(gauges: typing.Dict[str, typing.Tuple[str, typing.List[
+    typing.Tuple[typing.Dict[str, typing.Any], typing.Any]]]]) -> str:
+    """Given ``{name : (help, [(labels, value), ...]), ...}`` this returns the complete exposition text."""
+    lines = []
+    for name, (help_text, samples) in gauges.items():
+        lines.extend(format_gauge(name, help_text, samples))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Returns the exporter's latest text. The server has an ``exporter`` attribute."""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in METRICS_PATHS:
+            self.send_error(404)
+            return
+        body = self.server.exporter.body()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f'{self.address_string()} {format % args}')
+
+
+class PrometheusExporter:
+    """Serves the most recent text given to :py:meth:`update` from a daemon thread.
+    Use as a context manager or call :py:meth:`close`.
+    port can be 0 in which case the OS chooses one, see :py:attr:`port`."""
+
+    def __init__(self, port: int, host: str = DEFAULT_HOST):
+        self._lock = threading.Lock()
+        self._body = b''
+        self._server = http.server.ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+        self._server.daemon_threads = True
+        self._server.exporter = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='PrometheusExporter', daemon=True,
+        )
+        self._thread.start()
+        logger.info(f'Serving Prometheus metrics on port {self.port}')
+
+    @property
+    def port(self) -> int:
+        """The port that is being served."""
+        return self._server.server_address[1]
+
+    def update(self, text: str) -> None:
+        """Replace the served text."""
+        body = text.encode('utf-8')
+        with self._lock:
+            self._body = body
+
+    def body(self) -> bytes:
+        """The served text as bytes."""
+        with self._lock:
+            return self._body
+
+    def close(self) -> None:
+        """Stop serving."""
+        if self._thread.is_alive():
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
@@ -10,6 +10,9 @@ Changes:
 TODO: Unite duplicate code.
 
 TODO: This does not work when running under pytest.
+
+:py:func:`fd_capture` and :py:func:`stderr_capture` are a lighter alternative that only redirect the file descriptor.
+They do not close or replace ``sys.stdout`` or ``sys.stderr`` and use an in-memory file rather than a file on disk.
 """
 from contextlib import contextmanager
 import ctypes
@@ -17,6 +20,7 @@ import io
 import os
 import sys
 import tempfile
+import threading
 
 import typing
 
@@ -95,3 +99,106 @@ def stderr_redirector(stream: typing.BinaryIO):
     finally:
         tfile.close()
         os.close(saved_stderr_fd)
+
+
+#: :py:func:`fd_capture` methods. 'memfd' is an in-memory file (Linux only), 'pipe' is a pipe drained by a thread.
+CAPTURE_METHODS = ('memfd', 'pipe')
+#: Size of the reads from the pipe.
+PIPE_READ_SIZE = 64 * 1024
+#: The file descriptor of C stderr. This is not always sys.stderr.fileno(), for example when pytest captures output.
+STDERR_FILENO = 2
+
+
+def default_capture_method() -> str:
+    """Returns 'memfd' if ``os.memfd_create()`` is available, otherwise 'pipe'."""
+    return 'memfd' if hasattr(os, 'memfd_create') else 'pipe'
+
+
+def _read_memfd(fd: int) -> bytes:
+    """Read the whole of the memfd."""
+    size = os.fstat(fd).st_size
+    chunks = []
+    offset = 0
+    while offset < size:
+        chunk = os.pread(fd, size - offset, offset)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        offset += len(chunk)
+    return b''.join(chunks)
+
+
+def _drain_pipe(fd: int, chunks: typing.List[bytes]) -> None:
+    """Read the pipe until EOF, this is the reader thread of :py:func:`fd_capture`."""
+    while True:
+        chunk = os.read(fd, PIPE_READ_SIZE)
+        if not chunk:
+            break
+        chunks.append(chunk)
+
+
+@contextmanager
+def fd_capture(stream: typing.BinaryIO, fd: int, c_file: typing.Optional[ctypes.c_void_p] = None,
+               method: typing.Optional[str] = None):
+    """A context manager that captures everything written to the file descriptor, for example 2 for stderr, and
+    writes it to the given binary I/O stream on exit.
+    c_file, if given, is the C ``FILE *`` that is flushed before and after.
+    method is one of :py:data:`CAPTURE_METHODS`, the default is :py:func:`default_capture_method`.
+
+    Only the file descriptor is redirected, the Python file object is flushed but is not closed or replaced.
+    Anything written to the file descriptor by other threads during the capture is also captured."""
+    if method is None:
+        method = default_capture_method()
+    if method not in CAPTURE_METHODS:
+        raise ValueError(f'Capture method must be one of {CAPTURE_METHODS} not {method!r}')
+    if c_file is not None:
+        libc.fflush(c_file)
+    saved_fd = os.dup(fd)
+    reader = None
+    chunks: typing.List[bytes] = []
+    try:
+        if method == 'memfd':
+            capture_fd = os.memfd_create('pymemtrace_capture', os.MFD_CLOEXEC)
+            try:
+                os.dup2(capture_fd, fd)
+                try:
+                    yield
+                finally:
+                    if c_file is not None:
+                        libc.fflush(c_file)
+                    os.dup2(saved_fd, fd)
+                chunks.append(_read_memfd(capture_fd))
+            finally:
+                os.close(capture_fd)
+        else:
+            read_fd, write_fd = os.pipe()
+            try:
+                reader = threading.Thread(target=_drain_pipe, args=(read_fd, chunks), name='FDCapture', daemon=True)
+                reader.start()
+                os.dup2(write_fd, fd)
+                os.close(write_fd)
+                write_fd = -1
+                try:
+                    yield
+                finally:
+                    if c_file is not None:
+                        libc.fflush(c_file)
+                    # This closes the last write end of the pipe so the reader sees EOF.
+                    os.dup2(saved_fd, fd)
+                    reader.join()
+            finally:
+                if write_fd != -1:
+                    os.close(write_fd)
+                os.close(read_fd)
+        stream.write(b''.join(chunks))
+    finally:
+        os.close(saved_fd)
+
+
+@contextmanager
+def stderr_capture(stream: typing.BinaryIO, method: typing.Optional[str] = None):
+    """A context manager that captures C stderr, and anything else written to file descriptor 2, to the given binary
+    I/O stream using :py:func:`fd_capture`. sys.stderr is flushed but not replaced."""
+    sys.stderr.flush()
+    with fd_capture(stream, STDERR_FILENO, c_stderr, method):
+        yield
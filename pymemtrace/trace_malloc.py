@@ -1,13 +1,62 @@
 """
 A wrapper around the tracemalloc standard library module.
 """
+import concurrent.futures
 import functools
+import heapq
 import logging
+import multiprocessing
+import queue
 import sys
+import threading
 import tracemalloc
 
 import typing
 
+#: Filter that excludes the allocations made by the tracemalloc module itself.
+TRACEMALLOC_FILTER = tracemalloc.Filter(False, tracemalloc.__file__)
+#: Default maximum number of comparisons waiting for a :py:class:`TraceMallocWorker`.
+DEFAULT_QUEUE_SIZE = 16
+
+FilterTypes = typing.Union[tracemalloc.Filter, tracemalloc.DomainFilter]
+GroupedStatistics = typing.Dict[tracemalloc.Traceback, tracemalloc.Statistic]
+
+
+def group_statistics(snapshot: tracemalloc.Snapshot, key_type: str) -> GroupedStatistics:
+    """Returns the snapshot statistics as ``{traceback : Statistic, ...}``.
+    This is the expensive part of ``Snapshot.compare_to()`` and can be done once for the start snapshot."""
+    return {stat.traceback: stat for stat in snapshot.statistics(key_type)}
+
+
+def statistic_diff_sort_key(stat: tracemalloc.StatisticDiff) -> typing.Tuple:
+    """The same ordering as ``Snapshot.compare_to()``, largest absolute size difference first when reversed."""
+    return abs(stat.size_diff), stat.size, abs(stat.count_diff), stat.count, stat.traceback
+
+
+def compare_statistics(old_group: GroupedStatistics, new_group: GroupedStatistics,
+                       top_n: typing.Optional[int] = None) -> typing.List[tracemalloc.StatisticDiff]:
+    """Returns the same as ``new_snapshot.compare_to(old_snapshot, ...)`` from the results of
+    :py:func:`group_statistics`. old_group is not modified so it can be reused.
+    If top_n is given only that many of the largest differences are returned, this avoids sorting them all."""
+    statistics = []
+    for traceback, stat in new_group.items():
+        previous = old_group.get(traceback)
+        if previous is not None:
+            statistics.append(
+                tracemalloc.StatisticDiff(
+                    traceback, stat.size, stat.size - previous.size, stat.count, stat.count - previous.count
+                )
+            )
+        else:
+            statistics.append(tracemalloc.StatisticDiff(traceback, stat.size, stat.size, stat.count, stat.count))
+    for traceback, stat in old_group.items():
+        if traceback not in new_group:
+            statistics.append(tracemalloc.StatisticDiff(traceback, 0, -stat.size, 0, -stat.count))
+    if top_n is not None:
+        return heapq.nlargest(top_n, statistics, key=statistic_diff_sort_key)
+    statistics.sort(reverse=True, key=statistic_diff_sort_key)
+    return statistics
+
 
 class TraceMalloc:
     """A wrapper around the tracemalloc module that can compensate for tracemalloc's memory usage."""
@@ -16,13 +65,32 @@ class TraceMalloc:
     TRACE_ON = True
     ALLOWED_GRANULARITY = ('filename', 'lineno', 'traceback')
 
-    def __init__(self, statistics_granularity: str = 'lineno'):
-        """statistics_granularity can be 'filename', 'lineno' or 'traceback'."""
+    def __init__(self, statistics_granularity: str = 'lineno',
+                 filters: typing.Optional[typing.Sequence[FilterTypes]] = None,
+                 domain: typing.Optional[int] = None,
+                 top_n: typing.Optional[int] = None,
+                 deferred: bool = False):
+        """statistics_granularity can be 'filename', 'lineno' or 'traceback'.
+
+        filters is a sequence of ``tracemalloc.Filter`` or ``tracemalloc.DomainFilter`` that are applied to both
+        snapshots with ``Snapshot.filter_traces()`` before they are compared, for example :py:data:`TRACEMALLOC_FILTER`.
+        domain, if given, only includes the traces in that address space domain. This is applied before, and
+        independently of, filters so it always narrows the selection.
+        top_n, if given, only keeps that many of the largest differences in :py:attr:`statistics`.
+        :py:attr:`diff` still accounts for all the (filtered) traces.
+        If deferred is True then the context manager only takes the snapshots and :py:meth:`compare` must be called
+        later, perhaps in another thread or process, see :py:class:`TraceMallocWorker`."""
         if statistics_granularity not in self.ALLOWED_GRANULARITY:
             raise ValueError(
                 f'statistics_granularity must be in {self.ALLOWED_GRANULARITY} not {statistics_granularity}'
             )
+        if top_n is not None and top_n < 1:
+            raise ValueError(f'top_n must be None or > 0 not {top_n}')
         self.statistics_granularity = statistics_granularity
+        self.filters: typing.List[FilterTypes] = list(filters) if filters else []
+        self.domain = domain
+        self.top_n = top_n
+        self.deferred = deferred
         if self.TRACE_ON:
             if not tracemalloc.is_tracing():
                 tracemalloc.start()
@@ -31,25 +99,59 @@ class TraceMalloc:
             self.memory_start: typing.Optional[int] = None
             self.memory_finish: typing.Optional[int] = None
             self.statistics: typing.List[tracemalloc.StatisticDiff] = []
+            # Cache of the start snapshot statistics, see group_statistics().
+            self._statistics_start: typing.Optional[GroupedStatistics] = None
+            self._size_diff = 0
             self._diff: typing.Optional[int] = None
 
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        """Take a tracemalloc snapshot and apply the domain and the filters, if any.
+        ``Snapshot.filter_traces()`` ORs inclusive filters so the domain is a separate pass."""
+        snapshot = tracemalloc.take_snapshot()
+        if self.domain is not None:
+            snapshot = snapshot.filter_traces([tracemalloc.DomainFilter(True, self.domain)])
+        if self.filters:
+            snapshot = snapshot.filter_traces(self.filters)
+        return snapshot
+
     def __enter__(self):
-        """Take a tracemalloc snapshot."""
+        """Take a tracemalloc snapshot and compute its statistics so that :py:meth:`__exit__` does not have to."""
         if self.TRACE_ON:
-            self.tracemalloc_snapshot_start = tracemalloc.take_snapshot()
+            self.tracemalloc_snapshot_start = self._take_snapshot()
+            self._statistics_start = None
+            if not self.deferred:
+                self._statistics_start = group_statistics(
+                    self.tracemalloc_snapshot_start, self.statistics_granularity
+                )
             self.memory_start = tracemalloc.get_tracemalloc_memory()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Take a tracemalloc snapshot and subtract the initial snapshot. Also note the tracemalloc memory usage."""
         if self.TRACE_ON:
-            self.tracemalloc_snapshot_finish = tracemalloc.take_snapshot()
+            self.tracemalloc_snapshot_finish = self._take_snapshot()
             self.memory_finish = tracemalloc.get_tracemalloc_memory()
-            self.statistics = self.tracemalloc_snapshot_finish.compare_to(
-                self.tracemalloc_snapshot_start, self.statistics_granularity
+            if not self.deferred:
+                self.compare()
+        return False
+
+    def compare(self) -> None:
+        """Compare the finish snapshot with the start snapshot and set :py:attr:`statistics`.
+        This is called by :py:meth:`__exit__` unless deferred is True."""
+        if self.TRACE_ON:
+            if self.tracemalloc_snapshot_finish is None:
+                raise RuntimeError('Context manager not exited.')
+            if self._statistics_start is None:
+                self._statistics_start = group_statistics(
+                    self.tracemalloc_snapshot_start, self.statistics_granularity
+                )
+            statistics_finish = group_statistics(self.tracemalloc_snapshot_finish, self.statistics_granularity)
+            self.statistics = compare_statistics(self._statistics_start, statistics_finish, self.top_n)
+            self._size_diff = (
+                sum(s.size for s in statistics_finish.values())
+                - sum(s.size for s in self._statistics_start.values())
             )
             self._diff = None
-        return False
 
     @property
     def tracemalloc_memory_usage(self) -> typing.Optional[int]:
@@ -62,7 +164,7 @@ class TraceMalloc:
         """The net memory usage difference recorded by tracemalloc allowing for the memory usage of tracemalloc."""
         if self.TRACE_ON:
             if self._diff is None:
-                self._diff = sum(s.size_diff for s in self.statistics) - self.tracemalloc_memory_usage
+                self._diff = self._size_diff - self.tracemalloc_memory_usage
             return self._diff
         return -sys.maxsize - 1
 
@@ -76,12 +178,122 @@ class TraceMalloc:
         return ret
 
 
-def trace_malloc_log(log_level: int):
+def _compare_diff(tm: TraceMalloc) -> int:
+    """Compares the snapshots of a deferred TraceMalloc and returns the diff. This runs in a worker process."""
+    tm.compare()
+    return tm.diff
+
+
+class TraceMallocWorker:
+    """Compares the snapshots of deferred :py:class:`TraceMalloc` objects in a daemon thread and logs the result.
+    This takes the cost of comparing snapshots out of the caller.
+
+    Work is held in a bounded queue of size maxsize. If the queue is full :py:meth:`submit` drops the work and
+    increments :py:attr:`dropped` rather than blocking the caller.
+
+    If use_process is True then the thread pickles the TraceMalloc, with its snapshots, to a single worker process that
+    does the comparison so that it does not hold this process's GIL. The worker process is spawned, rather than forked
+    from this multi-threaded process, and does not trace its own allocations.
+
+    The comparisons allocate memory that will be seen by other, concurrent, snapshots.
+    Use as a context manager or call :py:meth:`close`."""
+
+    def __init__(self, maxsize: int = DEFAULT_QUEUE_SIZE, use_process: bool = False):
+        if maxsize < 1:
+            raise ValueError(f'maxsize must be > 0 not {maxsize}')
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        # Guards submitted and dropped which may be updated by several threads.
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+        self._executor: typing.Optional[concurrent.futures.ProcessPoolExecutor] = None
+        if use_process:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context('spawn'), initializer=tracemalloc.stop,
+            )
+        self._thread = threading.Thread(target=self._run, name='TraceMallocWorker', daemon=True)
+        self._thread.start()
+
+    def submit(self, tm: TraceMalloc, log_level: int, name: str) -> bool:
+        """Queue a deferred TraceMalloc that has exited, when compared this logs its diff at log_level for the
+        function name. Returns False if the queue is full and the work has been dropped."""
+        try:
+            self._queue.put_nowait((tm, log_level, name))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logging.debug(f'TraceMallocWorker queue is full, dropped the result for "{name}()"')
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                tm, log_level, name = item
+                if self._executor is None:
+                    diff = _compare_diff(tm)
+                else:
+                    diff = self._executor.submit(_compare_diff, tm).result()
+                logging.log(log_level, f'TraceMalloc memory delta: {diff:,d} for "{name}()"')
+            except Exception:
+                logging.exception(f'TraceMallocWorker failed for "{item[2]}()"')
+            finally:
+                self._queue.task_done()
+
+    def wait(self) -> None:
+        """Block until all the queued work has been logged."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Finish the queued work and stop the thread and process, if any."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+_DEFAULT_WORKER: typing.Optional[TraceMallocWorker] = None
+_DEFAULT_WORKER_LOCK = threading.Lock()
+
+
+def default_worker() -> TraceMallocWorker:
+    """Returns the TraceMallocWorker shared by the asynchronous :py:func:`trace_malloc_log` decorators, this is created
+    on first use."""
+    global _DEFAULT_WORKER
+    with _DEFAULT_WORKER_LOCK:
+        if _DEFAULT_WORKER is None:
+            _DEFAULT_WORKER = TraceMallocWorker()
+        return _DEFAULT_WORKER
+
+
+def trace_malloc_log(log_level: int, asynchronous: bool = False, worker: typing.Optional[TraceMallocWorker] = None):
     """Decorator that logs the decorated function the use of Python memory in bytes at the desired log level.
-    This can be switched to a NOP by setting TraceMalloc.TRACE_ON to False."""
+    This can be switched to a NOP by setting TraceMalloc.TRACE_ON to False.
+
+    If asynchronous is True the decorated function only takes the snapshots, they are compared and the result logged
+    by the worker, by default :py:func:`default_worker`. If the worker is busy the result is not logged."""
     def memory_inner(fn):
         @functools.wraps(fn)
         def wrapper(*args, **kwargs):
+            if asynchronous and TraceMalloc.TRACE_ON:
+                with TraceMalloc(deferred=True) as tm:
+                    result = fn(*args, ** kwargs)
+                (worker or default_worker()).submit(tm, log_level, fn.__name__)
+                return result
             with TraceMalloc() as tm:
                 result = fn(*args, ** kwargs)
             logging.log(log_level, f'TraceMalloc memory delta: {tm.diff:,d} for "{fn.__name__}()"')
@@ -51,11 +51,18 @@ This produces the following summary output:
     Process time: 602.995 (s)
     (pymemtrace_3.12_A)
 
+Most lines are matched by the single regex :py:data:`RE_MALLOC_OR_FREE`, the other regular expressions are only tried
+if that fails.
+Large logs can be parsed by several processes with the ``-j`` option, the parsed events are merged back in log file
+order so the result is the same as the single process version.
+
 """
 import argparse
 import dataclasses
 import io
+import itertools
 import logging
+import multiprocessing
 import re
 import sys
 import time
@@ -86,6 +93,15 @@ RE_FREE_FALLBACK_A = re.compile(r'^\s+(\d+)(.+)free\((0x[0-9a-f]+)\)$')
 # Matches '... free(0x7fca83c00620)'
 # To: ('... ', '0x7fca83c00620')
 RE_FREE_LAST_RESORT = re.compile(r'^(.+)free\((0x[0-9a-f]+)\)$')
+# The fast path, a single regex that matches the common malloc and free lines in one pass.
+# Matches ' 77633  cmn_cmd_opts.py:141  -> set_log_level malloc(560) pntr 0x7fca83ef4240'
+# To: ('77633', 'cmn_cmd_opts.py', '141', 'set_log_level', '560', '0x7fca83ef4240', None)
+# Matches ' 77633       process.py:268  -> _get_process_data free(0x7fca83c00620)'
+# To: ('77633', 'process.py', '268', '_get_process_data', None, None, '0x7fca83c00620')
+RE_MALLOC_OR_FREE = re.compile(
+    r'^\s+(\d+)\s+([^:]+)?:(\d+)\s+->\s+(\S.*\S)?\s+'
+    r'(?:malloc\((\d+)\)\s+pntr\s+(0x[0-9a-f]+)|free\((0x[0-9a-f]+)\))$'
+)
 
 
 @dataclasses.dataclass
@@ -109,9 +125,97 @@ class DTraceFreeCall:
     pointer: int
 
 
+class DTraceSites:
+    """Interns the call sites (process, file, line, function) of malloc calls as integer ids so that each outstanding
+    malloc does not need to keep its own copy of the file and function strings."""
+    def __init__(self):
+        self._site_ids: typing.Dict[typing.Tuple[int, str, int, typing.Optional[str]], int] = {}
+        self.sites: typing.List[typing.Tuple[int, str, int, typing.Optional[str]]] = []
+
+    def __len__(self) -> int:
+        return len(self.sites)
+
+    def site_id(self, process: int, file: str, line: int, function: typing.Optional[str]) -> int:
+        """Return the id of the site, creating a new one if necessary."""
+        key = (process, file, line, function)
+        ret = self._site_ids.get(key)
+        if ret is None:
+            ret = len(self.sites)
+            self._site_ids[key] = ret
+            self.sites.append(key)
+        return ret
+
+    def site(self, site_id: int) -> typing.Tuple[int, str, int, typing.Optional[str]]:
+        """Return the (process, file, line, function) for the site id."""
+        return self.sites[site_id]
+
+
+class DTraceSiteSummary(typing.NamedTuple):
+    """The malloc activity of a single (file, line, function) call site."""
+    file: str
+    line: int
+    function: typing.Optional[str]
+    count_mallocs: int
+    bytes_malloced: int
+    count_outstanding: int
+    bytes_outstanding: int
+
+
+#: Outstanding mallocs are packed into a single int as: log_line | site id | size
+PACKED_SIZE_BITS = 48
+PACKED_SIZE_MASK = (1 << PACKED_SIZE_BITS) - 1
+PACKED_SITE_BITS = 32
+PACKED_SITE_MASK = (1 << PACKED_SITE_BITS) - 1
+PACKED_LOG_LINE_SHIFT = PACKED_SIZE_BITS + PACKED_SITE_BITS
+
+
+def pack_malloc(log_line: int, site_id: int, size: int) -> int:
+    """Pack the log line, site id and size into a single int.
+    Raises a ValueError if any of them are negative or too large for their field."""
+    if not 0 <= size <= PACKED_SIZE_MASK:
+        raise ValueError(f'Size {size} must be in the range 0 to {PACKED_SIZE_MASK}')
+    if not 0 <= site_id <= PACKED_SITE_MASK:
+        raise ValueError(f'Site id {site_id} must be in the range 0 to {PACKED_SITE_MASK}')
+    if log_line < 0:
+        raise ValueError(f'Log line {log_line} must not be negative')
+    return (log_line << PACKED_LOG_LINE_SHIFT) | (site_id << PACKED_SIZE_BITS) | size
+
+
+def unpack_malloc(packed: int) -> typing.Tuple[int, int, int]:
+    """Unpack a single int to (log_line, site_id, size)."""
+    return (
+        packed >> PACKED_LOG_LINE_SHIFT,
+        (packed >> PACKED_SIZE_BITS) & PACKED_SITE_MASK,
+        packed & PACKED_SIZE_MASK,
+    )
+
+
 class DTraceMallocs:
+    """Accumulates the malloc and free calls.
+
+    Outstanding mallocs are stored compactly as ``{pointer: packed_int, ...}`` where the packed int contains the log
+    line, the interned call site id and the size.
+    Use :py:meth:`get_malloc` or :py:meth:`outstanding_mallocs` to recover the :py:class:`DTraceMallocCall` objects.
+
+    As well as the scalar totals this incrementally maintains:
+
+    - A log2 size class histogram of malloc calls, class ``n`` is sizes in the range ``[2**(n-1), 2**n)``.
+    - Per call site counts and bytes of malloc calls and of outstanding mallocs, these are lists indexed by site id.
+    - The log line where the maximum bytes and maximum allocations outstanding were reached.
+    """
     def __init__(self):
-        self.malloc_dict: typing.Dict[int, DTraceMallocCall] = {}
+        self.malloc_dict: typing.Dict[int, int] = {}
+        self.sites = DTraceSites()
+        # Indexed by size.bit_length()
+        self.size_class_count: typing.List[int] = []
+        self.size_class_bytes: typing.List[int] = []
+        # Indexed by site id
+        self.site_count_mallocs: typing.List[int] = []
+        self.site_bytes_malloced: typing.List[int] = []
+        self.site_count_outstanding: typing.List[int] = []
+        self.site_bytes_outstanding: typing.List[int] = []
+        self.max_bytes_outstanding_log_line = 0
+        self.max_allocations_log_line = 0
         self.count_mallocs = 0
         self.count_frees_non_null = 0
         self.count_frees_null = 0
@@ -129,26 +233,60 @@ class DTraceMallocs:
     def __len__(self) -> int:
         return len(self.malloc_dict)
 
+    def get_malloc(self, pointer: int) -> DTraceMallocCall:
+        """Return the outstanding malloc at the pointer. May raise a KeyError."""
+        log_line, site_id, size = unpack_malloc(self.malloc_dict[pointer])
+        process, file, line, function = self.sites.site(site_id)
+        return DTraceMallocCall(log_line, process, file, line, function, size, pointer)
+
+    def outstanding_mallocs(self) -> typing.Iterator[DTraceMallocCall]:
+        """Yields all the outstanding mallocs."""
+        for pointer in self.malloc_dict:
+            yield self.get_malloc(pointer)
+
     def add_malloc(self, malloc_call: DTraceMallocCall):
         if malloc_call.pointer in self.malloc_dict:
-            was = self.malloc_dict[malloc_call.pointer]
+            was_log_line, _site_id, _size = unpack_malloc(self.malloc_dict[malloc_call.pointer])
             # raise ValueError(
             #     f'Malloc call at 0x{malloc_call.pointer:012x} already in dict'
-            #     f' Was log line: {was.log_line} now {malloc_call.log_line}'
+            #     f' Was log line: {was_log_line} now {malloc_call.log_line}'
             # )
             logger.error(
                 f'Malloc call at 0x{malloc_call.pointer:012x} already in dict'
-                f' Was log line: {was.log_line} now {malloc_call.log_line}'
+                f' Was log line: {was_log_line} now {malloc_call.log_line}'
             )
             self.failed_to_add_malloc += 1
         else:
-            self.malloc_dict[malloc_call.pointer] = malloc_call
+            size = malloc_call.size
+            site_id = self.sites.site_id(malloc_call.process, malloc_call.file, malloc_call.line, malloc_call.function)
+            self.malloc_dict[malloc_call.pointer] = pack_malloc(malloc_call.log_line, site_id, size)
             self.count_mallocs += 1
-            self.total_bytes_malloced += malloc_call.size
-            self.total_bytes_outstanding += malloc_call.size
-            self.max_allocations = max(self.max_allocations, len(self))
-            self.max_bytes_outstanding = max(self.max_bytes_outstanding, self.total_bytes_outstanding)
-            self.max_malloc = max(self.max_malloc, malloc_call.size)
+            self.total_bytes_malloced += size
+            self.total_bytes_outstanding += size
+            if len(self) > self.max_allocations:
+                self.max_allocations = len(self)
+                self.max_allocations_log_line = malloc_call.log_line
+            if self.total_bytes_outstanding > self.max_bytes_outstanding:
+                self.max_bytes_outstanding = self.total_bytes_outstanding
+                self.max_bytes_outstanding_log_line = malloc_call.log_line
+            self.max_malloc = max(self.max_malloc, size)
+            # Histogram
+            size_class = size.bit_length()
+            while len(self.size_class_count) <= size_class:
+                self.size_class_count.append(0)
+                self.size_class_bytes.append(0)
+            self.size_class_count[size_class] += 1
+            self.size_class_bytes[size_class] += size
+            # Call sites
+            if site_id == len(self.site_count_mallocs):
+                self.site_count_mallocs.append(0)
+                self.site_bytes_malloced.append(0)
+                self.site_count_outstanding.append(0)
+                self.site_bytes_outstanding.append(0)
+            self.site_count_mallocs[site_id] += 1
+            self.site_bytes_malloced[site_id] += size
+            self.site_count_outstanding[site_id] += 1
+            self.site_bytes_outstanding[site_id] += size
         self.count_lines += 1
 
     def add_free(self, free_call: DTraceFreeCall):
@@ -160,15 +298,39 @@ class DTraceMallocs:
                 )
                 self.failed_to_add_free += 1
             else:
-                size_free = self.malloc_dict[free_call.pointer].size
+                _log_line, site_id, size_free = unpack_malloc(self.malloc_dict.pop(free_call.pointer))
+                self.site_count_outstanding[site_id] -= 1
+                self.site_bytes_outstanding[site_id] -= size_free
                 self.total_bytes_freed += size_free
                 self.total_bytes_outstanding -= size_free
-                del self.malloc_dict[free_call.pointer]
                 self.count_frees_non_null += 1
         else:
             self.count_frees_null += 1
         self.count_lines += 1
 
+    def size_class_range(self, size_class: int) -> typing.Tuple[int, int]:
+        """Returns the (inclusive) range of sizes in the size class."""
+        if size_class == 0:
+            return 0, 0
+        return 1 << (size_class - 1), (1 << size_class) - 1
+
+    def by_site(self) -> typing.List[DTraceSiteSummary]:
+        """Returns a summary for each (file, line, function) combining processes.
+        This is sorted by bytes outstanding, largest first, then by bytes malloc'd."""
+        summaries: typing.Dict[typing.Tuple[str, int, typing.Optional[str]], typing.List[int]] = {}
+        for site_id, (_process, file, line, function) in enumerate(self.sites.sites):
+            key = (file, line, function)
+            if key not in summaries:
+                summaries[key] = [0, 0, 0, 0]
+            values = summaries[key]
+            values[0] += self.site_count_mallocs[site_id]
+            values[1] += self.site_bytes_malloced[site_id]
+            values[2] += self.site_count_outstanding[site_id]
+            values[3] += self.site_bytes_outstanding[site_id]
+        ret = [DTraceSiteSummary(*k, *v) for k, v in summaries.items()]
+        ret.sort(key=lambda v: (v.bytes_outstanding, v.bytes_malloced), reverse=True)
+        return ret
+
     def str_failures(self) -> str:
         return (
             f'Total lines: {(self.count_lines + self.failed_to_parse_line):,d}'
@@ -236,38 +398,111 @@ def match_free_line(line: str, log_line: int) -> typing.Optional[DTraceFreeCall]
 
 
 
-def read_dtrace_log_file(log_file: io.StringIO) -> DTraceMallocs:
+def match_line(line: str, log_line: int) -> typing.Union[DTraceMallocCall, DTraceFreeCall, None]:
+    """Match a malloc or free line. This tries the single regex :py:data:`RE_MALLOC_OR_FREE` first and only falls
+    back to :py:func:`match_malloc_line` and :py:func:`match_free_line` if that fails.
+    Returns None if the line can not be parsed."""
+    m = RE_MALLOC_OR_FREE.match(line)
+    if m is not None:
+        if m.group(7) is not None:
+            return DTraceFreeCall(
+                log_line, int(m.group(1)), m.group(2), int(m.group(3)), m.group(4), int(m.group(7), base=16)
+            )
+        if m.group(2) is not None:
+            return DTraceMallocCall(
+                log_line, int(m.group(1)), m.group(2), int(m.group(3)),
+                m.group(4), int(m.group(5)), int(m.group(6), base=16)
+            )
+    # Slow path. A free line always ends with ')'
+    if line.rstrip().endswith(')'):
+        return match_free_line(line, log_line)
+    return match_malloc_line(line, log_line)
+
+
+def _add_call(
+        malloc_dict: DTraceMallocs,
+        call: typing.Union[DTraceMallocCall, DTraceFreeCall, None],
+        line: str,
+        log_line_num: int,
+) -> None:
+    """Add the result of :py:func:`match_line` to the DTraceMallocs."""
+    if isinstance(call, DTraceMallocCall):
+        malloc_dict.add_malloc(call)
+    elif isinstance(call, DTraceFreeCall):
+        malloc_dict.add_free(call)
+    else:
+        logger.error(f'Can not parse line [{log_line_num}]: "{line}"')
+        malloc_dict.failed_to_parse_line += 1
+
+
+def _iterate_dtrace_block(log_file: typing.TextIO) -> typing.Iterator[typing.Tuple[int, str]]:
+    """Yields (log_line_num, line) for every non-empty line within the ``dtrace:::BEGIN`` ... ``dtrace:::END``
+    block."""
     in_dtrace_block = False
-    log_line_num = 1
-    malloc_dict = DTraceMallocs()
-    for line in log_file.readlines():
-        if log_line_num % 1000 == 0:
-            logger.info('Reading line %d', log_line_num)
+    for log_line_num, line in enumerate(log_file, start=1):
         if line != '\n':
             if line == 'dtrace:::BEGIN\n':
                 in_dtrace_block = True
                 logger.info('Starting DTrace block at line %d', log_line_num)
             elif line == 'dtrace:::END\n':
-                in_dtrace_block = False
                 logger.info('Ending DTrace block at line %d', log_line_num)
                 break
             elif in_dtrace_block:
-                malloc_call = match_malloc_line(line, log_line_num)
-                if malloc_call is not None:
-                    malloc_dict.add_malloc(malloc_call)
-                else:
-                    free_call = match_free_line(line, log_line_num)
-                    if free_call is not None:
-                        malloc_dict.add_free(free_call)
-                    else:
-                        logger.error(f'Can not parse line [{log_line_num}]: "{line}"')
-                        malloc_dict.failed_to_parse_line += 1
-        log_line_num += 1
+                yield log_line_num, line
+
+
+def read_dtrace_log_file(log_file: typing.TextIO) -> DTraceMallocs:
+    """Read the DTrace log file serially."""
+    malloc_dict = DTraceMallocs()
+    for log_line_num, line in _iterate_dtrace_block(log_file):
+        if log_line_num % 1000 == 0:
+            logger.info('Reading line %d', log_line_num)
+        _add_call(malloc_dict, match_line(line, log_line_num), line, log_line_num)
     return malloc_dict
 
 
-def read_dtrace_log(log_path: str) -> DTraceMallocs:
+#: The number of lines in a chunk that is sent to a worker process by :py:func:`read_dtrace_log_file_parallel`.
+PARALLEL_CHUNK_LINES = 64 * 1024
+
+
+def _match_chunk(
+        chunk: typing.List[typing.Tuple[int, str]]
+) -> typing.List[typing.Tuple[int, str, typing.Union[DTraceMallocCall, DTraceFreeCall, None]]]:
+    """Worker function, parses a chunk of (log_line_num, line).
+    The line is only returned if it can not be parsed so that it can be reported."""
+    ret = []
+    for log_line_num, line in chunk:
+        call = match_line(line, log_line_num)
+        ret.append((log_line_num, line if call is None else '', call))
+    return ret
+
+
+def read_dtrace_log_file_parallel(
+        log_file: typing.TextIO,
+        processes: typing.Optional[int] = None,
+        chunk_lines: int = PARALLEL_CHUNK_LINES,
+) -> DTraceMallocs:
+    """Read the DTrace log file, the lines are parsed in chunks by a pool of processes.
+    The parsed malloc/free events are merged back in log file order so the result is identical to
+    :py:func:`read_dtrace_log_file`."""
+    malloc_dict = DTraceMallocs()
+    block = _iterate_dtrace_block(log_file)
+    chunks = iter(lambda: list(itertools.islice(block, chunk_lines)), [])
+    with multiprocessing.Pool(processes=processes) as pool:
+        # imap() preserves the order of the chunks.
+        for chunk_result in pool.imap(_match_chunk, chunks):
+            for log_line_num, line, call in chunk_result:
+                _add_call(malloc_dict, call, line, log_line_num)
+            if chunk_result:
+                logger.info('Read to line %d', chunk_result[-1][0])
+    return malloc_dict
+
+
+def read_dtrace_log(log_path: str, processes: int = 1) -> DTraceMallocs:
+    """Read the DTrace log file. If processes is > 1 then the log is parsed by that many worker processes."""
     with open(log_path, encoding='latin-1') as log_file:
+        if processes > 1:
+            return read_dtrace_log_file_parallel(log_file, processes)
         return read_dtrace_log_file(log_file)
 
 
@@ -275,17 +510,49 @@ def pprint_mallocs(dtm: DTraceMallocs, st=sys.stdout) -> None:
     st.write('DTraceMallocs:\n')
     st.write(f'malloc count outstanding: {len(dtm):12,d}\n')
     st.write(f' Total bytes outstanding: {dtm.total_bytes_outstanding:12,d}\n')
-    st.write(f'   Max bytes outstanding: {dtm.max_bytes_outstanding:12,d}\n')
+    st.write(
+        f'   Max bytes outstanding: {dtm.max_bytes_outstanding:12,d}'
+        f' at line {dtm.max_bytes_outstanding_log_line:,d}\n'
+    )
     st.write(f"    Total bytes malloc'd: {dtm.total_bytes_malloced:12,d}\n")
     st.write(f"      Total bytes free'd: {dtm.total_bytes_freed:12,d}\n")
     st.write(f"          Maximum malloc: {dtm.max_malloc:12,d}\n")
-    st.write(f'         Max allocations: {dtm.max_allocations:12,d}\n')
+    st.write(
+        f'         Max allocations: {dtm.max_allocations:12,d}'
+        f' at line {dtm.max_allocations_log_line:,d}\n'
+    )
     st.write(f'           Count mallocs: {dtm.count_mallocs:12,d}\n')
     st.write(f'    Count frees non-null: {dtm.count_frees_non_null:12,d}\n')
     st.write(f'        Count frees null: {dtm.count_frees_null:12,d}\n')
     st.write(dtm.str_failures() + '\n')
 
 
+def pprint_size_histogram(dtm: DTraceMallocs, st=sys.stdout) -> None:
+    """Write the log2 size class histogram of malloc calls."""
+    st.write('Malloc size histogram:\n')
+    st.write(f'{"Size from":>12} {"Size to":>12} {"Count":>12} {"Bytes":>16} {"Count%":>7}\n')
+    for size_class, count in enumerate(dtm.size_class_count):
+        if count:
+            size_from, size_to = dtm.size_class_range(size_class)
+            st.write(
+                f'{size_from:12,d} {size_to:12,d} {count:12,d} {dtm.size_class_bytes[size_class]:16,d}'
+                f' {count / dtm.count_mallocs:7.1%}\n'
+            )
+
+
+def pprint_sites(dtm: DTraceMallocs, top_n: int, st=sys.stdout) -> None:
+    """Write the top_n call sites, combining processes, sorted by bytes outstanding."""
+    summaries = dtm.by_site()
+    st.write(f'Call sites by bytes outstanding [{min(top_n, len(summaries))} of {len(summaries)}]:\n')
+    st.write(f'{"Outstanding":>12} {"Bytes":>14} {"Mallocs":>12} {"Bytes":>14} Site\n')
+    for summary in summaries[:top_n]:
+        st.write(
+            f'{summary.count_outstanding:12,d} {summary.bytes_outstanding:14,d}'
+            f' {summary.count_mallocs:12,d} {summary.bytes_malloced:14,d}'
+            f' {summary.file}:{summary.line} {summary.function}\n'
+        )
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(
         prog='dtrace_log_analyse.py',
@@ -295,6 +562,15 @@ def main() -> int:
                         help="Log Level (debug=10, info=20, warning=30, error=40, critical=50)"
                              " [default: %(default)s]"
                         )
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of processes to parse the log with. [default: %(default)s]"
+                        )
+    parser.add_argument("--histogram", action="store_true",
+                        help="Write a log2 size class histogram of the malloc calls. [default: %(default)s]"
+                        )
+    parser.add_argument("--sites", type=int, default=0,
+                        help="Write this many call sites sorted by bytes outstanding. [default: %(default)s]"
+                        )
     parser.add_argument('path_in', type=str, help='Input path to the DTrace log.', nargs='?')
     args = parser.parse_args()
     logging.basicConfig(
@@ -304,8 +580,12 @@ def main() -> int:
         stream=sys.stdout,
     )
     time_start = time.perf_counter()
-    result = read_dtrace_log(args.path_in)
+    result = read_dtrace_log(args.path_in, args.jobs)
     pprint_mallocs(result)
+    if args.histogram:
+        pprint_size_histogram(result)
+    if args.sites:
+        pprint_sites(result, args.sites)
     print(f'Process time: {time.perf_counter() - time_start:.3f} (s)')
     return 0
 
@@ -55,19 +55,21 @@ def create_gnuplot_dat(table: typing.Sequence[typing.Sequence[typing.Any]]) -> s
     return '\n'.join(result)
 
 
-def invoke_gnuplot(path: str, name: str, table: typing.Sequence[typing.Sequence[typing.Any]], plt: str) -> int:
+def write_gnuplot_dat(path: str, name: str, table: typing.Sequence[typing.Sequence[typing.Any]]) -> None:
+    """Write the table of values to the data file ``{path}/{name}.dat``."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, f'{name}.dat'), 'w') as outfile:
+        outfile.write(create_gnuplot_dat(table))
+
+
+def invoke_gnuplot_plt(path: str, name: str, plt: str) -> int:
     """
-    Create the plot for name.
-    path - the directory to write the data and plot files to.
-    name - the name of those files.
-    table - the table of values to write to the data file.
+    Create the plot for name where the data file ``{path}/{name}.dat`` has already been written.
+    path - the directory to write the plot file to.
+    name - the name of the files.
 
     Returns the gnuplot error code.
     """
-    logger.info('Writing gnuplot data "{}" in path {}'.format(name, path))
-    os.makedirs(path, exist_ok=True)
-    with open(os.path.join(path, f'{name}.dat'), 'w') as outfile:
-        outfile.write(create_gnuplot_dat(table))
     with open(os.path.join(path, f'{name}.plt'), 'w') as outfile:
         outfile.write(plt)
     proc = subprocess.Popen(
@@ -88,6 +90,20 @@ def invoke_gnuplot(path: str, name: str, table: typing.Sequence[typing.Sequence[
     return proc.returncode
 
 
+def invoke_gnuplot(path: str, name: str, table: typing.Sequence[typing.Sequence[typing.Any]], plt: str) -> int:
+    """
+    Create the plot for name.
+    path - the directory to write the data and plot files to.
+    name - the name of those files.
+    table - the table of values to write to the data file.
+
+    Returns the gnuplot error code.
+    """
+    logger.info('Writing gnuplot data "{}" in path {}'.format(name, path))
+    write_gnuplot_dat(path, name, table)
+    return invoke_gnuplot_plt(path, name, plt)
+
+
 def write_test_file(path: str, typ: str) -> int:
     """Writes out a Gnuplot test file."""
     test_stdin = '\n'.join(
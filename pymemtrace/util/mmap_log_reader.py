@@ -0,0 +1,361 @@
+"""
+A memory mapped, zero-copy, reader for the ASCII log files written by ``cPyMemTrace``.
+
+Both the Profile/Trace and the Reference Tracing log files are written with fixed width, space padded, columns.
+For example the ``printf`` format for a Profile/Trace line is (with ``PY_MEM_TRACE_WRITE_OUTPUT_CLOCK`` defined):
+
+.. code-block:: c
+
+    "%-12zu +%-6ld %-12.6f %-8s %-80s %4d %-32s %12zu %12ld"
+
+And for a Reference Tracing line:
+
+.. code-block:: c
+
+    " %12.6f %16p %16ld %-32s %-80s %4d %-40s %16zd %16ld"
+
+This module ``mmap`` s the log file and slices columns by byte offset using ``memoryview`` so that nothing is copied
+or decoded until a row has passed any filter.
+Filtering is done by searching the mapped file for the space padded value in C (``mmap.find()``) so, for a selective
+filter such as a particular file or type, reading a very large log file is bound by I/O rather than by Python per-line
+overhead.
+
+Rows where a value has overflowed its column width (for example a file path longer than 80 characters) are not at the
+expected length and are parsed by splitting on whitespace instead, these are counted in
+:py:attr:`MMapLogReader.count_irregular_lines`.
+
+Example:
+
+.. code-block:: python
+
+    from pymemtrace.util import mmap_log_reader
+
+    with mmap_log_reader.MMapLogReader('20260227_122119_14_50260_O_0_PY3.13.2.log') as reader:
+        for record in reader.records(row_types=('NEW:',), column_values={'Type': 'bytes'}):
+            print(record['Address'], record['File'], record['Line'])
+
+"""
+import mmap
+import typing
+
+
+class LogColumn(typing.NamedTuple):
+    """A fixed width column in a log file line."""
+    name: str
+    #: Offset from the start of the line.
+    start: int
+    width: int
+    #: Converts the bytes to a Python object.
+    convert: typing.Callable[[bytes], typing.Any]
+    #: True if the value is left aligned, space padded on the right. Only these columns can be searched for.
+    left_aligned: bool
+
+    @property
+    def stop(self) -> int:
+        return self.start + self.width
+
+
+def _convert_str(value: bytes) -> str:
+    return value.strip().decode('latin-1')
+
+
+def _convert_int(value: bytes) -> int:
+    return int(value)
+
+
+def _convert_hex(value: bytes) -> int:
+    return int(value, 16)
+
+
+def _convert_float(value: bytes) -> float:
+    return float(value)
+
+
+class LogLayout:
+    """Describes the fixed width layout of the data lines in a log file."""
+
+    def __init__(
+            self,
+            name: str,
+            row_types: typing.Tuple[bytes, ...],
+            prefix_width: int,
+            columns: typing.Sequence[typing.Tuple[str, int, typing.Callable[[bytes], typing.Any], bool]],
+    ):
+        """Constructor.
+
+        ``row_types`` are the data line prefixes such as ``b'NEW:'``.
+        ``prefix_width`` is the width of the row type prefix including any trailing space.
+        ``columns`` is a sequence of ``(name, width, convert, left_aligned)``, each column is followed by a single
+        space separator.
+        """
+        self.name = name
+        self.row_types = row_types
+        self.columns: typing.Dict[str, LogColumn] = {}
+        start = prefix_width
+        for column_name, width, convert, left_aligned in columns:
+            self.columns[column_name] = LogColumn(column_name, start, width, convert, left_aligned)
+            start += width + 1
+        # Length excluding the trailing '\n'
+        self.line_length = start - 1
+
+    def __repr__(self):
+        return f'<LogLayout "{self.name}" line length {self.line_length}>'
+
+
+#: Profile/Trace log lines when ``PY_MEM_TRACE_WRITE_OUTPUT_CLOCK`` is defined. The row type is for example
+#: ``'NEXT: '`` and the format is ``"%-12zu +%-6ld %-12.6f %-8s %-80s %4d %-32s %12zu %12ld"``.
+#: The dEvent column includes the leading ``'+'``.
+PROFILE_TRACE_CLOCK_LAYOUT = LogLayout(
+    'Profile/Trace',
+    (b'FRST:', b'NEXT:', b'PREV:', b'LAST:'),
+    6,
+    (
+        ('Event', 12, _convert_int, True),
+        ('dEvent', 7, _convert_int, True),
+        ('Clock', 12, _convert_float, True),
+        ('What', 8, _convert_str, True),
+        ('File', 80, _convert_str, True),
+        ('Line', 4, _convert_int, False),
+        ('Function', 32, _convert_str, True),
+        ('RSS', 12, _convert_int, False),
+        ('dRSS', 12, _convert_int, False),
+    ),
+)
+
+#: Profile/Trace log lines when ``PY_MEM_TRACE_WRITE_OUTPUT_CLOCK`` is not defined. The format is
+#: ``"%-12zu +%-6ld %-8s %-80s %4d %-32s %12zu %12ld"``.
+PROFILE_TRACE_LAYOUT = LogLayout(
+    'Profile/Trace (no clock)',
+    (b'FRST:', b'NEXT:', b'PREV:', b'LAST:'),
+    6,
+    (
+        ('Event', 12, _convert_int, True),
+        ('dEvent', 7, _convert_int, True),
+        ('What', 8, _convert_str, True),
+        ('File', 80, _convert_str, True),
+        ('Line', 4, _convert_int, False),
+        ('Function', 32, _convert_str, True),
+        ('RSS', 12, _convert_int, False),
+        ('dRSS', 12, _convert_int, False),
+    ),
+)
+
+#: Reference Tracing log lines. The row type is for example ``'NEW:'`` and the format is
+#: ``" %12.6f %16p %16ld %-32s %-80s %4d %-40s %16zd %16ld"``.
+REFERENCE_TRACING_LAYOUT = LogLayout(
+    'Reference Tracing',
+    (b'NEW:', b'DEL:'),
+    5,
+    (
+        ('Clock', 12, _convert_float, False),
+        ('Address', 16, _convert_hex, False),
+        ('LiveCnt', 16, _convert_int, False),
+        ('Type', 32, _convert_str, True),
+        ('File', 80, _convert_str, True),
+        ('Line', 4, _convert_int, False),
+        ('Function', 40, _convert_str, True),
+        ('RSS', 16, _convert_int, False),
+        ('dRSS', 16, _convert_int, False),
+    ),
+)
+
+
+def layout_from_header(header: bytes) -> LogLayout:
+    """Given the header line, such as ``b'HDR: Event dEvent Clock What ...'`` return the appropriate layout.
+    May raise a ValueError."""
+    header_columns = header.split()[1:]
+    for layout in (REFERENCE_TRACING_LAYOUT, PROFILE_TRACE_CLOCK_LAYOUT, PROFILE_TRACE_LAYOUT):
+        if [c.encode('ascii') for c in layout.columns] == header_columns:
+            return layout
+    raise ValueError(f'Can not identify log file layout from header {header!r}')
+
+
+class MMapLogReader:
+    """Memory maps a ``cPyMemTrace`` log file and provides filtered records from it."""
+
+    def __init__(self, path: str, layout: typing.Optional[LogLayout] = None):
+        """Constructor. If the layout is not given it is identified from the ``HDR:`` line in the log file.
+        May raise a ValueError if the file is empty or the layout can not be identified."""
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f'Can not memory map empty file {path}')
+        self._view = memoryview(self._mmap)
+        self._data_start = 0
+        header_pos = self._mmap.find(b'\nHDR:')
+        if header_pos != -1:
+            header_pos += 1
+        elif self._mmap[:4] == b'HDR:':
+            header_pos = 0
+        if header_pos != -1:
+            header_end = self._line_end(header_pos)
+            self._data_start = header_end + 1
+            if layout is None:
+                try:
+                    layout = layout_from_header(self._mmap[header_pos:header_end])
+                except ValueError:
+                    self.close()
+                    raise
+        if layout is None:
+            self.close()
+            raise ValueError(f'Can not find the header line in {path}')
+        self.layout = layout
+        self.count_irregular_lines = 0
+
+    def close(self) -> None:
+        """Release the memory map and close the file."""
+        if self._mmap is not None:
+            self._view.release()
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def _line_end(self, pos: int) -> int:
+        """Return the position of the '\\n' that terminates the line containing pos or the file size."""
+        end = self._mmap.find(b'\n', pos)
+        if end == -1:
+            end = len(self._mmap)
+        return end
+
+    def _line_start(self, pos: int) -> int:
+        """Return the start of the line containing pos."""
+        return self._mmap.rfind(b'\n', 0, pos) + 1
+
+    def _irregular_values(self, start: int, end: int) -> typing.Optional[typing.Dict[str, bytes]]:
+        """Split a line that is not of the expected length on whitespace.
+        Returns None if the number of columns is unexpected."""
+        self.count_irregular_lines += 1
+        fields = self._mmap[start:end].split()[1:]
+        if len(fields) != len(self.layout.columns):
+            return None
+        return dict(zip(self.layout.columns, fields))
+
+    def _matches(
+            self,
+            start: int,
+            end: int,
+            row_types: typing.Tuple[bytes, ...],
+            padded_values: typing.Dict[str, bytes],
+    ) -> typing.Tuple[bool, typing.Optional[typing.Dict[str, bytes]]]:
+        """Returns (is_match, irregular_values) for the line. The comparison of regular lines is done on
+        ``memoryview`` slices of the memory map so no copy is made.
+        irregular_values is None for a regular line."""
+        view = self._view
+        if not any(view[start:start + len(row_type)] == row_type for row_type in row_types):
+            return False, None
+        if end - start == self.layout.line_length:
+            for name, padded in padded_values.items():
+                column = self.layout.columns[name]
+                if view[start + column.start:start + column.stop] != padded:
+                    return False, None
+            return True, None
+        values = self._irregular_values(start, end)
+        if values is None:
+            return False, None
+        for name, padded in padded_values.items():
+            if values[name] != padded.rstrip():
+                return False, None
+        return True, values
+
+    def _decode(
+            self, start: int, end: int, irregular_values: typing.Optional[typing.Dict[str, bytes]]
+    ) -> typing.Dict[str, typing.Any]:
+        """Convert the line to a dict of {column_name: value, ...}.
+        This also includes the row type as ``'Row'`` and the byte offset of the line as ``'Offset'``."""
+        ret: typing.Dict[str, typing.Any] = {
+            'Row': self._mmap[start:self._mmap.find(b':', start, end) + 1].decode('ascii'),
+            'Offset': start,
+        }
+        if irregular_values is None:
+            for column in self.layout.columns.values():
+                ret[column.name] = column.convert(self._mmap[start + column.start:start + column.stop])
+        else:
+            for column in self.layout.columns.values():
+                ret[column.name] = column.convert(irregular_values[column.name])
+        return ret
+
+    def _padded_values(self, column_values: typing.Dict[str, str]) -> typing.Dict[str, bytes]:
+        """Convert the column filter values to space padded bytes that match the fixed width column."""
+        ret = {}
+        for name, value in column_values.items():
+            if name not in self.layout.columns:
+                raise KeyError(f'Column "{name}" not in {list(self.layout.columns.keys())}')
+            column = self.layout.columns[name]
+            if not column.left_aligned:
+                raise ValueError(f'Can only filter on left aligned columns, not "{name}"')
+            ret[name] = f'{value:<{column.width}s}'.encode('latin-1')
+        return ret
+
+    def _candidate_lines(
+            self, row_types: typing.Tuple[bytes, ...], padded_values: typing.Dict[str, bytes],
+    ) -> typing.Iterator[typing.Tuple[int, int]]:
+        """Yields (start, end) of the lines that might match. If there is a column filter then the mapped file is
+        searched for the padded value, otherwise each line is visited."""
+        mm = self._mmap
+        pos = self._data_start
+        size = len(mm)
+        if padded_values:
+            # Search for the longest value, it is likely to be the most selective.
+            needle = max(padded_values.values(), key=len)
+            needle = b' ' + needle.rstrip()
+            while pos < size:
+                found = mm.find(needle, pos)
+                if found == -1:
+                    break
+                start = self._line_start(found)
+                end = self._line_end(found)
+                yield start, end
+                pos = end + 1
+        else:
+            while pos < size:
+                end = self._line_end(pos)
+                yield pos, end
+                pos = end + 1
+
+    def records(
+            self,
+            row_types: typing.Sequence[str] = (),
+            column_values: typing.Optional[typing.Dict[str, str]] = None,
+    ) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+        """Yields a dict of {column_name: value, ...} for each data line that matches all the filters.
+
+        ``row_types`` is a sequence of row types such as ``('NEW:',)``, if empty all data rows are considered.
+        ``column_values`` is a dict of ``{column_name: value, ...}`` where the column value must match exactly, for
+        example ``{'File': 'random.py'}``. Only left aligned (string) columns can be filtered on.
+        """
+        if row_types:
+            row_types_bytes = tuple(r.encode('ascii') for r in row_types)
+        else:
+            row_types_bytes = self.layout.row_types
+        padded_values = self._padded_values(column_values or {})
+        for start, end in self._candidate_lines(row_types_bytes, padded_values):
+            is_match, irregular_values = self._matches(start, end, row_types_bytes, padded_values)
+            if is_match:
+                yield self._decode(start, end, irregular_values)
+
+    def count(
+            self,
+            row_types: typing.Sequence[str] = (),
+            column_values: typing.Optional[typing.Dict[str, str]] = None,
+    ) -> int:
+        """Returns the number of data lines that match all the filters without decoding them."""
+        if row_types:
+            row_types_bytes = tuple(r.encode('ascii') for r in row_types)
+        else:
+            row_types_bytes = self.layout.row_types
+        padded_values = self._padded_values(column_values or {})
+        ret = 0
+        for start, end in self._candidate_lines(row_types_bytes, padded_values):
+            if self._matches(start, end, row_types_bytes, padded_values)[0]:
+                ret += 1
+        return ret
@@ -0,0 +1,347 @@
+"""
+Analyses the JSON history written by ``process_tree.py --json``.
+
+The history is streamed one sample at a time with :py:func:`pymemtrace.process_tree.iter_ndjson` so it can be
+arbitrarily long. The whole tree of each sample is walked and, for every process, the minimum, maximum, mean and slope
+(least squares, per second) of every numeric column is accumulated.
+The time axis is the ``process_time`` of the root process which is the same for every process in a sample.
+
+This also reports:
+
+- Processes whose RSS grew monotonically, it never fell between samples and is larger at the end than at the start.
+- Short-lived process churn, processes that came and went and were younger than a given age when last seen.
+
+With ``--gnuplot`` a second pass writes a gnuplot ``.dat`` file for each of the top-N processes by RSS slope using
+:py:mod:`pymemtrace.util.gnuplot`.
+
+For example:
+
+.. code-block:: text
+
+    $ python pymemtrace/util/process_tree_analyse.py tree.json --top 2
+    File path: tree.json
+    Records: 120 Processes: 7 Time: 0.0 to 119.1 (s)
+        PID Name                     Samples   Min RSS   Max RSS  Mean RSS  RSS slope (/s) Monotonic
+      41207 "python"                     120   17.1 MB  212.4 MB  114.2 MB         1.63 MB Yes
+      41210 "python"                     120   12.0 MB   14.2 MB   13.0 MB         0.02 MB No
+    Monotonic RSS growth [1]:
+        41207 "python"                 17.1 MB to 212.4 MB
+    Short lived processes [3]:
+        41380 "sh"                     Age 0.1 (s) Last seen 47.0 (s)
+    8<---- Snip ---->8
+"""
+import argparse
+import dataclasses
+import logging
+import math
+import sys
+import time
+import typing
+
+from pymemtrace import process_tree
+from pymemtrace.util import gnuplot
+
+logger = logging.getLogger(__file__)
+
+#: The column used for growth detection and the top-N.
+RSS_COLUMN = 'RSS'
+#: Keys in a snapshot that are not columns.
+NON_COLUMN_KEYS = ('process_time', 'pid', 'name', 'children')
+#: Processes younger than this many seconds when last seen are short lived.
+DEFAULT_SHORT_LIVED_AGE = 5.0
+#: Default number of growing processes to report and plot.
+DEFAULT_TOP_N = 5
+
+
+def is_available(value: typing.Any) -> bool:
+    """True if the value is a number that is not negative. process_tree writes
+    :py:data:`pymemtrace.process_tree.UNAVAILABLE` for values such as USS that could not be read."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+
+@dataclasses.dataclass
+class ColumnStatistics:
+    """Streaming statistics of one column of one process. The slope is the least squares fit of value against time,
+    the time is offset by the first time to keep the sums well conditioned."""
+    count: int = 0
+    minimum: float = math.inf
+    maximum: float = -math.inf
+    first: float = 0.0
+    last: float = 0.0
+    _t0: float = 0.0
+    _sum_t: float = 0.0
+    _sum_v: float = 0.0
+    _sum_tt: float = 0.0
+    _sum_tv: float = 0.0
+
+    def add(self, t: float, value: float) -> None:
+        """Add a value at time t."""
+        if self.count == 0:
+            self._t0 = t
+            self.first = value
+        self.count += 1
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        self.last = value
+        t -= self._t0
+        self._sum_t += t
+        self._sum_v += value
+        self._sum_tt += t * t
+        self._sum_tv += t * value
+
+    @property
+    def mean(self) -> float:
+        """The mean value, NaN if there are no values."""
+        if self.count == 0:
+            return math.nan
+        return self._sum_v / self.count
+
+    @property
+    def slope(self) -> float:
+        """The rate of change per second, zero if there are less than two values or they are at the same time."""
+        denominator = self.count * self._sum_tt - self._sum_t ** 2
+        if self.count < 2 or denominator <= 0.0:
+            return 0.0
+        return (self.count * self._sum_tv - self._sum_t * self._sum_v) / denominator
+
+
+@dataclasses.dataclass
+class ProcessHistory:
+    """The history of one process. A PID that is reused is a new ProcessHistory."""
+    pid: int
+    name: str
+    # Record numbers, from zero, of the first and last sample of this process.
+    first_record: int
+    last_record: int = -1
+    # Root process times of the first and last sample.
+    first_time: float = 0.0
+    last_time: float = 0.0
+    # The age of this process when last seen.
+    last_process_time: float = 0.0
+    columns: typing.Dict[str, ColumnStatistics] = dataclasses.field(default_factory=dict)
+    rss_decreases: int = 0
+
+    def add(self, record_number: int, t: float, node: typing.Dict[str, typing.Any]) -> None:
+        """Add the sample of this process from the snapshot node at time t.
+        Values that are not available, see :py:data:`pymemtrace.process_tree.UNAVAILABLE`, are ignored."""
+        if self.last_record == -1:
+            self.first_time = t
+        rss = self.columns.get(RSS_COLUMN)
+        if rss is not None and rss.count and is_available(node.get(RSS_COLUMN)) and node[RSS_COLUMN] < rss.last:
+            self.rss_decreases += 1
+        self.last_record = record_number
+        self.last_time = t
+        self.last_process_time = node.get('process_time', 0.0)
+        for key, value in node.items():
+            if key not in NON_COLUMN_KEYS and is_available(value):
+                if key not in self.columns:
+                    self.columns[key] = ColumnStatistics()
+                self.columns[key].add(t, value)
+
+    @property
+    def quoted_name(self) -> str:
+        """The name in double quotes as ``process_tree.py`` writes it."""
+        return f'"{self.name}"'
+
+    @property
+    def rss_slope(self) -> float:
+        """The RSS slope in bytes per second or zero if there is no RSS."""
+        if RSS_COLUMN in self.columns:
+            return self.columns[RSS_COLUMN].slope
+        return 0.0
+
+    def is_rss_monotonic_growth(self, min_samples: int = 3) -> bool:
+        """True if there are at least min_samples of RSS, it never fell and it is larger at the end than the start."""
+        rss = self.columns.get(RSS_COLUMN)
+        if rss is None or rss.count < min_samples:
+            return False
+        return self.rss_decreases == 0 and rss.last > rss.first
+
+
+class HistoryAnalysis:
+    """Accumulates the per process statistics from a stream of snapshots, see :py:meth:`add_record`."""
+
+    def __init__(self):
+        self.record_count = 0
+        self.first_time = math.nan
+        self.last_time = math.nan
+        # Every process seen in the order first seen.
+        self.histories: typing.List[ProcessHistory] = []
+        # {pid : ProcessHistory, ...} of the current, or most recent, process with that PID.
+        self._current: typing.Dict[int, ProcessHistory] = {}
+
+    def add_record(self, record: typing.Dict[str, typing.Any]) -> None:
+        """Add a snapshot dict, as written by :py:meth:`pymemtrace.process_tree.ProcessSnapshot.as_dict`."""
+        t = record.get('process_time', 0.0)
+        if self.record_count == 0:
+            self.first_time = t
+        self.last_time = t
+        stack = [record]
+        while stack:
+            node = stack.pop()
+            stack.extend(reversed(node.get('children', [])))
+            pid = node['pid']
+            history = self._current.get(pid)
+            if history is None or history.last_record < self.record_count - 1 \
+                    or node.get('process_time', 0.0) < history.last_process_time:
+                # New process or the PID has been reused.
+                history = ProcessHistory(pid, node.get('name', ''), self.record_count)
+                self._current[pid] = history
+                self.histories.append(history)
+            history.add(self.record_count, t, node)
+        self.record_count += 1
+
+    def growing(self, top_n: int = DEFAULT_TOP_N) -> typing.List[ProcessHistory]:
+        """The top_n processes with a positive RSS slope, largest first."""
+        ret = sorted((h for h in self.histories if h.rss_slope > 0.0), key=lambda h: h.rss_slope, reverse=True)
+        return ret[:top_n]
+
+    def monotonic_growth(self, min_samples: int = 3) -> typing.List[ProcessHistory]:
+        """The processes whose RSS grew monotonically, see :py:meth:`ProcessHistory.is_rss_monotonic_growth`."""
+        return [h for h in self.histories if h.is_rss_monotonic_growth(min_samples)]
+
+    def short_lived(self, max_age: float = DEFAULT_SHORT_LIVED_AGE) -> typing.List[ProcessHistory]:
+        """The processes that have gone before the last sample and were younger than max_age seconds when last
+        seen."""
+        return [
+            h for h in self.histories
+            if h.last_record < self.record_count - 1 and h.last_process_time < max_age
+        ]
+
+    def long_str_list(self, top_n: int = DEFAULT_TOP_N,
+                      max_age: float = DEFAULT_SHORT_LIVED_AGE) -> typing.List[str]:
+        """Return the analysis as a list of strings suitable for printing."""
+        ret = [
+            f'Records: {self.record_count} Processes: {len(self.histories)}'
+            f' Time: {self.first_time:.1f} to {self.last_time:.1f} (s)'
+        ]
+        ret.append(
+            f'{"PID":>7} {"Name":24} {"Samples":>7} {"Min RSS":>9} {"Max RSS":>9} {"Mean RSS":>9}'
+            f' {"RSS slope (/s)":>15} Monotonic'
+        )
+        for history in self.growing(top_n):
+            rss = history.columns[RSS_COLUMN]
+            ret.append(
+                f'{history.pid:7d} {history.quoted_name:24} {rss.count:7d}'
+                f' {rss.minimum / 1024 ** 2:6.1f} MB {rss.maximum / 1024 ** 2:6.1f} MB {rss.mean / 1024 ** 2:6.1f} MB'
+                f' {rss.slope / 1024 ** 2:12.2f} MB'
+                f' {"Yes" if history.is_rss_monotonic_growth() else "No"}'
+            )
+        monotonic = self.monotonic_growth()
+        ret.append(f'Monotonic RSS growth [{len(monotonic)}]:')
+        for history in monotonic:
+            rss = history.columns[RSS_COLUMN]
+            ret.append(
+                f'  {history.pid:7d} {history.quoted_name:24}'
+                f' {rss.first / 1024 ** 2:.1f} MB to {rss.last / 1024 ** 2:.1f} MB'
+            )
+        short_lived = self.short_lived(max_age)
+        ret.append(f'Short lived processes [{len(short_lived)}]:')
+        for history in short_lived:
+            ret.append(
+                f'  {history.pid:7d} {history.quoted_name:24}'
+                f' Age {history.last_process_time:.1f} (s) Last seen {history.last_time:.1f} (s)'
+            )
+        return ret
+
+
+def analyse(path: str) -> HistoryAnalysis:
+    """Stream the history file and return the analysis."""
+    analysis = HistoryAnalysis()
+    for record in process_tree.iter_ndjson(path):
+        analysis.add_record(record)
+    return analysis
+
+
+def write_gnuplot_dat_files(path: str, analysis: HistoryAnalysis, histories: typing.List[ProcessHistory],
+                            gnuplot_dir: str) -> typing.List[str]:
+    """Makes a second pass over the history file and, for each of the histories, writes ``{gnuplot_dir}/{pid}.dat``
+    with the root process time and each column. Missing or unavailable values are ``NaN``.
+    Returns the names written, without the ``.dat`` suffix."""
+    # {(pid, first_record) : (ProcessHistory, table), ...}
+    tables = {
+        (h.pid, h.first_record): (h, [['#time'] + list(h.columns.keys())]) for h in histories
+    }
+    by_pid: typing.Dict[int, typing.List[ProcessHistory]] = {}
+    for h in histories:
+        by_pid.setdefault(h.pid, []).append(h)
+    for record_number, record in enumerate(process_tree.iter_ndjson(path)):
+        t = record.get('process_time', 0.0)
+        stack = [record]
+        while stack:
+            node = stack.pop()
+            stack.extend(reversed(node.get('children', [])))
+            for history in by_pid.get(node['pid'], []):
+                if history.first_record <= record_number <= history.last_record:
+                    table = tables[(history.pid, history.first_record)][1]
+                    table.append(
+                        [t] + [node[key] if is_available(node.get(key)) else 'NaN' for key in table[0][1:]]
+                    )
+        if record_number >= analysis.record_count - 1:
+            break
+    ret = []
+    for history, table in tables.values():
+        name = f'{history.pid}' if len(by_pid[history.pid]) == 1 else f'{history.pid}_{history.first_record}'
+        gnuplot.write_gnuplot_dat(gnuplot_dir, name, table)
+        ret.append(name)
+    return ret
+
+
+def main() -> int:
+    """Main entry point. Options:
+
+    .. code-block:: text
+
+        usage: process_tree_analyse.py [-h] [--top TOP] [--short-lived SHORT_LIVED] [--gnuplot GNUPLOT] [-l LOG_LEVEL]
+                                       json_path
+
+        Reads the JSON history written by process_tree.py --json and analyses it.
+
+        positional arguments:
+          json_path             Input path to the JSON or NDJSON history.
+
+        options:
+          -h, --help            show this help message and exit
+          --top TOP             Number of growing processes to report and plot. [default: 5]
+          --short-lived SHORT_LIVED
+                                Processes that have gone and were younger than this when last seen are short lived. [default: 5.0]
+          --gnuplot GNUPLOT     Directory to write the gnuplot data of the top growing processes. [default: ""]
+          -l LOG_LEVEL, --log_level LOG_LEVEL
+                                Log Level (debug=10, info=20, warning=30, error=40, critical=50) [default: 20]
+    """
+    parser = argparse.ArgumentParser(
+        prog='process_tree_analyse.py',
+        description="""Reads the JSON history written by process_tree.py --json and analyses it.""",
+    )
+    parser.add_argument('json_path', type=str, help='Input path to the JSON or NDJSON history.')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_N,
+                        help='Number of growing processes to report and plot. [default: %(default)s]')
+    parser.add_argument('--short-lived', type=float, default=DEFAULT_SHORT_LIVED_AGE,
+                        help='Processes that have gone and were younger than this when last seen are short lived.'
+                             ' [default: %(default)s]')
+    parser.add_argument('--gnuplot', type=str, default='',
+                        help='Directory to write the gnuplot data of the top growing processes.'
+                             ' [default: "%(default)s"]')
+    parser.add_argument("-l", "--log_level", type=int, dest="log_level", default=20,
+                        help="Log Level (debug=10, info=20, warning=30, error=40, critical=50)"
+                             " [default: %(default)s]"
+                        )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=args.log_level,
+        format='%(asctime)s - %(filename)s#%(lineno)d - %(levelname)-8s - %(message)s',
+        stream=sys.stdout,
+    )
+    time_start = time.perf_counter()
+    print(f'File path: {args.json_path}')
+    analysis = analyse(args.json_path)
+    print('\n'.join(analysis.long_str_list(args.top, args.short_lived)))
+    if args.gnuplot:
+        names = write_gnuplot_dat_files(args.json_path, analysis, analysis.growing(args.top), args.gnuplot)
+        print(f'Wrote gnuplot data for {len(names)} processes to {args.gnuplot}')
+    print(f'Process time: {time.perf_counter() - time_start:.3f} (s)')
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from pymemtrace import cgroup
+
+MEMORY_STAT = b"""anon 1048576
+file 2097152
+kernel 524288
+kernel_stack 16384
+slab 262144
+sock 0
+"""
+
+MEMORY_EVENTS = b"""low 0
+high 7
+max 2
+oom 1
+oom_kill 1
+"""
+
+
+@pytest.fixture
+def fake_cgroup(tmp_path):
+    """Creates a fake /proc/<pid>/cgroup and a fake cgroup v2 directory."""
+    proc_root = tmp_path / 'proc'
+    (proc_root / '1234').mkdir(parents=True)
+    (proc_root / '1234' / 'cgroup').write_text('0::/system.slice/app.service\n')
+    cgroup_root = tmp_path / 'cgroup'
+    cgroup_dir = cgroup_root / 'system.slice' / 'app.service'
+    cgroup_dir.mkdir(parents=True)
+    (cgroup_dir / 'memory.current').write_text('4194304\n')
+    (cgroup_dir / 'memory.max').write_text('max\n')
+    (cgroup_dir / 'memory.stat').write_bytes(MEMORY_STAT)
+    (cgroup_dir / 'memory.events').write_bytes(MEMORY_EVENTS)
+    return str(proc_root), str(cgroup_root), str(cgroup_dir)
+
+
+def test_cgroup_path_of_pid(fake_cgroup):
+    proc_root, cgroup_root, cgroup_dir = fake_cgroup
+    assert cgroup.cgroup_path_of_pid(1234, proc_root, cgroup_root) == cgroup_dir
+    assert cgroup.cgroup_path_of_pid(5678, proc_root, cgroup_root) is None
+
+
+def test_cgroup_path_of_pid_v1_only(tmp_path):
+    (tmp_path / 'proc' / '1234').mkdir(parents=True)
+    (tmp_path / 'proc' / '1234' / 'cgroup').write_text('4:memory:/user.slice\n')
+    assert cgroup.cgroup_path_of_pid(1234, str(tmp_path / 'proc'), str(tmp_path)) is None
+
+
+def test_parse_flat_keyed():
+    assert cgroup.parse_flat_keyed(MEMORY_EVENTS) == {'low': 0, 'high': 7, 'max': 2, 'oom': 1, 'oom_kill': 1}
+
+
+@pytest.mark.parametrize('content, expected', ((b'4096\n', 4096), (b'max\n', -1)))
+def test_parse_single_value(content, expected):
+    assert cgroup.parse_single_value(content) == expected
+
+
+def test_cgroup_memory_reader(fake_cgroup):
+    _proc_root, _cgroup_root, cgroup_dir = fake_cgroup
+    with cgroup.CGroupMemoryReader(cgroup_dir) as reader:
+        result = reader.read()
+        # Read again
+        assert reader.read() == result
+    assert result == {
+        'current': 4194304,
+        'max': -1,
+        'anon': 1048576,
+        'file': 2097152,
+        'kernel': 524288,
+        'slab': 262144,
+        'events_low': 0,
+        'events_high': 7,
+        'events_max': 2,
+        'events_oom': 1,
+        'events_oom_kill': 1,
+    }
+
+
+def test_cgroup_memory_reader_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        cgroup.CGroupMemoryReader(str(tmp_path))
+
+
+def test_read_cgroup_memory_no_max(fake_cgroup):
+    _proc_root, _cgroup_root, cgroup_dir = fake_cgroup
+    os.remove(os.path.join(cgroup_dir, 'memory.max'))
+    assert cgroup.read_cgroup_memory(cgroup_dir)['max'] == -1
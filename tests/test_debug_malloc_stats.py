@@ -1,23 +1,17 @@
 import pprint
+import threading
+import time
 
 import pytest
 
 from pymemtrace import debug_malloc_stats
 
 
-# TODO: This fails with ``pytest tests/`` with the error:
-# tests/test_debug_malloc_stats.py Fobject address  : 0x106649b40
-# object refcount : 4
-# object type     : 0x10615a248
-# object type name: ValueError
-# object repr     : ValueError('I/O operation on closed file.')
-# lost sys.stderr
-#
-# But succeeds with ``pytest -s tests/``
-#
-# def test_get_debugmallocstats():
-#     result = debug_malloc_stats.get_debugmallocstats()
-#     assert isinstance(result, bytes)
+def test_get_debugmallocstats():
+    result = debug_malloc_stats.get_debugmallocstats()
+    assert isinstance(result, bytes)
+    stats = debug_malloc_stats.SysDebugMallocStats(result)
+    assert len(stats.malloc_stats) > 0
 
 
 @pytest.mark.parametrize(
@@ -562,3 +556,222 @@ def test_diff_debugmallocstats_diff():
         '+1 free 19-sized PyTupleObjects * 176 bytes each =                   +0',
     ]
     assert result == expected
+
+
+def test_debug_malloc_stats_series():
+    series = debug_malloc_stats.DebugMallocStatsSeries(32, capacity=2)
+    a = debug_malloc_stats.SysDebugMallocStats(SYS_DEBUGMALLOCSTATS_EXAMPLE)
+    b = debug_malloc_stats.SysDebugMallocStats(SYS_DEBUGMALLOCSTATS_EXAMPLE_DIFF)
+    series.add(1.0, a)
+    series.add(2.0, b)
+    assert len(series) == 2
+    assert series.times() == [1.0, 2.0]
+    assert series.class_values('num_pools', 0) == [2, 3]
+    assert series.class_values('blocks_in_use', 3) == [19065, 19065]
+    assert series.total_values('narenas') == [18, 19]
+    assert series.total_values('arenas_reclaimed') == [2016, 2015]
+    assert series.fragmentation()[0] == pytest.approx(1.0 - 4310720 / 4718592)
+    # Ring buffer, the oldest is overwritten.
+    series.add(3.0, a)
+    assert len(series) == 2
+    assert series.times() == [2.0, 3.0]
+    assert series.class_values('num_pools', 0) == [3, 2]
+    table = series.totals_table()
+    assert table[0][0] == '#time'
+    assert table[0][-1] == 'fragmentation'
+    assert len(table) == 3
+    table = series.class_table('avail_blocks')
+    assert table[0][:3] == ['#time', '16', '32']
+    assert table[2][:3] == [3.0, 209, 3]
+
+
+def test_debug_malloc_stats_series_raises():
+    with pytest.raises(ValueError):
+        debug_malloc_stats.DebugMallocStatsSeries(32, capacity=0)
+
+
+def test_debug_malloc_stats_series_write_gnuplot(tmp_path):
+    series = debug_malloc_stats.DebugMallocStatsSeries(32)
+    series.add(1.0, debug_malloc_stats.SysDebugMallocStats(SYS_DEBUGMALLOCSTATS_EXAMPLE))
+    assert series.write_gnuplot(str(tmp_path), 'pymalloc', plot=False) == 0
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'pymalloc.dat', 'pymalloc_avail_blocks.dat', 'pymalloc_blocks_in_use.dat', 'pymalloc_num_pools.dat',
+    ]
+
+
+def test_debug_malloc_stats_sampler():
+    with debug_malloc_stats.DebugMallocStatsSampler(interval=0.01) as sampler:
+        time.sleep(0.1)
+    # At least the first and final samples.
+    assert len(sampler.series) >= 2
+    times = sampler.series.times()
+    assert times == sorted(times)
+    assert all(v > 0 for v in sampler.series.total_values('narenas'))
+    assert not sampler.is_alive()
+
+
+def test_debug_malloc_stats_sampler_continues_after_failure(monkeypatch, caplog):
+    calls = []
+    real_sample = debug_malloc_stats.DebugMallocStatsSampler.sample
+
+    def failing_sample(self):
+        calls.append(None)
+        if len(calls) == 1:
+            raise ValueError('Can not find the small block threshold line')
+        real_sample(self)
+
+    monkeypatch.setattr(debug_malloc_stats.DebugMallocStatsSampler, 'sample', failing_sample)
+    with debug_malloc_stats.DebugMallocStatsSampler(interval=0.01) as sampler:
+        while len(calls) < 3:
+            time.sleep(0.01)
+        assert sampler.is_alive()
+    assert len(sampler.series) >= 2
+    assert 'failed to take a sample' in caplog.text
+
+
+def test_debug_malloc_stats_sampler_sample_from_other_threads(monkeypatch):
+    real_series = debug_malloc_stats.DebugMallocStatsSeries
+
+    def slow_series(*args):
+        # Widen the window between checking for and creating the series.
+        time.sleep(0.05)
+        return real_series(*args)
+
+    monkeypatch.setattr(debug_malloc_stats, 'DebugMallocStatsSeries', slow_series)
+    sampler = debug_malloc_stats.DebugMallocStatsSampler()
+    threads = [threading.Thread(target=sampler.sample) for _i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Without serialising each thread creates its own series and all but one sample are lost.
+    assert len(sampler.series) == 4
+    times = sampler.series.times()
+    assert times == sorted(times)
+
+
+def test_debug_malloc_stats_sampler_final_sample_failure(monkeypatch, caplog):
+    sampler = debug_malloc_stats.DebugMallocStatsSampler(interval=0.01)
+
+    def failing_sample(self):
+        raise ValueError('Can not find the small block threshold line')
+
+    monkeypatch.setattr(debug_malloc_stats.DebugMallocStatsSampler, 'sample', failing_sample)
+    # Not started so the only sample is the final one.
+    sampler.stop()
+    assert sampler.series is None
+    assert 'failed to take a sample' in caplog.text
+
+
+@pytest.mark.parametrize(
+    'debug_malloc',
+    (SYS_DEBUGMALLOCSTATS_EXAMPLE, SYS_DEBUGMALLOCSTATS_EXAMPLE_DIFF, debug_malloc_stats.get_debugmallocstats()),
+)
+def test_parse_debugmallocstats_same_as_regex(debug_malloc):
+    result = debug_malloc_stats.parse_debugmallocstats(debug_malloc)
+    expected = debug_malloc_stats.parse_debugmallocstats_regex(debug_malloc)
+    assert result.small_block_threshold == expected.small_block_threshold
+    assert result.size_classes == expected.size_classes
+    assert result.malloc_stats == expected.malloc_stats
+    assert result.type_stats == expected.type_stats
+    assert repr(result.arenas) == repr(expected.arenas)
+    assert repr(result.pools_blocks) == repr(expected.pools_blocks)
+
+
+@pytest.mark.parametrize(
+    'debug_malloc',
+    (
+            b'',
+            b'Some rubbish.\n',
+            # No pools section.
+            SYS_DEBUGMALLOCSTATS_EXAMPLE[:SYS_DEBUGMALLOCSTATS_EXAMPLE.index(b'# bytes in allocated blocks')],
+    ),
+)
+def test_parse_debugmallocstats_raises(debug_malloc):
+    with pytest.raises(ValueError):
+        debug_malloc_stats.parse_debugmallocstats(debug_malloc)
+
+
+@pytest.mark.parametrize(
+    'noise',
+    (
+            b'WARNING: something free of charge',
+            b'x free y * z bytes each = 1',
+            b'   12 free things * 40 bytes each',
+    ),
+)
+def test_parse_debugmallocstats_ignores_noise(noise):
+    debug_malloc = noise + b'\n' + SYS_DEBUGMALLOCSTATS_EXAMPLE + noise + b'\n'
+    result = debug_malloc_stats.parse_debugmallocstats(debug_malloc)
+    expected = debug_malloc_stats.parse_debugmallocstats(SYS_DEBUGMALLOCSTATS_EXAMPLE)
+    assert result.malloc_stats == expected.malloc_stats
+    assert result.type_stats == expected.type_stats
+    assert repr(result.arenas) == repr(expected.arenas)
+    assert repr(result.pools_blocks) == repr(expected.pools_blocks)
+
+
+def test_class_sysdebugmallocstats_type_map():
+    sdms = debug_malloc_stats.SysDebugMallocStats(SYS_DEBUGMALLOCSTATS_EXAMPLE)
+    assert sdms.type_stat(b'PyListObjects') == debug_malloc_stats.DebugTypeStat(23, 'PyListObjects', 40, 920)
+
+
+def test_fragmentation_report():
+    report = debug_malloc_stats.FragmentationReport(
+        debug_malloc_stats.SysDebugMallocStats(SYS_DEBUGMALLOCSTATS_EXAMPLE)
+    )
+    assert report.narenas == 18
+    assert report.arenas_total == 18 * 262144
+    assert report.allocated_bytes == 4310720
+    assert report.utilisation == pytest.approx(4310720 / (18 * 262144))
+    assert len(report.class_waste) == 32
+    assert report.min_arenas == 18
+    assert report.pinned_arenas == 0
+    assert report.returnable_bytes == 0
+    worst = report.worst_classes(1)[0]
+    assert worst.block_class == 4
+    assert worst.waste_bytes == 2240 + 10272 + 10272
+
+
+def test_diff_fragmentation():
+    a = debug_malloc_stats.FragmentationReport(debug_malloc_stats.SysDebugMallocStats(SYS_DEBUGMALLOCSTATS_EXAMPLE))
+    b = debug_malloc_stats.FragmentationReport(
+        debug_malloc_stats.SysDebugMallocStats(SYS_DEBUGMALLOCSTATS_EXAMPLE_DIFF)
+    )
+    result = debug_malloc_stats.diff_fragmentation(a, b)
+    expected = [
+        'Utilisation                        =                -4.8%',
+        '# bytes in arenas                  =             +262,144',
+        '# arenas allocated current         =                   +1',
+        '# arenas pinned                    =                   +1',
+        '# bytes returnable                 =             +262,144',
+        'Size class     0 (   16 bytes) waste =                  +48',
+    ]
+    assert result == expected
+    assert debug_malloc_stats.diff_fragmentation(a, a) == []
+
+
+def test_diff_fragmentation_size_class_freed():
+    a = debug_malloc_stats.FragmentationReport(debug_malloc_stats.SysDebugMallocStats(SYS_DEBUGMALLOCSTATS_EXAMPLE))
+    b = debug_malloc_stats.FragmentationReport(debug_malloc_stats.SysDebugMallocStats(SYS_DEBUGMALLOCSTATS_EXAMPLE))
+    freed = b.class_waste.pop(4)
+    assert freed.block_class == 4
+    assert debug_malloc_stats.diff_fragmentation(a, b) == [
+        f'Size class     4 (   80 bytes) waste = {-freed.waste_bytes:>+20,d}',
+    ]
+    assert debug_malloc_stats.diff_fragmentation(b, a) == [
+        f'Size class     4 (   80 bytes) waste = {freed.waste_bytes:>+20,d}',
+    ]
+
+
+def test_diff_sys_debug_malloc_stats_fragmentation():
+    with debug_malloc_stats.DiffSysDebugMallocStats() as malloc_diff:
+        _list = [' ' * i for i in range(1024)]
+    diff = malloc_diff.diff(fragmentation=True)
+    assert malloc_diff.fragmentation_diff() in diff
+    assert malloc_diff.diff() in diff
+
+
+def test_diff_sys_debug_malloc_stats_fragmentation_raises():
+    malloc_diff = debug_malloc_stats.DiffSysDebugMallocStats()
+    with pytest.raises(RuntimeError):
+        malloc_diff.fragmentation_diff()
@@ -0,0 +1,151 @@
+import gc
+import os
+
+import psutil
+import pytest
+
+from pymemtrace import proc_fs
+
+pytestmark = pytest.mark.skipif(not proc_fs.is_available(), reason='Requires the /proc file system.')
+
+
+@pytest.mark.parametrize(
+    'stat, expected',
+    (
+            (b'1234 (python) S 1 2', [b'S', b'1', b'2']),
+            (b'1234 (a b) S 1 2', [b'S', b'1', b'2']),
+            (b'1234 (a) (b)) R 5 6\n', [b'R', b'5', b'6']),
+    )
+)
+def test_parse_stat(stat, expected):
+    assert proc_fs.parse_stat(stat) == expected
+
+
+def test_proc_reader_memory_info():
+    process = psutil.Process()
+    with proc_fs.ProcReader(os.getpid()) as reader:
+        memory_info = reader.memory_info()
+        expected = process.memory_info()._asdict()
+    assert set(expected.keys()) <= set(memory_info.keys())
+    assert memory_info['vms'] == expected['vms']
+    # RSS can change a little between the two reads
+    assert abs(memory_info['rss'] - expected['rss']) < 1024 ** 2
+    assert memory_info['pfaults'] >= memory_info['pageins'] >= 0
+
+
+def test_proc_reader_cpu_times():
+    process = psutil.Process()
+    with proc_fs.ProcReader(os.getpid()) as reader:
+        memory_info, cpu_times = reader.memory_info_and_cpu_times()
+        expected = process.cpu_times()._asdict()
+    assert set(cpu_times.keys()) == set(expected.keys())
+    assert abs(cpu_times['user'] - expected['user']) < 1.0
+    assert memory_info['rss'] > 0
+
+
+def test_proc_reader_no_process_raises():
+    with pytest.raises(FileNotFoundError):
+        proc_fs.ProcReader(2 ** 22 + 1)
+
+
+@pytest.mark.filterwarnings('error::pytest.PytestUnraisableExceptionWarning')
+def test_proc_reader_no_process_del():
+    with pytest.raises(FileNotFoundError):
+        proc_fs.ProcReader(2 ** 22 + 1)
+    # Make sure that __del__ of the partially constructed object has run.
+    gc.collect()
+
+
+def test_proc_reader_second_open_fails(monkeypatch):
+    real_open = os.open
+    opened = []
+
+    def mock_open(path, flags):
+        if path.endswith('/stat'):
+            raise FileNotFoundError(path)
+        fd = real_open(path, flags)
+        opened.append(fd)
+        return fd
+
+    monkeypatch.setattr(os, 'open', mock_open)
+    with pytest.raises(FileNotFoundError):
+        proc_fs.ProcReader(os.getpid())
+    gc.collect()
+    # The statm fd has been closed once, by __init__.
+    for fd in opened:
+        with pytest.raises(OSError):
+            os.fstat(fd)
+
+
+def test_proc_reader_close_twice():
+    reader = proc_fs.ProcReader(os.getpid())
+    reader.close()
+    reader.close()
+
+
+SMAPS_ROLLUP = b"""555edf025000-7ffe7350f000 ---p 00000000 00:00 0                          [rollup]
+Rss:                1412 kB
+Pss:                 530 kB
+Pss_Anon:            104 kB
+Shared_Clean:       1216 kB
+Shared_Dirty:          0 kB
+Private_Clean:        92 kB
+Private_Dirty:       104 kB
+Anonymous:           104 kB
+Swap:                 16 kB
+SwapPss:               8 kB
+"""
+
+
+def test_parse_smaps_rollup():
+    result = proc_fs.parse_smaps_rollup(SMAPS_ROLLUP)
+    assert result['Rss'] == 1412 * 1024
+    assert result['SwapPss'] == 8 * 1024
+    assert len(result) == 10
+
+
+def test_smaps_rollup_summary():
+    result = proc_fs.smaps_rollup_summary(proc_fs.parse_smaps_rollup(SMAPS_ROLLUP))
+    assert result == {'pss': 530 * 1024, 'uss': 196 * 1024, 'swap': 16 * 1024, 'anonymous': 104 * 1024}
+
+
+def test_smaps_rollup_summary_empty():
+    # A zombie process has an empty smaps_rollup.
+    result = proc_fs.smaps_rollup_summary(proc_fs.parse_smaps_rollup(b''))
+    assert result == {'pss': -1, 'uss': -1, 'swap': -1, 'anonymous': -1}
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/smaps_rollup'), reason='Requires /proc/<pid>/smaps_rollup')
+def test_proc_reader_memory_smaps_rollup_empty(monkeypatch):
+    with proc_fs.ProcReader(os.getpid()) as reader:
+        monkeypatch.setattr(reader, '_pread', lambda fd, size=proc_fs.PROC_READ_SIZE: b'')
+        assert reader.memory_smaps_rollup() == {'pss': -1, 'uss': -1, 'swap': -1, 'anonymous': -1}
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/smaps_rollup'), reason='Requires /proc/<pid>/smaps_rollup')
+def test_read_smaps_rollup():
+    result = proc_fs.read_smaps_rollup(os.getpid())
+    assert set(result.keys()) == {'pss', 'uss', 'swap', 'anonymous'}
+    assert result['pss'] > 0
+    with proc_fs.ProcReader(os.getpid()) as reader:
+        assert reader.memory_smaps_rollup()['pss'] > 0
+        # Read twice
+        assert reader.memory_smaps_rollup()['pss'] > 0
+
+
+def test_scan_ppids():
+    ppids = proc_fs.scan_ppids()
+    assert ppids[os.getpid()] == os.getppid()
+    assert len(ppids) > 1
+
+
+def test_scan_ppids_fake(tmp_path):
+    for pid, ppid, comm in ((1, 0, 'init'), (10, 1, 'a b'), (11, 10, 'c) d'), (12, 10, 'e')):
+        (tmp_path / str(pid)).mkdir()
+        (tmp_path / str(pid) / 'stat').write_text(f'{pid} ({comm}) S {ppid} 1 1 0 -1\n')
+    (tmp_path / 'self').mkdir()
+    # A process that has gone
+    (tmp_path / '13').mkdir()
+    ppids = proc_fs.scan_ppids(str(tmp_path))
+    assert ppids == {1: 0, 10: 1, 11: 10, 12: 10}
+    assert proc_fs.children_map(ppids) == {0: [1], 1: [10], 10: [11, 12]}
@@ -1,13 +1,17 @@
+import asyncio
 import datetime
 import io
 import logging
+import os
 import pprint
 import random
+import threading
 import time
 
 import pytest
 
 
+from pymemtrace import proc_fs
 from pymemtrace import process
 
 
@@ -151,6 +155,48 @@ def test_extract_json_as_table():
     assert rss_max == {24098: 56565760}
 
 
+def test_iter_json():
+    istream = io.StringIO(EXAMPLE_PROCESS_LOG)
+    result = process.iter_json(istream)
+    assert not isinstance(result, list)
+    assert next(result) == EXPECTED_EXAMPLE_PROCESS_LOG[0]
+    assert list(result) == EXPECTED_EXAMPLE_PROCESS_LOG[1:]
+
+
+@pytest.mark.parametrize(
+    'value, expected',
+    (
+            ('2019-10-14 17:44:46.955519', datetime.datetime(2019, 10, 14, 17, 44, 46, 955519)),
+            ('2019-10-14 17:44:46.000000', datetime.datetime(2019, 10, 14, 17, 44, 46, 0)),
+    )
+)
+def test_parse_timestamp(value, expected):
+    assert process.parse_timestamp(value) == expected
+
+
+def test_parse_timestamp_raises():
+    with pytest.raises(ValueError):
+        process.parse_timestamp('2019-10-14T17:44:46')
+
+
+def test_extract_json_as_table_from_iterator():
+    table_list = process.extract_json_as_table(process.extract_json(io.StringIO(EXAMPLE_PROCESS_LOG)))
+    table_iter = process.extract_json_as_table(process.iter_json(io.StringIO(EXAMPLE_PROCESS_LOG)))
+    assert table_iter == table_list
+
+
+def test_write_log_to_stdout(tmp_path, capsys):
+    log_path = tmp_path / 'process.log'
+    log_path.write_text(EXAMPLE_PROCESS_LOG)
+    process.write_log_to_stdout(str(log_path))
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == ' PID: 24098 '.center(75, '-')
+    assert lines[1].startswith('#t(s)')
+    assert lines[2].startswith('0.2              28475392      43974.9')
+    assert lines[-1] == ' PID: 24098 DONE '.center(75, '-')
+    assert len(lines) == 1 + 1 + 6 + 1
+
+
 def create_list_of_strings(num: int, min_size: int, max_size: int, delay: float) -> None:
     """Create a list of strings to exercise the resource usage."""
     l = []
@@ -167,3 +213,472 @@ def test_process_decorator_basic():
     create_list_of_strings(4, 20 * 1024 ** 2, 50 * 1024 ** 2, 0.5)
 
 
+
+
+@pytest.mark.parametrize('backend', ('auto', 'psutil'))
+def test_process_logging_thread_backend(backend):
+    thread = process.ProcessLoggingThread(interval=0.01, backend=backend)
+    data = thread._get_process_data(label='Label')
+    assert thread.backend in ('proc', 'psutil')
+    assert data[process.KEY_PROCESS_ID] == os.getpid()
+    assert data[process.KEY_LABEL] == 'Label'
+    assert data['memory_info']['rss'] > 0
+    assert 'user' in data['cpu_times']
+    assert data[process.KEY_ELAPSED_TIME] > 0.0
+
+
+def test_process_logging_thread_backend_raises():
+    with pytest.raises(ValueError):
+        process.ProcessLoggingThread(backend='foo')
+
+
+def test_process_logging_thread_samples(caplog):
+    with caplog.at_level(logging.INFO):
+        with process.log_process(interval=0.01, log_level=logging.INFO):
+            time.sleep(0.25)
+    json_data = process.extract_json(io.StringIO(caplog.text))
+    # START, STOP and ideally ~25 in between.
+    assert len(json_data) > 5
+    # Can be converted to a table which requires 'pfaults'.
+    table, _t_min, _t_max, _rss_min, _rss_max = process.extract_json_as_table(json_data)
+    assert list(table.keys()) == [os.getpid()]
+
+
+def test_process_data_as_prometheus():
+    records = [
+        {process.KEY_PROCESS_ID: 1, process.KEY_ELAPSED_TIME: 2.0, 'memory_info': {'rss': 100}, 'cpu_times': {}},
+        {process.KEY_PROCESS_ID: 1, process.KEY_ELAPSED_TIME: 3.0, 'memory_info': {'rss': 200}, 'cpu_times': {}},
+        {process.KEY_PROCESS_ID: 2, process.KEY_ELAPSED_TIME: 4.0, 'memory_info': {'rss': 300},
+         'cpu_times': {'user': 0.5}},
+    ]
+    lines = process.process_data_as_prometheus(records).splitlines()
+    assert 'pymemtrace_process_elapsed_time{pid="1"} 3.0' in lines
+    assert 'pymemtrace_process_memory_info_rss{pid="1"} 200' in lines
+    assert 'pymemtrace_process_memory_info_rss{pid="2"} 300' in lines
+    assert 'pymemtrace_process_cpu_times_user{pid="2"} 0.5' in lines
+    assert 'pymemtrace_process_memory_info_rss{pid="1"} 100' not in lines
+
+
+def test_process_data_as_prometheus_unavailable():
+    records = [
+        {process.KEY_PROCESS_ID: 1, process.KEY_ELAPSED_TIME: 2.0, 'memory_info': {'rss': 100, 'uss': -1},
+         'cpu_times': {}},
+    ]
+    text = process.process_data_as_prometheus(records)
+    assert 'pymemtrace_process_memory_info_rss{pid="1"} 100' in text.splitlines()
+    assert 'uss{' not in text
+
+
+def test_process_logging_thread_http_port():
+    with process.log_process(interval=0.01, http_port=0) as process_thread:
+        time.sleep(0.1)
+        body = process_thread.prometheus_exporter.body().decode('utf-8')
+    assert f'pymemtrace_process_memory_info_rss{{pid="{os.getpid()}"}}' in body
+
+
+def test_flight_recorder_ring():
+    recorder = process.FlightRecorder(123, size=4)
+    for i in range(6):
+        recorder.add(1.6e9 + i, float(i), {'rss': 1000 + i, 'pfaults': i}, {'user': i / 10}, 'Six' if i == 5 else None)
+    assert len(recorder) == 4
+    records = recorder.records()
+    assert [r[process.KEY_ELAPSED_TIME] for r in records] == [2.0, 3.0, 4.0, 5.0]
+    assert [r['memory_info']['rss'] for r in records] == [1002, 1003, 1004, 1005]
+    assert records[0]['cpu_times']['user'] == 0.2
+    assert records[0][process.KEY_PROCESS_ID] == 123
+    assert process.KEY_LABEL not in records[0]
+    assert records[-1][process.KEY_LABEL] == 'Six'
+
+
+def test_flight_recorder_raises():
+    with pytest.raises(ValueError):
+        process.FlightRecorder(123, size=0)
+
+
+def test_flight_recorder_dump_is_readable():
+    recorder = process.FlightRecorder(123, size=8)
+    for i in range(1, 4):
+        recorder.add(1.6e9 + i, float(i), {'rss': 1000 + i, 'pfaults': i}, {'user': i / 10})
+    ostream = io.StringIO()
+    assert recorder.dump(ostream) == 3
+    json_data = process.extract_json(io.StringIO(ostream.getvalue()))
+    assert [r['memory_info']['rss'] for r in json_data] == [1001, 1002, 1003]
+    assert isinstance(json_data[0][process.KEY_TIMESTAMP], datetime.datetime)
+    table, _t_min, _t_max, _rss_min, _rss_max = process.extract_json_as_table(json_data)
+    assert len(table[123]) == 4
+
+
+def test_process_logging_thread_flight_recorder(tmp_path, caplog):
+    with caplog.at_level(logging.INFO):
+        with process.log_process(interval=0.01, flight_recorder=True, flight_recorder_size=8,
+                                 flight_recorder_dir=str(tmp_path)) as process_thread:
+            process_thread.add_message_to_queue('Message')
+            time.sleep(0.25)
+            path = process_thread.dump_flight_recorder()
+    # Nothing logged apart from the dump message.
+    assert process.extract_json(io.StringIO(caplog.text)) == []
+    assert os.path.dirname(path) == str(tmp_path)
+    with open(path) as file:
+        json_data = process.extract_json(file)
+    assert len(json_data) == 8
+    assert len(process_thread.flight_recorder) == 8
+
+
+def test_process_sampler_flight_recorder_several_labels_in_one_sample(tmp_path, capsys):
+    sampler = process.ProcessSampler(flight_recorder=True, flight_recorder_dir=str(tmp_path))
+    try:
+        sampler._write_to_log(process.LOGGER_PREFIX_START)
+        for label in ('A', 'B'):
+            sampler.add_message_to_queue(label)
+        sampler._write_to_log(process.LOGGER_PREFIX)
+        path = sampler.dump_flight_recorder()
+    finally:
+        sampler.close()
+    with open(path) as file:
+        json_data = process.extract_json(file)
+    assert [r.get(process.KEY_LABEL) for r in json_data] == [None, 'A', 'B']
+    assert json_data[1][process.KEY_ELAPSED_TIME] == json_data[2][process.KEY_ELAPSED_TIME]
+    process.write_log_to_stdout(path)
+    captured = capsys.readouterr()
+    assert f' PID: {os.getpid()} DONE ' in captured.out
+    assert '# B' in captured.out
+
+
+def test_process_logging_thread_flight_recorder_rss_threshold(tmp_path):
+    with process.log_process(interval=0.01, flight_recorder=True, flight_recorder_size=8,
+                             flight_recorder_dir=str(tmp_path), flight_recorder_rss_threshold=1):
+        time.sleep(0.1)
+    # Dumped only once on first exceeding the threshold.
+    assert len(os.listdir(tmp_path)) == 1
+
+
+@pytest.mark.skipif(not hasattr(process.signal, 'SIGUSR2'), reason='Requires SIGUSR2')
+def test_process_logging_thread_flight_recorder_sigusr2(tmp_path):
+    with process.log_process(interval=0.01, flight_recorder=True, flight_recorder_size=8,
+                             flight_recorder_dir=str(tmp_path)):
+        os.kill(os.getpid(), process.signal.SIGUSR2)
+        time.sleep(0.1)
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_process_logging_thread_no_flight_recorder_raises():
+    thread = process.ProcessLoggingThread()
+    with pytest.raises(ValueError):
+        thread.dump_flight_recorder()
+
+
+def test_rss_alert_raises():
+    with pytest.raises(ValueError):
+        process.RSSAlert('foo', 1.0, print)
+    with pytest.raises(ValueError):
+        process.RSSAlert(process.ALERT_RSS_SLOPE, 1.0, print, window=0.0)
+
+
+def test_rss_alert_limit_with_cooldown():
+    events = []
+    monitor = process.RSSAlertMonitor([process.RSSAlert(process.ALERT_RSS_LIMIT, 1000, events.append, cooldown=5.0)])
+    fired = [len(monitor.update(t, rss, 123)) for t, rss in enumerate([900, 1000, 1100, 900, 1200, 1200, 1200, 1200])]
+    assert fired == [0, 1, 0, 0, 0, 0, 1, 0]
+    assert events[0] == process.RSSAlertEvent(process.ALERT_RSS_LIMIT, 1000, 1000, 1000, 1, 123)
+
+
+def test_rss_alert_growth():
+    events = []
+    monitor = process.RSSAlertMonitor([process.RSSAlert(process.ALERT_RSS_GROWTH, 50.0, events.append)])
+    fired = [len(monitor.update(t, rss, 123)) for t, rss in enumerate([1000, 1200, 1400, 1500, 1600])]
+    assert fired == [0, 0, 0, 1, 0]
+    assert events[0].value == 50.0
+
+
+def test_rss_alert_slope():
+    events = []
+    monitor = process.RSSAlertMonitor(
+        [process.RSSAlert(process.ALERT_RSS_SLOPE, 100.0, events.append, cooldown=0.0, window=2.0)]
+    )
+    # Window not full for the first two samples.
+    fired = [len(monitor.update(t, rss, 123)) for t, rss in enumerate([0, 1000, 1000, 1100, 1200, 1500])]
+    assert fired == [0, 0, 1, 0, 1, 1]
+    assert [e.value for e in events] == [500.0, 100.0, 200.0]
+
+
+def test_rss_alert_callback_raises_is_ignored():
+    def callback(event):
+        raise RuntimeError('Callback failed')
+
+    monitor = process.RSSAlertMonitor([process.RSSAlert(process.ALERT_RSS_LIMIT, 1, callback)])
+    assert len(monitor.update(1.0, 1000, 123)) == 1
+
+
+@pytest.mark.parametrize('flight_recorder', (False, True))
+def test_process_logging_thread_alerts(flight_recorder, tmp_path):
+    events = []
+    alerts = [process.RSSAlert(process.ALERT_RSS_LIMIT, 1, events.append)]
+    with process.log_process(interval=0.01, alerts=alerts, flight_recorder=flight_recorder,
+                             flight_recorder_dir=str(tmp_path)):
+        time.sleep(0.1)
+    # Cooldown is 60s so only one.
+    assert len(events) == 1
+    assert events[0].pid == os.getpid()
+    assert events[0].rss > 0
+
+
+def test_process_sampler_alerts_once_per_sample_with_labels():
+    events = []
+    alerts = [process.RSSAlert(process.ALERT_RSS_LIMIT, 1, events.append, cooldown=0.0)]
+    sampler = process.ProcessSampler(alerts=alerts)
+    try:
+        for label in ('A', 'B', 'C'):
+            sampler.add_message_to_queue(label)
+        sampler._write_to_log(process.LOGGER_PREFIX)
+        assert len(events) == 1
+        sampler._write_to_log(process.LOGGER_PREFIX)
+        assert len(events) == 2
+    finally:
+        sampler.close()
+
+
+def _child_sleep(seconds):
+    time.sleep(seconds)
+
+
+@pytest.mark.parametrize('backend', ('auto', 'psutil'))
+def test_process_logging_thread_include_children(backend, caplog):
+    import multiprocessing
+
+    with caplog.at_level(logging.INFO):
+        with process.log_process(interval=0.05, include_children=True, backend=backend):
+            child = multiprocessing.Process(target=_child_sleep, args=(0.5,))
+            child.start()
+            child.join()
+            # Child has gone now
+            time.sleep(0.2)
+    json_data = process.extract_json(io.StringIO(caplog.text))
+    pids = {record[process.KEY_PROCESS_ID] for record in json_data}
+    assert os.getpid() in pids
+    assert child.pid in pids
+    # psutil on Linux does not provide page faults.
+    if 'pfaults' in json_data[0]['memory_info']:
+        table, _t_min, _t_max, _rss_min, _rss_max = process.extract_json_as_table(json_data)
+        assert os.getpid() in table
+        assert child.pid in table
+    # The last records are only from this process.
+    assert json_data[-1][process.KEY_PROCESS_ID] == os.getpid()
+
+
+def test_binary_sample_writer_and_load(tmp_path):
+    path = str(tmp_path / 'samples.bin')
+    with process.BinarySampleWriter(path) as writer:
+        for i in range(4):
+            writer.write(
+                1_600_000_000_000_000_000 + i * 1_000_000, 123, 1.0 + i,
+                {'rss': 1000 + i, 'vms': 2000 + i, 'pfaults': 10 * i}, {'user': i / 10, 'system': i / 100},
+                'Label' if i == 2 else None,
+            )
+    assert process.is_binary_sample_file(path)
+    samples = process.load_binary_samples(path)
+    assert len(samples) == 4
+    assert set(samples.columns.keys()) == set(process.BINARY_COLUMNS)
+    assert list(samples.columns['rss']) == [1000, 1001, 1002, 1003]
+    assert list(samples.columns['pfaults']) == [0, 10, 20, 30]
+    assert list(samples.columns['elapsed_time']) == [1.0, 2.0, 3.0, 4.0]
+    assert list(samples.columns['label_id']) == [-1, -1, 0, -1]
+    assert samples.labels == ['Label']
+    records = list(samples.records())
+    assert records[2][process.KEY_LABEL] == 'Label'
+    assert records[1]['cpu_times'] == {'user': 0.1, 'system': 0.01}
+    assert records[0][process.KEY_TIMESTAMP] == datetime.datetime.fromtimestamp(1.6e9)
+    table, _t_min, _t_max, _rss_min, _rss_max = process.extract_json_as_table(records)
+    assert len(table[123]) == 5
+
+
+def test_binary_sample_writer_flush_interval(tmp_path):
+    path = str(tmp_path / 'samples.bin')
+    with process.BinarySampleWriter(path, flush_interval=0.0) as writer:
+        writer.write(1, 123, 1.0, {'rss': 1000, 'vms': 2000}, {'user': 0.0, 'system': 0.0}, 'Label')
+        # Readable before close.
+        samples = process.load_binary_samples(path)
+        assert len(samples) == 1
+        assert samples.labels == ['Label']
+        writer.flush_interval = 3600.0
+        writer.write(2, 123, 2.0, {'rss': 1000, 'vms': 2000}, {'user': 0.0, 'system': 0.0})
+        assert len(process.load_binary_samples(path)) == 1
+    assert len(process.load_binary_samples(path)) == 2
+
+
+def test_load_binary_samples_partial_record(tmp_path):
+    path = str(tmp_path / 'samples.bin')
+    with process.BinarySampleWriter(path) as writer:
+        writer.write(1, 123, 1.0, {'rss': 1000, 'vms': 2000}, {'user': 0.0, 'system': 0.0})
+    with open(path, 'ab') as file:
+        file.write(b'\0' * 7)
+    samples = process.load_binary_samples(path)
+    assert len(samples) == 1
+    # No page faults
+    assert samples.columns['pfaults'][0] == -1
+    assert 'pfaults' not in next(samples.records())['memory_info']
+
+
+def test_process_logging_thread_binary_psutil(tmp_path, capsys):
+    path = str(tmp_path / 'samples.bin')
+    with process.log_process(interval=0.01, binary_path=path, backend='psutil'):
+        time.sleep(0.1)
+    process.write_log_to_stdout(path)
+    captured = capsys.readouterr()
+    assert f' PID: {os.getpid()} DONE ' in captured.out
+
+
+def test_extract_json_as_table_no_pfaults(tmp_path):
+    path = str(tmp_path / 'samples.bin')
+    with process.BinarySampleWriter(path) as writer:
+        for i in range(1, 4):
+            writer.write(i * 1_000_000_000, 123, float(i), {'rss': 1000, 'vms': 2000}, {'user': i / 10, 'system': 0.0})
+    records = list(process.load_binary_samples(path).records())
+    assert 'pfaults' not in records[0]['memory_info']
+    table, _t_min, _t_max, _rss_min, _rss_max = process.extract_json_as_table(records)
+    assert len(table[123]) == 4
+
+
+def test_load_binary_samples_raises(tmp_path):
+    path = str(tmp_path / 'samples.log')
+    with open(path, 'w') as file:
+        file.write('Not binary\n')
+    assert not process.is_binary_sample_file(path)
+    with pytest.raises(ValueError):
+        process.load_binary_samples(path)
+
+
+def test_process_logging_thread_binary(tmp_path, caplog, capsys):
+    path = str(tmp_path / 'samples.bin')
+    with caplog.at_level(logging.INFO):
+        with process.log_process(interval=0.01, binary_path=path) as process_thread:
+            process_thread.add_message_to_queue('Message')
+            time.sleep(0.1)
+    assert process.extract_json(io.StringIO(caplog.text)) == []
+    samples = process.load_binary_samples(path)
+    assert len(samples) > 3
+    assert set(samples.columns['pid']) == {os.getpid()}
+    assert samples.labels == ['Message']
+    process.write_log_to_stdout(path)
+    captured = capsys.readouterr()
+    assert f' PID: {os.getpid()} DONE ' in captured.out
+
+
+def test_process_sampler_binary_several_labels_in_one_sample(tmp_path, capsys):
+    path = str(tmp_path / 'samples.bin')
+    sampler = process.ProcessSampler(binary_path=path)
+    try:
+        sampler._write_to_log(process.LOGGER_PREFIX_START)
+        for label in ('A', 'B', 'C'):
+            sampler.add_message_to_queue(label)
+        sampler._write_to_log(process.LOGGER_PREFIX)
+        sampler._write_to_log(process.LOGGER_PREFIX_STOP)
+    finally:
+        sampler.close()
+    samples = process.load_binary_samples(path)
+    assert samples.labels == ['A', 'B', 'C']
+    elapsed_times = list(samples.columns['elapsed_time'])
+    assert elapsed_times[1] == elapsed_times[2] == elapsed_times[3]
+    process.write_log_to_stdout(path)
+    captured = capsys.readouterr()
+    assert f' PID: {os.getpid()} DONE ' in captured.out
+    assert '# C' in captured.out
+
+
+def test_process_logging_thread_binary_and_flight_recorder_raises(tmp_path):
+    with pytest.raises(ValueError):
+        process.ProcessLoggingThread(flight_recorder=True, binary_path=str(tmp_path / 'samples.bin'))
+
+
+@pytest.mark.parametrize('use_executor', (False, True))
+def test_alog_process(use_executor, caplog):
+    async def work():
+        async with process.alog_process(interval=0.01, use_executor=use_executor) as sampler:
+            sampler.add_message_to_queue('Label')
+            await asyncio.sleep(0.1)
+        return sampler
+
+    with caplog.at_level(logging.INFO):
+        sampler = asyncio.run(work())
+    assert not isinstance(sampler, threading.Thread)
+    json_data = process.extract_json(io.StringIO(caplog.text))
+    # START, STOP and some in between.
+    assert len(json_data) > 3
+    assert [r[process.KEY_LABEL] for r in json_data if process.KEY_LABEL in r] == ['Label']
+    assert 'ProcessLoggingThread-JSON-START' in caplog.text
+    assert 'ProcessLoggingThread-JSON-STOP' in caplog.text
+
+
+def test_process_sampler_samples_without_blocking():
+    sampler = process.ProcessSampler(backend='psutil')
+    try:
+        assert not sampler.samples_without_blocking
+    finally:
+        sampler.close()
+    sampler = process.ProcessSampler(backend='proc', include_children=True)
+    try:
+        assert not sampler.samples_without_blocking
+    finally:
+        sampler.close()
+
+
+@pytest.mark.skipif(not proc_fs.is_available(), reason='Needs the /proc file system.')
+@pytest.mark.parametrize(
+    'kwargs, expected_on_loop',
+    (
+            ({'backend': 'proc'}, True),
+            ({'backend': 'psutil'}, False),
+            ({'backend': 'proc', 'include_children': True}, False),
+    ),
+)
+def test_alog_process_executor_when_blocking(kwargs, expected_on_loop):
+    thread_ids = set()
+
+    async def work():
+        async with process.alog_process(interval=0.01, **kwargs) as sampler:
+            write_to_log = sampler._write_to_log
+
+            def recording_write_to_log(prefix):
+                thread_ids.add(threading.get_ident())
+                write_to_log(prefix)
+
+            sampler._write_to_log = recording_write_to_log
+            await asyncio.sleep(0.1)
+
+    asyncio.run(work())
+    assert thread_ids
+    assert (thread_ids == {threading.get_ident()}) == expected_on_loop
+
+
+def test_alog_process_binary(tmp_path):
+    path = str(tmp_path / 'samples.bin')
+
+    async def work():
+        async with process.alog_process(interval=0.01, binary_path=path):
+            await asyncio.sleep(0.1)
+
+    asyncio.run(work())
+    assert len(process.load_binary_samples(path)) > 3
+
+
+@pytest.mark.parametrize('backend', ('auto', 'psutil'))
+def test_process_logging_thread_smaps_rollup(backend):
+    thread = process.ProcessLoggingThread(backend=backend, smaps_rollup=True)
+    memory_info = thread._get_process_data()['memory_info']
+    assert memory_info['uss'] > 0
+    thread.close()
+
+
+def test_process_logging_thread_cgroup(tmp_path, caplog):
+    (tmp_path / 'memory.current').write_text('4194304\n')
+    (tmp_path / 'memory.max').write_text('8388608\n')
+    (tmp_path / 'memory.stat').write_text('anon 1048576\nfile 2097152\n')
+    (tmp_path / 'memory.events').write_text('low 0\nhigh 7\nmax 2\noom 1\noom_kill 1\n')
+    with caplog.at_level(logging.INFO):
+        with process.log_process(interval=0.01, cgroup_memory=str(tmp_path)):
+            time.sleep(0.05)
+    json_data = process.extract_json(io.StringIO(caplog.text))
+    assert json_data[0][process.KEY_CGROUP]['current'] == 4194304
+    assert json_data[0][process.KEY_CGROUP]['max'] == 8388608
+    assert process.cgroup_row(json_data[0])[1:] == [
+        f'{4194304:12d}', f'{1048576:12d}', f'{2097152:12d}', f'{"NaN":>12}', f'{"NaN":>12}', f'{7:8d}', f'{1:8d}',
+    ]
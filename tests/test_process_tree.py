@@ -0,0 +1,403 @@
+import concurrent.futures
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import psutil
+import pytest
+
+from pymemtrace import process_tree
+
+
+def test_get_smaps_rollup():
+    result = process_tree.ProcessTree.get_smaps_rollup(psutil.Process())
+    assert set(result.keys()) == {'pss', 'uss', 'swap', 'anonymous'}
+    assert result['uss'] > 0
+
+
+_SMAPS_ROLLUP_UNAVAILABLE = {
+    'pss': process_tree.UNAVAILABLE, 'uss': process_tree.UNAVAILABLE,
+    'swap': process_tree.UNAVAILABLE, 'anonymous': process_tree.UNAVAILABLE,
+}
+
+
+def test_read_smaps_rollup_empty(monkeypatch):
+    # A zombie may have an empty smaps_rollup.
+    monkeypatch.setattr(process_tree.proc_fs, 'parse_smaps_rollup', lambda smaps_rollup: {})
+    assert process_tree.ProcessTree._read_smaps_rollup(psutil.Process()) == _SMAPS_ROLLUP_UNAVAILABLE
+
+
+def test_read_smaps_rollup_zombie():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    try:
+        proc = psutil.Process(pid)
+        while proc.status() != psutil.STATUS_ZOMBIE:
+            time.sleep(0.01)
+        assert process_tree.ProcessTree._read_smaps_rollup(proc) == _SMAPS_ROLLUP_UNAVAILABLE
+    finally:
+        os.waitpid(pid, 0)
+
+
+def test_read_smaps_rollup_no_such_process(monkeypatch):
+    child = multiprocessing.Process(target=_child_sleep, args=(0.0,))
+    child.start()
+    proc = psutil.Process(child.pid)
+    child.join()
+    # Force the psutil fallback.
+    monkeypatch.setattr(process_tree.proc_fs, 'is_available', lambda: False)
+    assert process_tree.ProcessTree._read_smaps_rollup(proc) == _SMAPS_ROLLUP_UNAVAILABLE
+
+
+@pytest.mark.parametrize(
+    'getter',
+    (
+            process_tree.ProcessTree.get_memory_uss,
+            process_tree.ProcessTree.get_memory_pss,
+            process_tree.ProcessTree.get_memory_swap,
+            process_tree.ProcessTree.get_memory_anonymous,
+    )
+)
+def test_smaps_rollup_getters(getter):
+    assert getter(psutil.Process(os.getpid())) >= -1
+
+
+def test_write_summary_smaps_columns():
+    config = process_tree.WriteSummaryConfig(
+        [
+            process_tree.WriteSummaryColumn(
+                'PSS', process_tree.ProcessTree.get_memory_pss, 1 / 1024 ** 2, 'MB',
+                process_tree.ColumnWidthFormat(8, '8,.1f'), None,
+            ),
+        ],
+        '',
+    )
+    tree = process_tree.ProcessTree(os.getpid())
+    tree.update_children()
+    data = tree._get_data_as_dict_for_json(config)
+    assert data['pid'] == os.getpid()
+    assert data['PSS'] != 0
+
+
+def test_get_cgroup_memory():
+    result = process_tree.ProcessTree.get_cgroup_memory(psutil.Process())
+    if result:
+        assert result['current'] > 0
+        assert process_tree.ProcessTree.get_cgroup_memory_current(psutil.Process()) > 0
+    else:
+        # Not in a cgroup v2 hierarchy with a memory controller.
+        assert process_tree.ProcessTree.get_cgroup_memory_current(psutil.Process()) == -1
+        assert process_tree.ProcessTree.get_cgroup_events_oom_kill(psutil.Process()) == -1
+
+
+def test_get_cgroup_memory_read_once_per_cgroup(monkeypatch):
+    monkeypatch.setattr(process_tree.ProcessTree, '_getter_cache', {})
+    monkeypatch.setattr(process_tree.ProcessTree, '_cgroup_cache', {})
+    monkeypatch.setattr(process_tree.ProcessTree, 'GETTER_CACHE_SECONDS', 3600.0)
+    monkeypatch.setattr(process_tree.cgroup, 'cgroup_path_of_pid', lambda pid: '/sys/fs/cgroup/test')
+    reads = []
+
+    def read_cgroup_memory(path):
+        reads.append(path)
+        return {'current': 1024, 'events_high': 2}
+
+    monkeypatch.setattr(process_tree.cgroup, 'read_cgroup_memory', read_cgroup_memory)
+    procs = [psutil.Process(), psutil.Process(os.getppid())]
+    for proc in procs:
+        assert process_tree.ProcessTree.get_cgroup_memory_current(proc) == 1024
+        assert process_tree.ProcessTree.get_cgroup_events_high(proc) == 2
+    assert reads == ['/sys/fs/cgroup/test']
+
+
+def _child_sleep(seconds):
+    time.sleep(seconds)
+
+
+def test_update_children():
+    children = [multiprocessing.Process(target=_child_sleep, args=(2.0,)) for _i in range(2)]
+    for child in children:
+        child.start()
+    try:
+        tree = process_tree.ProcessTree(os.getpid())
+        tree.update_children()
+        pids = [c.proc.pid for c in tree.children]
+        assert set(child.pid for child in children) <= set(pids)
+        assert pids == sorted(pids)
+        # Existing ProcessTree objects are preserved.
+        first = tree.children[0]
+        tree.update_children()
+        assert tree.children[0] is first
+        # Same as psutil
+        assert pids == sorted(p.pid for p in psutil.Process().children(recursive=False))
+    finally:
+        for child in children:
+            child.terminate()
+            child.join()
+    tree.update_children()
+    assert not set(child.pid for child in children) & set(c.proc.pid for c in tree.children)
+
+
+def test_update_children_from_map():
+    tree = process_tree.ProcessTree(os.getpid())
+    tree.update_children({os.getpid(): [os.getppid()], os.getppid(): []})
+    assert [c.proc.pid for c in tree.children] == [os.getppid()]
+    tree.update_children({})
+    assert tree.children == []
+
+
+def _rss_config(json_file_path=''):
+    return process_tree.WriteSummaryConfig(
+        [
+            process_tree.WriteSummaryColumn(
+                'RSS', process_tree.ProcessTree.get_memory_rss, 1 / 1024 ** 2, 'MB',
+                process_tree.ColumnWidthFormat(8, '8,.1f'), process_tree.ColumnWidthFormat(8, '+8,.1f'),
+            ),
+            process_tree.WriteSummaryColumn(
+                'Thrds', process_tree.ProcessTree.get_num_threads, 1, '',
+                process_tree.ColumnWidthFormat(6, '6,d'), None,
+            ),
+        ],
+        json_file_path,
+    )
+
+
+@pytest.mark.parametrize('max_workers', (0, 4))
+def test_sample(max_workers):
+    children = [multiprocessing.Process(target=_child_sleep, args=(2.0,)) for _i in range(3)]
+    for child in children:
+        child.start()
+    try:
+        tree = process_tree.ProcessTree(os.getpid())
+        tree.update_children()
+        if max_workers:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                snapshot = tree.sample(_rss_config(), executor)
+        else:
+            snapshot = tree.sample(_rss_config())
+    finally:
+        for child in children:
+            child.terminate()
+            child.join()
+    assert snapshot.pid == os.getpid()
+    assert snapshot.values['RSS'] > 0
+    assert list(snapshot.values.keys()) == ['RSS', 'Thrds']
+    assert [c.pid for c in snapshot.children] == [c.proc.pid for c in tree.children]
+    assert set(child.pid for child in children) <= set(c.pid for c in snapshot.children)
+    data = snapshot.as_dict()
+    assert data['pid'] == os.getpid()
+    assert len(data['children']) == len(snapshot.children)
+
+
+def test_snapshot_as_dict_omits_failed_children():
+    snapshot = process_tree.ProcessSnapshot(
+        1, 'a', 1.0, {'RSS': 10},
+        children=[
+            process_tree.ProcessSnapshot(2, 'b', 1.0, {'RSS': 20}),
+            process_tree.ProcessSnapshot(3, 'c', 1.0, {}, access_denied=True),
+            process_tree.ProcessSnapshot(4, 'd', 1.0, {}, no_such_process=True),
+        ]
+    )
+    assert snapshot.as_dict() == {
+        'process_time': 1.0, 'pid': 1, 'name': 'a', 'RSS': 10,
+        'children': [{'process_time': 1.0, 'pid': 2, 'name': 'b', 'RSS': 20, 'children': []}],
+    }
+
+
+def test_write_summary_from_snapshot():
+    tree = process_tree.ProcessTree(os.getpid())
+    snapshot = process_tree.ProcessSnapshot(
+        os.getpid(), 'python', 12.0, {'RSS': 2 * 1024 ** 2, 'Thrds': 3}, access_denied=False,
+    )
+    ostream = io.StringIO()
+    tree.write_summary(0, 0, _rss_config(), '|', ostream, snapshot=snapshot)
+    assert ostream.getvalue().startswith(f'12.0|{os.getpid()}|"python"|2.0|')
+    assert ostream.getvalue().endswith('|3\n')
+
+
+def test_write_summary_access_denied():
+    tree = process_tree.ProcessTree(os.getpid())
+    snapshot = process_tree.ProcessSnapshot(os.getpid(), 'python', 12.0, {'RSS': 2 * 1024 ** 2}, access_denied=True)
+    ostream = io.StringIO()
+    tree.write_summary(0, 0, _rss_config(), '|', ostream, snapshot=snapshot)
+    assert 'ACCESS DENIED' in ostream.getvalue()
+    snapshot = process_tree.ProcessSnapshot(os.getpid(), no_such_process=True)
+    ostream = io.StringIO()
+    tree.write_summary(0, 0, _rss_config(), '|', ostream, snapshot=snapshot)
+    assert ostream.getvalue() == ''
+
+
+def _aggregate_config():
+    config = _rss_config()
+    config.columns[0].aggregate = process_tree.AGGREGATE_SUM
+    config.columns[1].aggregate = process_tree.AGGREGATE_MAX
+    config.subtree_aggregates = True
+    return config
+
+
+def test_snapshot_aggregate():
+    snapshot = process_tree.ProcessSnapshot(
+        1, 'a', 1.0, {'RSS': 10, 'Thrds': 1},
+        children=[
+            process_tree.ProcessSnapshot(
+                2, 'b', 1.0, {'RSS': 20, 'Thrds': 4},
+                children=[process_tree.ProcessSnapshot(5, 'e', 1.0, {'RSS': 40, 'Thrds': 2})],
+            ),
+            process_tree.ProcessSnapshot(3, 'c', 1.0, {}, access_denied=True),
+            process_tree.ProcessSnapshot(4, 'd', 1.0, {'RSS': 80}, no_such_process=True),
+        ]
+    )
+    snapshot.aggregate(_aggregate_config().columns)
+    assert snapshot.aggregates == {'RSS': 70, 'Thrds': 4}
+    assert snapshot.children[0].aggregates == {'RSS': 60, 'Thrds': 4}
+    assert snapshot.children[0].children[0].aggregates == {'RSS': 40, 'Thrds': 2}
+    assert snapshot.children[1].aggregates == {}
+    data = snapshot.as_dict()
+    assert data['\u03a3RSS'] == 70
+    assert data['children'][0]['\u03a3Thrds'] == 4
+
+
+def test_snapshot_aggregate_unavailable():
+    snapshot = process_tree.ProcessSnapshot(
+        1, 'a', 1.0, {'RSS': -1, 'Thrds': 1},
+        children=[
+            process_tree.ProcessSnapshot(2, 'b', 1.0, {'RSS': 100, 'Thrds': -1}),
+            process_tree.ProcessSnapshot(
+                3, 'c', 1.0, {'RSS': -1, 'Thrds': 2},
+                children=[process_tree.ProcessSnapshot(4, 'd', 1.0, {'RSS': -1, 'Thrds': 3})],
+            ),
+        ]
+    )
+    snapshot.aggregate(_aggregate_config().columns)
+    assert snapshot.aggregates == {'RSS': 100, 'Thrds': 3}
+    assert snapshot.children[0].aggregates == {'RSS': 100, 'Thrds': process_tree.UNAVAILABLE}
+    assert snapshot.children[1].aggregates == {'RSS': process_tree.UNAVAILABLE, 'Thrds': 3}
+
+
+def test_sample_subtree_aggregates():
+    child = multiprocessing.Process(target=_child_sleep, args=(2.0,))
+    child.start()
+    try:
+        tree = process_tree.ProcessTree(os.getpid())
+        tree.update_children()
+        snapshot = tree.sample(_aggregate_config())
+    finally:
+        child.terminate()
+        child.join()
+    assert snapshot.aggregates['RSS'] == snapshot.values['RSS'] + sum(c.aggregates['RSS'] for c in snapshot.children)
+    assert snapshot.aggregates['Thrds'] >= snapshot.values['Thrds']
+
+
+def test_write_summary_subtree_aggregates():
+    tree = process_tree.ProcessTree(os.getpid())
+    snapshot = process_tree.ProcessSnapshot(
+        os.getpid(), 'python', 12.0, {'RSS': 2 * 1024 ** 2, 'Thrds': 3},
+        aggregates={'RSS': 6 * 1024 ** 2, 'Thrds': 5},
+    )
+    config = _aggregate_config()
+    ostream = io.StringIO()
+    tree.write_header(config, '|', ostream)
+    assert ostream.getvalue().rstrip('\n').endswith('|RSS(MB)|dRSS(MB)|\u03a3RSS(MB)|Thrds|\u03a3Thrds')
+    ostream = io.StringIO()
+    tree.write_summary(0, 0, config, '|', ostream, snapshot=snapshot)
+    assert ostream.getvalue().startswith(f'12.0|{os.getpid()}|"python"|2.0|')
+    assert ostream.getvalue().endswith('|6.0|3|5\n')
+
+
+def test_snapshot_as_prometheus():
+    snapshot = process_tree.ProcessSnapshot(
+        1, 'a', 1.0, {'RSS': 10, 'Thrds': 1},
+        children=[
+            process_tree.ProcessSnapshot(2, 'b', 2.0, {'RSS': 20, 'Thrds': 4}),
+            process_tree.ProcessSnapshot(3, 'c', 1.0, {}, no_such_process=True),
+        ]
+    )
+    config = _aggregate_config()
+    snapshot.aggregate(config.columns)
+    lines = process_tree.snapshot_as_prometheus(snapshot, config).splitlines()
+    assert '# TYPE pymemtrace_process_tree_rss gauge' in lines
+    assert 'pymemtrace_process_tree_rss{pid="1",name="a",depth="0"} 10' in lines
+    assert 'pymemtrace_process_tree_rss{pid="2",name="b",depth="1"} 20' in lines
+    assert 'pymemtrace_process_tree_rss_subtree{pid="1",name="a",depth="0"} 30' in lines
+    assert 'pymemtrace_process_tree_thrds_subtree{pid="1",name="a",depth="0"} 4' in lines
+    assert 'pymemtrace_process_tree_process_time_seconds{pid="2",name="b",depth="1"} 2.0' in lines
+    assert not any('pid="3"' in line for line in lines)
+
+
+def test_snapshot_as_prometheus_unavailable():
+    snapshot = process_tree.ProcessSnapshot(
+        1, 'a', 1.0, {'RSS': -1, 'Thrds': 1},
+        children=[process_tree.ProcessSnapshot(2, 'b', 2.0, {'RSS': 20, 'Thrds': 4})],
+    )
+    config = _aggregate_config()
+    snapshot.aggregate(config.columns)
+    lines = process_tree.snapshot_as_prometheus(snapshot, config).splitlines()
+    assert not any(line.startswith('pymemtrace_process_tree_rss{pid="1"') for line in lines)
+    assert 'pymemtrace_process_tree_rss{pid="2",name="b",depth="1"} 20' in lines
+    assert 'pymemtrace_process_tree_rss_subtree{pid="1",name="a",depth="0"} 20' in lines
+
+
+def test_log_process_max_workers(tmp_path):
+    child = multiprocessing.Process(target=_child_sleep, args=(0.5,))
+    child.start()
+    ostream = io.StringIO()
+    json_path = str(tmp_path / 'out.json')
+    result = []
+    # The child must be reaped by this thread for log_process() to see that it has finished.
+    thread = threading.Thread(
+        target=lambda: result.append(
+            process_tree.log_process(child.pid, 0.1, False, _rss_config(json_path), '', ostream, max_workers=2)
+        )
+    )
+    thread.start()
+    child.join()
+    thread.join(timeout=10.0)
+    assert result == [0]
+    assert ostream.getvalue().count(str(child.pid)) > 2
+    data = list(process_tree.iter_ndjson(json_path))
+    assert len(data) > 2
+    assert data[0]['pid'] == child.pid
+    with open(json_path) as file:
+        assert len(file.readlines()) == len(data)
+
+
+def _snapshot(pid):
+    return process_tree.ProcessSnapshot(
+        pid, 'a', 1.0, {'RSS': 10}, children=[process_tree.ProcessSnapshot(pid + 1, 'b', 1.0, {'RSS': 20})],
+    )
+
+
+def test_snapshot_ndjson_writer(tmp_path):
+    path = str(tmp_path / 'out.ndjson')
+    with process_tree.SnapshotNDJSONWriter(path, flush_interval=0.0) as writer:
+        writer.write(_snapshot(1))
+        # Flushed
+        with open(path) as file:
+            assert file.read().count('\n') == 1
+        writer.write(_snapshot(10))
+    with open(path) as file:
+        lines = file.readlines()
+    assert len(lines) == 2
+    # Compact
+    assert ' ' not in lines[0]
+    result = list(process_tree.iter_ndjson(path))
+    assert result == [_snapshot(1).as_dict(), _snapshot(10).as_dict()]
+
+
+def test_iter_ndjson_legacy_json_list(tmp_path):
+    path = str(tmp_path / 'out.json')
+    with open(path, 'w') as file:
+        file.write('\n[\n' + json.dumps(_snapshot(1).as_dict(), indent=2) + ',\n'
+                   + json.dumps(_snapshot(10).as_dict(), indent=2) + '\n]\n')
+    assert [d['pid'] for d in process_tree.iter_ndjson(path)] == [1, 10]
+
+
+def test_write_summary_json_appends_ndjson(tmp_path):
+    path = str(tmp_path / 'out.ndjson')
+    tree = process_tree.ProcessTree(os.getpid())
+    for record_number in range(2):
+        tree.write_summary(0, record_number, _rss_config(path), '|', io.StringIO())
+    assert [d['pid'] for d in process_tree.iter_ndjson(path)] == [os.getpid(), os.getpid()]
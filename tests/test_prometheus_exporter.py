@@ -0,0 +1,50 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from pymemtrace import prometheus_exporter
+
+
+@pytest.mark.parametrize(
+    'parts, expected',
+    (
+            (('pymemtrace', 'process_tree', 'RSS'), 'pymemtrace_process_tree_rss'),
+            (('pymemtrace', 'process', 'memory_info', 'rss'), 'pymemtrace_process_memory_info_rss'),
+            (('a', 'b-c.d'), 'a_b_c_d'),
+            (('a', '', 'b'), 'a_b'),
+            (('1a',), '_1a'),
+    )
+)
+def test_metric_name(parts, expected):
+    assert prometheus_exporter.metric_name(*parts) == expected
+
+
+def test_format_labels():
+    assert prometheus_exporter.format_labels({}) == ''
+    assert prometheus_exporter.format_labels(
+        {'pid': 1, 'name': 'a "b"\\c\n'}
+    ) == '{pid="1",name="a \\"b\\"\\\\c\\n"}'
+
+
+def test_format_gauges():
+    text = prometheus_exporter.format_gauges(
+        {
+            'x_rss': ('RSS.', [({'pid': 1}, 1024), ({'pid': 2}, 2.5), ({'pid': 3}, 'running'), ({'pid': 4}, True)]),
+        }
+    )
+    assert text == '# HELP x_rss RSS.\n# TYPE x_rss gauge\nx_rss{pid="1"} 1024\nx_rss{pid="2"} 2.5\n'
+
+
+def test_exporter_serves_latest():
+    with prometheus_exporter.PrometheusExporter(0, host='127.0.0.1') as exporter:
+        url = f'http://127.0.0.1:{exporter.port}/metrics'
+        with urllib.request.urlopen(url) as response:
+            assert response.read() == b''
+        exporter.update('a 1\n')
+        exporter.update('a 2\n')
+        with urllib.request.urlopen(url) as response:
+            assert response.headers['Content-Type'] == prometheus_exporter.CONTENT_TYPE
+            assert response.read() == b'a 2\n'
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'http://127.0.0.1:{exporter.port}/other')
@@ -0,0 +1,57 @@
+import ctypes
+import io
+import os
+import sys
+
+import pytest
+
+from pymemtrace import redirect_stdout
+
+METHODS = [m for m in redirect_stdout.CAPTURE_METHODS if m != 'memfd' or hasattr(os, 'memfd_create')]
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_stderr_capture_fd(method):
+    stream = io.BytesIO()
+    with redirect_stdout.stderr_capture(stream, method):
+        os.write(redirect_stdout.STDERR_FILENO, b'Foo\n')
+    assert stream.getvalue() == b'Foo\n'
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_stderr_capture_c(method):
+    libc = ctypes.CDLL(None)
+    stream = io.BytesIO()
+    with redirect_stdout.stderr_capture(stream, method):
+        libc.fprintf(redirect_stdout.c_stderr, b'This comes from C\n')
+    assert stream.getvalue() == b'This comes from C\n'
+    # sys.stderr is untouched.
+    assert not sys.stderr.closed
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_stderr_capture_large(method):
+    # Larger than a pipe buffer.
+    data = b'0123456789abcdef' * 64 * 1024
+    stream = io.BytesIO()
+    with redirect_stdout.stderr_capture(stream, method):
+        offset = 0
+        while offset < len(data):
+            offset += os.write(redirect_stdout.STDERR_FILENO, data[offset:])
+    assert stream.getvalue() == data
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_stderr_capture_restores_fd(method):
+    before = os.fstat(redirect_stdout.STDERR_FILENO)
+    with pytest.raises(KeyError):
+        with redirect_stdout.stderr_capture(io.BytesIO(), method):
+            raise KeyError()
+    after = os.fstat(redirect_stdout.STDERR_FILENO)
+    assert (before.st_dev, before.st_ino) == (after.st_dev, after.st_ino)
+
+
+def test_fd_capture_raises():
+    with pytest.raises(ValueError):
+        with redirect_stdout.fd_capture(io.BytesIO(), redirect_stdout.STDERR_FILENO, method='foo'):
+            pass
@@ -1,3 +1,8 @@
+import logging
+import threading
+import time
+import tracemalloc
+
 import pytest
 
 from pymemtrace import trace_malloc
@@ -20,5 +25,165 @@ def test_trace_malloc_simple():
     assert len(tm.statistics) > 3
 
 
+def test_trace_malloc_raises():
+    with pytest.raises(ValueError):
+        trace_malloc.TraceMalloc('foo')
+    with pytest.raises(ValueError):
+        trace_malloc.TraceMalloc(top_n=0)
+
+
+def test_compare_statistics_same_as_compare_to():
+    tracemalloc.start()
+    snapshot_start = tracemalloc.take_snapshot()
+    list_of_strings = [' ' * i for i in range(256)]
+    snapshot_finish = tracemalloc.take_snapshot()
+    expected = snapshot_finish.compare_to(snapshot_start, 'lineno')
+    group_start = trace_malloc.group_statistics(snapshot_start, 'lineno')
+    group_finish = trace_malloc.group_statistics(snapshot_finish, 'lineno')
+    assert trace_malloc.compare_statistics(group_start, group_finish) == expected
+    assert trace_malloc.compare_statistics(group_start, group_finish, 4) == expected[:4]
+    # The cached start statistics are not modified.
+    assert group_start == trace_malloc.group_statistics(snapshot_start, 'lineno')
+
+
+def test_trace_malloc_filters():
+    list_of_strings = []
+    with trace_malloc.TraceMalloc('filename', filters=[trace_malloc.TRACEMALLOC_FILTER]) as tm:
+        list_of_strings.append(' ' * 1024)
+    assert len(tm.statistics) > 0
+    assert all(s.traceback[0].filename != tracemalloc.__file__ for s in tm.statistics)
+    assert len(tm.statistics) == len(tm.net_statistics())
+
+
+def test_trace_malloc_filters_this_file():
+    list_of_strings = []
+    with trace_malloc.TraceMalloc('lineno', filters=[tracemalloc.Filter(True, __file__)]) as tm:
+        list_of_strings.append(' ' * 1024 ** 2)
+    assert all(s.traceback[0].filename == __file__ for s in tm.statistics)
+    assert tm.statistics[0].size_diff >= 1024 ** 2
+
+
+def test_trace_malloc_domain():
+    with trace_malloc.TraceMalloc('lineno', domain=12345) as tm:
+        _list = [' ' * 1024]
+    # No allocations in that domain.
+    assert tm.statistics == []
+    assert len(tm.tracemalloc_snapshot_start.traces) == 0
+
+
+def test_trace_malloc_domain_and_filters():
+    list_of_strings = []
+    # The domain narrows the filters, it is not ORed with them.
+    with trace_malloc.TraceMalloc(
+            'lineno', filters=[tracemalloc.Filter(True, '/nonexistent/*')], domain=0
+    ) as tm:
+        list_of_strings.append(' ' * 1024)
+    assert len(tm.tracemalloc_snapshot_start.traces) == 0
+    assert tm.statistics == []
+    with trace_malloc.TraceMalloc('lineno', filters=[tracemalloc.Filter(True, __file__)], domain=0) as tm:
+        list_of_strings.append(' ' * 1024 ** 2)
+    assert len(tm.statistics) > 0
+    assert all(s.traceback[0].filename == __file__ for s in tm.statistics)
+
+
+def test_trace_malloc_top_n():
+    list_of_strings = []
+    with trace_malloc.TraceMalloc('lineno', top_n=2) as tm:
+        list_of_strings.append(' ' * 1024 ** 2)
+    assert len(tm.statistics) == 2
+    assert tm.diff > 1024 ** 2 // 2
+
+
+def test_trace_malloc_deferred():
+    list_of_strings = []
+    with trace_malloc.TraceMalloc('lineno', deferred=True) as tm:
+        list_of_strings.append(' ' * 1024 ** 2)
+    assert tm.statistics == []
+    tm.compare()
+    assert len(tm.statistics) > 0
+    assert tm.diff > 1024 ** 2 // 2
+
+
+def test_trace_malloc_deferred_raises():
+    tm = trace_malloc.TraceMalloc(deferred=True)
+    with pytest.raises(RuntimeError):
+        tm.compare()
+
+
+@pytest.mark.parametrize('use_process', (False, True))
+def test_trace_malloc_log_asynchronous(caplog, use_process):
+    with trace_malloc.TraceMallocWorker(use_process=use_process) as worker:
+        @trace_malloc.trace_malloc_log(logging.WARNING, asynchronous=True, worker=worker)
+        def function():
+            return [' ' * 1024 ** 2]
+
+        assert len(function()) == 1
+        worker.wait()
+    assert worker.submitted == 1
+    assert worker.dropped == 0
+    assert 'TraceMalloc memory delta: ' in caplog.text
+    assert 'for "function()"' in caplog.text
+
+
+class _BlockingTraceMalloc(trace_malloc.TraceMalloc):
+    """Blocks the worker in compare() until the event is set."""
+    def __init__(self, event):
+        super().__init__(deferred=True)
+        self.event = event
+
+    def compare(self):
+        self.event.wait()
+        super().compare()
+
+
+def test_trace_malloc_worker_drops(caplog):
+    caplog.set_level(logging.DEBUG)
+    event = threading.Event()
+    with trace_malloc.TraceMallocWorker(maxsize=2) as worker:
+        tm = _BlockingTraceMalloc(event)
+        with tm:
+            pass
+        assert worker.submit(tm, logging.DEBUG, 'function')
+        # Wait for the worker to block on the first item.
+        while worker._queue.qsize():
+            time.sleep(0.001)
+        results = [worker.submit(tm, logging.DEBUG, 'function') for _i in range(4)]
+        event.set()
+        worker.wait()
+    assert results == [True, True, False, False]
+    assert caplog.text.count('dropped the result for "function()"') == 2
+    assert worker.submitted == 3
+    assert worker.dropped == 2
+
+
+def test_trace_malloc_worker_process_not_tracing():
+    with trace_malloc.TraceMallocWorker(use_process=True) as worker:
+        assert worker._executor.submit(tracemalloc.is_tracing).result() is False
+
+
+def test_trace_malloc_worker_concurrent_submit():
+    event = threading.Event()
+    tm = _BlockingTraceMalloc(event)
+    with tm:
+        pass
+    with trace_malloc.TraceMallocWorker(maxsize=4) as worker:
+        threads = [
+            threading.Thread(target=lambda: [worker.submit(tm, logging.DEBUG, 'function') for _i in range(1000)])
+            for _t in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        event.set()
+        worker.wait()
+    assert worker.submitted + worker.dropped == 8000
+
+
+def test_trace_malloc_worker_raises():
+    with pytest.raises(ValueError):
+        trace_malloc.TraceMallocWorker(maxsize=0)
+
+
 if __name__ == '__main__':
     test_trace_malloc_simple()
@@ -151,3 +151,146 @@ def test_read_dtrace_log_file_count_frees_null(dtrace_text, expected):
     file = io.StringIO(dtrace_text)
     result = dtrace_log_analyse.read_dtrace_log_file(file)
     assert result.count_frees_null == expected
+
+
+@pytest.mark.parametrize(
+    'line, expected',
+    (
+            (
+                    ' 77633  cmn_cmd_opts.py:141  -> set_log_level malloc(560) pntr 0x7fca83ef4240\n',
+                    dtrace_log_analyse.DTraceMallocCall(
+                        1, 77633, 'cmn_cmd_opts.py', 141, 'set_log_level', 560, 0x7fca83ef4240
+                    ),
+            ),
+            (
+                    ' 77633       process.py:268  -> _get_process_data free(0x7fca83c00620)\n',
+                    dtrace_log_analyse.DTraceFreeCall(1, 77633, 'process.py', 268, '_get_process_data', 0x7fca83c00620),
+            ),
+            (
+                    ' 77633                 :45   ->  free(0x0)\n',
+                    dtrace_log_analyse.DTraceFreeCall(1, 77633, None, 45, None, 0),
+            ),
+            (
+                    # Falls back to RE_MALLOC_LAST_RESORT
+                    ' 77633 :45 -> malloc(16) pntr 0x7fca83c00620\n',
+                    dtrace_log_analyse.DTraceMallocCall(1, -1, ' 77633 :45 -> ', -1, '', 16, 0x7fca83c00620),
+            ),
+            (
+                    'Something else\n',
+                    None,
+            ),
+    )
+)
+def test_match_line(line, expected):
+    assert dtrace_log_analyse.match_line(line, 1) == expected
+
+
+@pytest.mark.parametrize('chunk_lines', (1, 3, 1024))
+def test_read_dtrace_log_file_parallel(chunk_lines):
+    expected = dtrace_log_analyse.read_dtrace_log_file(io.StringIO(EXAMPLE_DTRACE_LOG_FILE))
+    result = dtrace_log_analyse.read_dtrace_log_file_parallel(
+        io.StringIO(EXAMPLE_DTRACE_LOG_FILE), processes=2, chunk_lines=chunk_lines
+    )
+    assert result.malloc_dict == expected.malloc_dict
+    assert result.count_mallocs == expected.count_mallocs
+    assert result.count_frees_non_null == expected.count_frees_non_null
+    assert result.count_frees_null == expected.count_frees_null
+    assert result.max_bytes_outstanding == expected.max_bytes_outstanding
+
+
+@pytest.mark.parametrize(
+    'log_line, site_id, size',
+    (
+            (0, 0, 0),
+            (1, 2, 3),
+            (16_261_386, 2 ** 32 - 1, 2 ** 48 - 1),
+    )
+)
+def test_pack_unpack_malloc(log_line, site_id, size):
+    packed = dtrace_log_analyse.pack_malloc(log_line, site_id, size)
+    assert dtrace_log_analyse.unpack_malloc(packed) == (log_line, site_id, size)
+
+
+@pytest.mark.parametrize(
+    'log_line, site_id, size',
+    (
+            (0, 0, -1),
+            (0, 0, dtrace_log_analyse.PACKED_SIZE_MASK + 1),
+            (0, -1, 0),
+            (0, dtrace_log_analyse.PACKED_SITE_MASK + 1, 0),
+            (-1, 0, 0),
+    )
+)
+def test_pack_malloc_raises(log_line, site_id, size):
+    with pytest.raises(ValueError):
+        dtrace_log_analyse.pack_malloc(log_line, site_id, size)
+
+
+def test_read_dtrace_log_file_outstanding_mallocs():
+    result = dtrace_log_analyse.read_dtrace_log_file(io.StringIO(EXAMPLE_DTRACE_LOG_FILE))
+    assert result.get_malloc(0x7fca83ef4240) == dtrace_log_analyse.DTraceMallocCall(
+        2, 77633, 'cmn_cmd_opts.py', 141, 'set_log_level', 560, 0x7fca83ef4240
+    )
+    outstanding = list(result.outstanding_mallocs())
+    assert len(outstanding) == 7
+    assert sum(m.size for m in outstanding) == result.total_bytes_outstanding
+    # 11 mallocs, the threading.py:870 and process.py:268 calls share sites.
+    assert len(result.sites) == 8
+    with pytest.raises(KeyError):
+        result.get_malloc(0x7fca83c00620)
+
+
+def test_read_dtrace_log_file_size_histogram():
+    result = dtrace_log_analyse.read_dtrace_log_file(io.StringIO(EXAMPLE_DTRACE_LOG_FILE))
+    # 16 is class 5, 25 is class 5, 264 is class 9, 528, 536, 560, 576, 576 are class 10,
+    # 1114 is class 11, 4096 * 2 are class 13.
+    assert result.size_class_count == [0, 0, 0, 0, 0, 2, 0, 0, 0, 1, 5, 1, 0, 2]
+    assert sum(result.size_class_count) == result.count_mallocs
+    assert sum(result.size_class_bytes) == result.total_bytes_malloced
+    assert result.size_class_range(0) == (0, 0)
+    assert result.size_class_range(5) == (16, 31)
+
+
+def test_read_dtrace_log_file_max_log_lines():
+    result = dtrace_log_analyse.read_dtrace_log_file(io.StringIO(EXAMPLE_DTRACE_LOG_FILE))
+    assert result.max_bytes_outstanding_log_line == 14
+    assert result.max_allocations_log_line == 14
+
+
+def test_read_dtrace_log_file_by_site():
+    result = dtrace_log_analyse.read_dtrace_log_file(io.StringIO(EXAMPLE_DTRACE_LOG_FILE))
+    by_site = result.by_site()
+    assert len(by_site) == 8
+    assert sum(s.bytes_outstanding for s in by_site) == result.total_bytes_outstanding
+    assert by_site[0] == dtrace_log_analyse.DTraceSiteSummary(
+        'threading.py', 817, '__init__', 1, 576, 1, 576,
+    )
+    process_site = [s for s in by_site if s.file == 'process.py'][0]
+    assert process_site == dtrace_log_analyse.DTraceSiteSummary(
+        'process.py', 268, '_get_process_data', 3, 4096 + 25 + 4096, 0, 0,
+    )
+
+
+def test_pprint_sites():
+    result = dtrace_log_analyse.read_dtrace_log_file(io.StringIO(EXAMPLE_DTRACE_LOG_FILE))
+    ostream = io.StringIO()
+    dtrace_log_analyse.pprint_sites(result, 2, ostream)
+    dtrace_log_analyse.pprint_size_histogram(result, ostream)
+    lines = ostream.getvalue().splitlines()
+    assert lines[0] == 'Call sites by bytes outstanding [2 of 8]:'
+    assert len(lines) == 1 + 1 + 2 + 1 + 1 + 5
+
+
+def test_pprint_sites_merges_processes():
+    log = """dtrace:::BEGIN
+ 1001     threading.py:817  -> __init__ malloc(576) pntr 0x7fca83ef4470
+ 1002     threading.py:817  -> __init__ malloc(576) pntr 0x7fca83ef46b0
+ 1002     threading.py:870  -> start malloc(16) pntr 0x7fca83d48a30
+"""
+    result = dtrace_log_analyse.read_dtrace_log_file(io.StringIO(log))
+    assert len(result.sites) == 3
+    ostream = io.StringIO()
+    dtrace_log_analyse.pprint_sites(result, 10, ostream)
+    lines = ostream.getvalue().splitlines()
+    assert lines[0] == 'Call sites by bytes outstanding [2 of 2]:'
+    assert len(lines) == 1 + 1 + 2
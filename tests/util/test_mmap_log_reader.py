@@ -0,0 +1,153 @@
+import os
+import tempfile
+
+import pytest
+
+from pymemtrace.util import mmap_log_reader
+
+
+def _ref_trace_line(row_type: str, clock: float, address: int, live_cnt: int, type_name: str, file: str,
+                    line: int, function: str, rss: int, drss: int) -> str:
+    """Mimics the C snprintf() in cPyMemTrace.c"""
+    return row_type + ' %12.6f %16s %16d %-32s %-80s %4d %-40s %16d %16d' % (
+        clock, hex(address), live_cnt, type_name, file, line, function, rss, drss,
+    )
+
+
+def _profile_line(row_type: str, event: int, d_event: int, clock: float, what: str, file: str,
+                  line: int, function: str, rss: int, drss: int) -> str:
+    """Mimics the C snprintf() in cPyMemTrace.c"""
+    return f'{row_type:<6s}' + '%-12d +%-6d %-12.6f %-8s %-80s %4d %-32s %12d %12d' % (
+        event, d_event, clock, what, file, line, function, rss, drss,
+    )
+
+
+REF_TRACE_LINES = [
+    'Message',
+    'SOF',
+    'HDR: %12s %16s %16s %-32s %-80s %4s %-40s %16s %16s' % (
+        "Clock", "Address", "LiveCnt", "Type", "File", "Line", "Function", "RSS", "dRSS"
+    ),
+    _ref_trace_line('NEW:', 0.816183, 0x6000025fde70, 1, 'list', 'test.py', 293, 'make_bytes', 38207488, 0),
+    _ref_trace_line('NEW:', 0.816203, 0x6000025ec6a0, 1, 'range', 'test.py', 294, 'make_bytes', 38207488, 0),
+    _ref_trace_line('NEW:', 0.816590, 0x7fa823903010, 1, 'bytes', 'random.py', 288, '__init__', 38207488, 0),
+    'MSG:     0.816600 # A message with bytes in it.',
+    _ref_trace_line('DEL:', 0.816229, 0x6000025ec6a0, 0, 'range', 'test.py', 294, 'make_bytes', 38207488, 0),
+    _ref_trace_line('NEW:', 0.816300, 0x7fa823903090, 1, 'bytes_iterator', 'test.py', 300, 'f', 38207488, 0),
+    _ref_trace_line('DEL:', 0.818875, 0x7fa823903010, 0, 'bytes', 'test.py', 300, 'make_bytes', 38211584, 4096),
+    # File name overflows the column.
+    _ref_trace_line('NEW:', 0.820073, 0x600003236b30, 1, 'bytes', 'a' * 90 + '.py', 304, 'g', 38211584, 0),
+    'EOF',
+]
+
+
+@pytest.fixture
+def ref_trace_log_path():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'ref_trace.log')
+        with open(path, 'w') as file:
+            file.write('\n'.join(REF_TRACE_LINES) + '\n')
+        yield path
+
+
+def test_layout_line_length():
+    line = _ref_trace_line('NEW:', 0.816183, 0x6000025fde70, 1, 'list', 'test.py', 293, 'make_bytes', 38207488, 0)
+    assert len(line) == mmap_log_reader.REFERENCE_TRACING_LAYOUT.line_length
+    line = _profile_line('NEXT:', 1, 1, 3.090202, 'LINE', 'test.py', 266, 'test_trace', 41472000, 4096)
+    assert len(line) == mmap_log_reader.PROFILE_TRACE_CLOCK_LAYOUT.line_length
+
+
+def test_layout_from_header():
+    assert mmap_log_reader.layout_from_header(
+        REF_TRACE_LINES[2].encode('ascii')) is mmap_log_reader.REFERENCE_TRACING_LAYOUT
+    with pytest.raises(ValueError):
+        mmap_log_reader.layout_from_header(b'HDR: Something else')
+
+
+def test_mmap_log_reader_all_records(ref_trace_log_path):
+    with mmap_log_reader.MMapLogReader(ref_trace_log_path) as reader:
+        records = list(reader.records())
+        assert reader.count_irregular_lines == 1
+    assert len(records) == 7
+    assert [r['Row'] for r in records] == ['NEW:', 'NEW:', 'NEW:', 'DEL:', 'NEW:', 'DEL:', 'NEW:']
+    assert records[0]['Clock'] == 0.816183
+    assert records[0]['Address'] == 0x6000025fde70
+    assert records[0]['LiveCnt'] == 1
+    assert records[0]['Type'] == 'list'
+    assert records[0]['File'] == 'test.py'
+    assert records[0]['Line'] == 293
+    assert records[0]['Function'] == 'make_bytes'
+    assert records[0]['RSS'] == 38207488
+    assert records[0]['dRSS'] == 0
+    assert records[-1]['File'] == 'a' * 90 + '.py'
+
+
+@pytest.mark.parametrize(
+    'row_types, column_values, expected',
+    (
+            ((), {}, 7),
+            (('NEW:',), {}, 5),
+            (('DEL:',), {}, 2),
+            ((), {'Type': 'bytes'}, 3),
+            (('NEW:',), {'Type': 'bytes'}, 2),
+            ((), {'File': 'test.py'}, 5),
+            ((), {'File': 'test.py', 'Type': 'bytes'}, 1),
+            ((), {'Type': 'bytes_iterator'}, 1),
+            ((), {'Type': 'dict'}, 0),
+            ((), {'Function': 'make_bytes'}, 4),
+    )
+)
+def test_mmap_log_reader_count(ref_trace_log_path, row_types, column_values, expected):
+    with mmap_log_reader.MMapLogReader(ref_trace_log_path) as reader:
+        assert reader.count(row_types, column_values) == expected
+        assert len(list(reader.records(row_types, column_values))) == expected
+
+
+def test_mmap_log_reader_filter_irregular_line(ref_trace_log_path):
+    with mmap_log_reader.MMapLogReader(ref_trace_log_path) as reader:
+        records = list(reader.records(column_values={'Function': 'g'}))
+    assert len(records) == 1
+    assert records[0]['Address'] == 0x600003236b30
+
+
+def test_mmap_log_reader_filter_raises(ref_trace_log_path):
+    with mmap_log_reader.MMapLogReader(ref_trace_log_path) as reader:
+        with pytest.raises(KeyError):
+            reader.count(column_values={'Foo': 'bar'})
+        with pytest.raises(ValueError):
+            reader.count(column_values={'RSS': '0'})
+
+
+def test_mmap_log_reader_profile():
+    lines = [
+        'SOF',
+        'HDR: %-12s %-6s  %-12s %-8s %-80s %4s %-32s %12s %12s' % (
+            "Event", "dEvent", "Clock", "What", "File", "Line", "Function", "RSS", "dRSS"
+        ),
+        _profile_line('FRST:', 0, 0, 3.090020, 'LINE', 'test.py', 265, 'test_trace', 41463808, 41463808),
+        _profile_line('NEXT:', 1, 1, 3.090202, 'LINE', 'test.py', 266, 'test_trace', 41472000, 4096),
+        'MSG:  2      +1      3.090208     # Level 0 __enter__',
+        _profile_line('NEXT:', 9, 8, 3.090725, 'CALL', 'other.py', 185, 'populate', 42524672, 1052672),
+        'EOF',
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'profile.log')
+        with open(path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        with mmap_log_reader.MMapLogReader(path) as reader:
+            assert reader.layout is mmap_log_reader.PROFILE_TRACE_CLOCK_LAYOUT
+            records = list(reader.records(row_types=('NEXT:',), column_values={'What': 'CALL'}))
+            assert reader.count() == 3
+    assert len(records) == 1
+    assert records[0]['Event'] == 9
+    assert records[0]['dEvent'] == 8
+    assert records[0]['File'] == 'other.py'
+    assert records[0]['RSS'] == 42524672
+
+
+def test_mmap_log_reader_empty_file_raises():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'empty.log')
+        open(path, 'w').close()
+        with pytest.raises(ValueError):
+            mmap_log_reader.MMapLogReader(path)
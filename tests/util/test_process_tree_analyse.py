@@ -0,0 +1,125 @@
+import json
+import math
+import os
+
+import pytest
+
+from pymemtrace.util import process_tree_analyse
+
+MB = 1024 ** 2
+
+
+def _record(t: float, rss_root: int, children: list) -> dict:
+    return {
+        'process_time': t, 'pid': 100, 'name': 'python', 'RSS': rss_root, 'Status': 'running',
+        'children': children,
+    }
+
+
+def _child(pid: int, t: float, rss: int, name: str = 'worker') -> dict:
+    return {'process_time': t, 'pid': pid, 'name': name, 'RSS': rss, 'Status': 'running', 'children': []}
+
+
+def _records() -> list:
+    ret = []
+    for i in range(10):
+        children = [
+            # Grows by 1MB per second.
+            _child(200, 5.0 + i, (10 + i) * MB),
+            # Goes up and down.
+            _child(201, 5.0 + i, (20 + i % 2) * MB),
+        ]
+        if i in (3, 4):
+            # Short lived.
+            children.append(_child(300, 0.5 * (i - 2), 1 * MB, 'sh'))
+        if i == 7:
+            # Reuses PID 300.
+            children.append(_child(300, 0.1, 2 * MB, 'sh'))
+        ret.append(_record(10.0 + i, 50 * MB, children))
+    return ret
+
+
+@pytest.fixture
+def history_path(tmp_path):
+    path = os.path.join(tmp_path, 'history.json')
+    with open(path, 'w') as file:
+        for record in _records():
+            file.write(json.dumps(record) + '\n')
+    return path
+
+
+def test_column_statistics():
+    stats = process_tree_analyse.ColumnStatistics()
+    assert math.isnan(stats.mean)
+    assert stats.slope == 0.0
+    for t, v in ((1e9, 2.0), (1e9 + 1, 4.0), (1e9 + 2, 6.0)):
+        stats.add(t, v)
+    assert stats.count == 3
+    assert stats.minimum == 2.0
+    assert stats.maximum == 6.0
+    assert stats.mean == 4.0
+    assert stats.slope == pytest.approx(2.0)
+    assert (stats.first, stats.last) == (2.0, 6.0)
+
+
+def test_analyse(history_path):
+    analysis = process_tree_analyse.analyse(history_path)
+    assert analysis.record_count == 10
+    assert (analysis.first_time, analysis.last_time) == (10.0, 19.0)
+    assert [(h.pid, h.first_record, h.last_record) for h in analysis.histories] == [
+        (100, 0, 9), (200, 0, 9), (201, 0, 9), (300, 3, 4), (300, 7, 7),
+    ]
+    # String columns are ignored.
+    assert list(analysis.histories[0].columns.keys()) == ['RSS']
+    assert analysis.histories[0].rss_slope == 0.0
+    assert analysis.histories[1].rss_slope == pytest.approx(MB)
+    assert [h.pid for h in analysis.growing()] == [200, 201]
+    assert [h.pid for h in analysis.growing(1)] == [200]
+    assert [h.pid for h in analysis.monotonic_growth()] == [200]
+    assert [(h.pid, h.first_record) for h in analysis.short_lived()] == [(300, 3), (300, 7)]
+    assert analysis.short_lived(0.5) == [analysis.histories[4]]
+    lines = analysis.long_str_list()
+    assert lines[0] == 'Records: 10 Processes: 5 Time: 10.0 to 19.0 (s)'
+    assert 'Monotonic RSS growth [1]:' in lines
+    assert 'Short lived processes [2]:' in lines
+
+
+def test_analyse_legacy_json_list(tmp_path):
+    path = os.path.join(tmp_path, 'history.json')
+    with open(path, 'w') as file:
+        json.dump(_records(), file)
+    analysis = process_tree_analyse.analyse(path)
+    assert analysis.record_count == 10
+    assert len(analysis.histories) == 5
+
+
+def test_write_gnuplot_dat_files(history_path, tmp_path):
+    analysis = process_tree_analyse.analyse(history_path)
+    gnuplot_dir = os.path.join(tmp_path, 'gnuplot')
+    histories = analysis.growing() + analysis.short_lived()
+    names = process_tree_analyse.write_gnuplot_dat_files(history_path, analysis, histories, gnuplot_dir)
+    assert names == ['200', '201', '300_3', '300_7']
+    with open(os.path.join(gnuplot_dir, '200.dat')) as file:
+        rows = [line.split() for line in file.read().splitlines()]
+    assert rows[0] == ['#time', 'RSS']
+    assert len(rows) == 11
+    assert rows[1] == ['10.0', str(10 * MB)]
+    with open(os.path.join(gnuplot_dir, '300_3.dat')) as file:
+        assert len(file.read().splitlines()) == 3
+
+
+def test_analyse_unavailable_column():
+    analysis = process_tree_analyse.HistoryAnalysis()
+    # USS alternates between unavailable (-1) and a constant value.
+    for i in range(6):
+        record = _record(10.0 + i, 50 * MB, [])
+        record['USS'] = -1 if i % 2 else 30 * MB
+        record['PSS'] = -1
+        analysis.add_record(record)
+    history = analysis.histories[0]
+    uss = history.columns['USS']
+    assert uss.count == 3
+    assert uss.minimum == uss.maximum == uss.mean == 30 * MB
+    assert uss.slope == 0.0
+    # Never available.
+    assert 'PSS' not in history.columns